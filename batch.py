@@ -0,0 +1,168 @@
+# validates a directory tree of maps offline with the cached blank tables,
+# e.g. the map archive after a tileset change, one JSON line per file
+# usage: python batch.py [path ...] [--report report.jsonl] [--workers N]
+
+import multiprocessing
+import argparse
+import asyncio
+import time
+import gzip
+import json
+import os
+
+import numpy as np
+
+from src.validator import Tileset, Validator, validate_level_file
+from src.config import Config
+from src.logger import log
+
+
+ACCEPTED_TYPES: tuple[str, ...] = ('.ldtk', '.ldtkl', '.json')
+
+# set once per worker process, tables are sent with the
+# initializer instead of being pickled for every file
+worker_blanks: dict[Tileset, np.ndarray] = {}
+
+
+def init_worker(blank_tables: dict[Tileset, np.ndarray]) -> None:
+    global worker_blanks
+    worker_blanks = blank_tables
+
+
+def is_map_file(file_name: str) -> bool:
+    # archived maps are gzip files named after their digest and upload name
+    return file_name.removesuffix('.gz').endswith(ACCEPTED_TYPES)
+
+
+def find_maps(paths: list[str]) -> list[str]:
+
+    found: list[str] = []
+
+    for path in paths:
+        if os.path.isfile(path):
+            found.append(path)
+            continue
+
+        for directory, _, file_names in os.walk(path):
+            found.extend(
+                os.path.join(directory, file_name)
+                for file_name in sorted(file_names) if is_map_file(file_name)
+            )
+
+    return found
+
+
+def validate_file(file_path: str) -> dict:
+
+    start: float = time.perf_counter()
+    result: dict = {'path': file_path}
+
+    try:
+        with open(file_path, 'rb') as map_file:
+            map_data: bytes = map_file.read()
+
+        if file_path.endswith('.gz'):
+            map_data = gzip.decompress(map_data)
+
+        result['size'] = len(map_data)
+
+        levels: list[tuple[str, str | None, int, int]] | None = validate_level_file(map_data, worker_blanks)
+
+    except Exception as e:
+        result.update(status='failed', reason=str(e))
+        levels = None
+
+    else:
+        if levels is None:
+            result.update(status='invalid')
+
+        else:
+            result.update(
+                status='ok',
+                errors=sum(level[2] for level in levels),
+                warnings=sum(level[3] for level in levels),
+                levels=len(levels),
+                external=[level[1] for level in levels if level[1] is not None]
+            )
+
+            # only levels with holes are listed to keep the report small
+            result['holes'] = {
+                identifier: [errors, warnings]
+                for identifier, _, errors, warnings in levels if errors or warnings
+            }
+
+    result['seconds'] = round(time.perf_counter() - start, 4)
+    return result
+
+
+async def load_blanks() -> tuple[int, dict[Tileset, np.ndarray]]:
+    # the state is read like at startup, but no snapshot is written
+
+    validator = Validator()
+
+    if not await validator.load_snapshot():
+        await validator.load_files()
+
+    return validator.cached_version, validator.tilesets.blank_tables
+
+
+def main() -> None:
+
+    parser = argparse.ArgumentParser(description='offline map validation')
+    parser.add_argument('paths', nargs='*', default=[Config.ARCHIVE_DIR])
+    parser.add_argument('--report', default='report.jsonl')
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    parser.add_argument('--chunksize', type=int, default=4)
+    args: argparse.Namespace = parser.parse_args()
+
+    version, blank_tables = asyncio.run(load_blanks())
+    if not version:
+        log.warn('no cached tileset version, no tile counts as blank')
+
+    file_paths: list[str] = find_maps(args.paths)
+    log.info(f'validating {len(file_paths)} maps against v{version} with {args.workers} workers')
+
+    start: float = time.perf_counter()
+    counts: dict[str, int] = {'ok': 0, 'invalid': 0, 'failed': 0}
+    total_bytes: int = 0
+    with_errors: int = 0
+
+    context = multiprocessing.get_context('spawn')
+
+    with context.Pool(args.workers, initializer=init_worker, initargs=(blank_tables,)) as pool, \
+            open(args.report, 'w') as report_file:
+
+        # results are written as they arrive, an interrupted run keeps its report
+        for done, result in enumerate(pool.imap_unordered(validate_file, file_paths, args.chunksize), 1):
+            report_file.write(json.dumps(result) + '\n')
+
+            counts[result['status']] += 1
+            total_bytes += result.get('size', 0)
+            with_errors += result.get('errors', 0) > 0
+
+            if done % 1000 == 0:
+                log.info(f'{done}/{len(file_paths)} maps validated')
+
+        elapsed: float = time.perf_counter() - start
+        summary: dict = {
+            'version': version,
+            'files': len(file_paths),
+            'with_errors': with_errors,
+            **counts,
+            'bytes': total_bytes,
+            'seconds': round(elapsed, 3),
+            'files_per_second': round(len(file_paths) / elapsed, 1) if elapsed else None,
+            'megabytes_per_second': round(total_bytes / elapsed / 1e6, 1) if elapsed else None,
+        }
+
+        report_file.write(json.dumps({'summary': summary}) + '\n')
+
+    log.info(
+        f'{len(file_paths)} maps in {elapsed:.1f}s, {summary["files_per_second"]} maps/s, '
+        f'{summary["megabytes_per_second"]} MB/s, {with_errors} with errors, '
+        f'{counts["invalid"]} invalid, {counts["failed"]} failed'
+    )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,61 @@
+# compares find_blanks against the per-tile crop loop it replaced
+# usage: python -m benchmarks.bench_blanks [width] [height] [repeats]
+
+import sys
+import time
+
+from PIL import Image
+
+from benchmarks.synthetic import synthetic_tileset
+from src.validator import find_blanks
+
+
+def legacy_retrieve_blanks(image: Image) -> set[int]:
+
+    blanks: set[int] = set()
+    blank_tile: Image = Image.new('RGBA', (8, 8), (0,) * 4)
+    tiles_x, tiles_y = image.width // 8, image.height // 8
+    color_purple: tuple[int, ...] = (255, 0, 255, 127)
+
+    for tile_id in range(tiles_x * tiles_y):
+
+        tile_x = tile_id % tiles_x * 8
+        tile_y = tile_id // tiles_x * 8
+        tile_box: tuple = (tile_x, tile_y, tile_x + 8, tile_y + 8)
+
+        if blank_tile.tobytes() == image.crop(tile_box).tobytes():
+            image.paste(color_purple, tile_box)
+            blanks.add(tile_id)
+
+    return blanks
+
+
+def main(width: int = 1024, height: int = 1024, repeats: int = 3) -> None:
+
+    source: Image = synthetic_tileset(width, height, blank_step=3)
+
+    timings: dict[str, float] = {'legacy': float('inf'), 'numpy': float('inf')}
+
+    for _ in range(repeats):
+        legacy_image: Image = source.copy()
+        start: float = time.perf_counter()
+        legacy_blanks: set[int] = legacy_retrieve_blanks(legacy_image)
+        timings['legacy'] = min(timings['legacy'], time.perf_counter() - start)
+
+        numpy_image: Image = source.copy()
+        start: float = time.perf_counter()
+        blank_table, debug_image = find_blanks(numpy_image)
+        timings['numpy'] = min(timings['numpy'], time.perf_counter() - start)
+
+    assert set(blank_table.nonzero()[0].tolist()) == legacy_blanks, 'blank tile ids differ'
+    assert debug_image.tobytes() == legacy_image.tobytes(), 'debug images differ'
+
+    tile_count: int = (width // 8) * (height // 8)
+    print(f'{width}x{height} px, {tile_count} tiles, {len(legacy_blanks)} blank')
+    print(f'legacy: {timings["legacy"] * 1e3:9.2f} ms')
+    print(f'numpy:  {timings["numpy"] * 1e3:9.2f} ms')
+    print(f'speedup: {timings["legacy"] / timings["numpy"]:.1f}x')
+
+
+if __name__ == '__main__':
+    main(*(int(a) for a in sys.argv[1:]))
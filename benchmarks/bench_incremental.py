@@ -0,0 +1,61 @@
+# compares a full validation against the incremental one on a synthetic
+# map, cold, with one level edited since the last upload and unchanged
+# usage: python -m benchmarks.bench_incremental [levels] [repeats] [--indent]
+
+import json
+import time
+import sys
+
+from benchmarks.synthetic import synthetic_blanks, synthetic_map
+from src.validator import validate_level_spans, validate_map
+
+
+def best_of(repeats: int, func, *args: any) -> tuple[float, any]:
+
+    best: float = float('inf')
+
+    for _ in range(repeats):
+        start: float = time.perf_counter()
+        result: any = func(*args)
+        best = min(best, time.perf_counter() - start)
+
+    return best, result
+
+
+def main(levels: int = 100, repeats: int = 3, indent: int | None = None) -> None:
+
+    blank_tables = synthetic_blanks()
+
+    map_object: dict = synthetic_map(levels=levels)
+    map_data: bytes = json.dumps(map_object, indent=indent).encode()
+
+    # the same map with the tiles of one level shifted, as after an edit
+    for tile in map_object['levels'][0]['layerInstances'][0]['gridTiles']:
+        tile['t'] += 1
+    edited_data: bytes = json.dumps(map_object, indent=indent).encode()
+
+    full_time, full_result = best_of(repeats, validate_map, map_data, blank_tables)
+    cold_time, level_results = best_of(repeats, validate_level_spans, map_data, blank_tables, {})
+
+    known: dict = {digest: (identifier, errors, warnings) for identifier, digest, errors, warnings in level_results}
+    edited_time, _ = best_of(repeats, validate_level_spans, edited_data, blank_tables, known)
+    same_time, same_results = best_of(repeats, validate_level_spans, map_data, blank_tables, known)
+
+    totals: tuple[int, int] = (
+        sum(errors for _, _, errors, _ in level_results),
+        sum(warnings for _, _, _, warnings in level_results)
+    )
+
+    assert totals == full_result, 'level counts differ from the full validation'
+    assert same_results == level_results, 'reused levels differ'
+
+    print(f'{levels} levels, {len(map_data) / 1e6:.1f} MB, result {full_result}')
+    print(f'full:        {full_time * 1e3:9.1f} ms')
+    print(f'spans cold:  {cold_time * 1e3:9.1f} ms  {full_time / cold_time:.2f}x')
+    print(f'one edited:  {edited_time * 1e3:9.1f} ms  {full_time / edited_time:.2f}x')
+    print(f'unchanged:   {same_time * 1e3:9.1f} ms  {full_time / same_time:.2f}x')
+
+
+if __name__ == '__main__':
+    arguments: list[str] = [argument for argument in sys.argv[1:] if argument != '--indent']
+    main(*(int(argument) for argument in arguments), indent=2 if '--indent' in sys.argv else None)
@@ -0,0 +1,515 @@
+# compares memory and gateway event cost of the bot under different intent
+# profiles, every profile runs in a fresh process, either connected with the
+# real token or offline by replaying gateway payloads through the parsers
+# usage: python -m benchmarks.bench_intents [--seconds S] [--record FILE] [profile ...]
+#        python -m benchmarks.bench_intents --replay [--payloads FILE] [--guilds N] [--members N] [--events N] [profile ...]
+
+import collections
+import subprocess
+import itertools
+import resource
+import argparse
+import asyncio
+import random
+import time
+import json
+import sys
+import os
+
+from discord import ClientUser, Intents, Member
+
+from src.jimbot import Jimbot, make_intents
+from src.config import Config
+
+
+# intent a dispatch needs, events in neither table are always sent
+EVENT_INTENTS: dict[str, str] = {
+    'GUILD_MEMBER_ADD': 'members',
+    'GUILD_MEMBER_UPDATE': 'members',
+    'GUILD_MEMBER_REMOVE': 'members',
+    'THREAD_MEMBERS_UPDATE': 'members',
+    'GUILD_MEMBERS_CHUNK': 'members',
+    'GUILD_BAN_ADD': 'moderation',
+    'GUILD_BAN_REMOVE': 'moderation',
+    'GUILD_AUDIT_LOG_ENTRY_CREATE': 'moderation',
+    'GUILD_EMOJIS_UPDATE': 'emojis_and_stickers',
+    'GUILD_STICKERS_UPDATE': 'emojis_and_stickers',
+    'GUILD_INTEGRATIONS_UPDATE': 'integrations',
+    'INTEGRATION_CREATE': 'integrations',
+    'INTEGRATION_UPDATE': 'integrations',
+    'INTEGRATION_DELETE': 'integrations',
+    'WEBHOOKS_UPDATE': 'webhooks',
+    'INVITE_CREATE': 'invites',
+    'INVITE_DELETE': 'invites',
+    'VOICE_STATE_UPDATE': 'voice_states',
+    'PRESENCE_UPDATE': 'presences',
+    'GUILD_SCHEDULED_EVENT_CREATE': 'guild_scheduled_events',
+    'GUILD_SCHEDULED_EVENT_UPDATE': 'guild_scheduled_events',
+    'GUILD_SCHEDULED_EVENT_DELETE': 'guild_scheduled_events',
+    'AUTO_MODERATION_ACTION_EXECUTION': 'auto_moderation_execution',
+}
+
+# these need the guild_ or dm_ variant depending on where they happened
+SCOPED_INTENTS: dict[str, str] = {
+    'MESSAGE_CREATE': 'messages',
+    'MESSAGE_UPDATE': 'messages',
+    'MESSAGE_DELETE': 'messages',
+    'MESSAGE_DELETE_BULK': 'messages',
+    'MESSAGE_REACTION_ADD': 'reactions',
+    'MESSAGE_REACTION_REMOVE': 'reactions',
+    'MESSAGE_REACTION_REMOVE_ALL': 'reactions',
+    'MESSAGE_REACTION_REMOVE_EMOJI': 'reactions',
+    'TYPING_START': 'typing',
+}
+
+GUILD_EVENTS: tuple[str, ...] = ('GUILD_', 'CHANNEL_', 'THREAD_', 'STAGE_INSTANCE_')
+
+# share of every event in the synthetic stream, roughly a busy community server
+SYNTHETIC_MIX: dict[str, int] = {
+    'PRESENCE_UPDATE': 55,
+    'MESSAGE_CREATE': 15,
+    'TYPING_START': 10,
+    'MESSAGE_REACTION_ADD': 8,
+    'GUILD_MEMBER_UPDATE': 5,
+    'MESSAGE_UPDATE': 3,
+    'MESSAGE_DELETE': 2,
+    'VOICE_STATE_UPDATE': 2,
+}
+
+TIMESTAMP: str = '2024-01-01T00:00:00.000000+00:00'
+
+
+def is_sent(event: str, data: dict, intents: Intents) -> bool:
+    # whether the gateway sends the event to a client with these intents
+
+    if event in SCOPED_INTENTS:
+        scope: str = 'guild' if data.get('guild_id') else 'dm'
+        return getattr(intents, f'{scope}_{SCOPED_INTENTS[event]}')
+
+    if event in EVENT_INTENTS:
+        return getattr(intents, EVENT_INTENTS[event])
+
+    if event.startswith(GUILD_EVENTS):
+        return intents.guilds
+
+    return True
+
+
+def shape_payload(event: str, data: dict, intents: Intents, bot_id: str) -> dict:
+    # strips what the gateway leaves out of a payload for these intents,
+    # payloads are recorded with all intents so only removing is needed
+
+    if event == 'GUILD_CREATE':
+        data = dict(data)
+
+        if not intents.members:
+            data['members'] = [member for member in data.get('members', []) if member['user']['id'] == bot_id]
+
+        if not intents.presences:
+            data['presences'] = []
+
+    elif event in ('MESSAGE_CREATE', 'MESSAGE_UPDATE') and not intents.message_content:
+        mentioned: bool = any(user['id'] == bot_id for user in data.get('mentions', []))
+
+        if data.get('guild_id') and not mentioned and data.get('author', {}).get('id') != bot_id:
+            data = dict(data, content='', embeds=[], attachments=[], components=[])
+
+    return data
+
+
+def make_user(user_id: int) -> dict:
+    return {
+        'id': str(user_id),
+        'username': f'user{user_id % 100000}',
+        'discriminator': '0',
+        'global_name': None,
+        'avatar': None,
+        'bot': False
+    }
+
+
+def make_member(user: dict, roles: list[str]) -> dict:
+    return {
+        'user': user,
+        'roles': roles,
+        'joined_at': TIMESTAMP,
+        'nick': None,
+        'deaf': False,
+        'mute': False,
+        'flags': 0
+    }
+
+
+def synthetic_payloads(guilds: int, members: int, events: int, seed: int = 0):
+    # a READY, one GUILD_CREATE per guild with every member online and
+    # then the event stream, deterministic for a given seed
+
+    rng = random.Random(seed)
+    snowflakes = itertools.count(10 ** 17)
+
+    bot_user: dict = make_user(next(snowflakes))
+    bot_user['bot'] = True
+
+    guild_ids: list[int] = [next(snowflakes) for _ in range(guilds)]
+    yield 'READY', {'user': bot_user, 'guilds': [{'id': str(guild_id), 'unavailable': True} for guild_id in guild_ids]}
+
+    layout: list[tuple[str, list[str], list[dict], list[str]]] = []
+
+    for guild_id in guild_ids:
+        role_ids: list[str] = [str(next(snowflakes)) for _ in range(10)]
+        channel_ids: list[str] = [str(next(snowflakes)) for _ in range(20)]
+
+        users: list[dict] = [bot_user] + [make_user(next(snowflakes)) for _ in range(members - 1)]
+        layout.append((str(guild_id), channel_ids, users, role_ids))
+
+        roles: list[dict] = [
+            {
+                'id': role_id if index else str(guild_id),
+                'name': f'role{index}' if index else '@everyone',
+                'permissions': '0',
+                'position': index,
+                'color': 0,
+                'hoist': False,
+                'managed': False,
+                'mentionable': False
+            }
+            for index, role_id in enumerate(role_ids)
+        ]
+
+        channels: list[dict] = [
+            {'id': channel_id, 'type': 0, 'name': f'channel{index}', 'position': index, 'permission_overwrites': []}
+            for index, channel_id in enumerate(channel_ids)
+        ]
+
+        yield 'GUILD_CREATE', {
+            'id': str(guild_id),
+            'name': f'guild{guild_id % 1000}',
+            'icon': None,
+            'owner_id': users[1]['id'],
+            'roles': roles,
+            'emojis': [],
+            'stickers': [],
+            'features': [],
+            'channels': channels,
+            'threads': [],
+            'members': [make_member(user, rng.sample(role_ids[1:], 2)) for user in users],
+            'presences': [
+                {'user': {'id': user['id']}, 'status': 'online', 'activities': [], 'client_status': {'desktop': 'online'}}
+                for user in users[1:]
+            ],
+            'voice_states': [],
+            'stage_instances': [],
+            'guild_scheduled_events': [],
+            'member_count': members,
+            'large': members > 250,
+            'unavailable': False,
+            'joined_at': TIMESTAMP,
+            'afk_timeout': 300,
+            'verification_level': 0,
+            'default_message_notifications': 0,
+            'explicit_content_filter': 0,
+            'mfa_level': 0,
+            'premium_tier': 0,
+            'system_channel_flags': 0,
+            'preferred_locale': 'en-US',
+            'nsfw_level': 0
+        }
+
+    names: list[str] = list(SYNTHETIC_MIX)
+    weights: list[int] = list(SYNTHETIC_MIX.values())
+    sent_messages: list[tuple[str, str, str]] = []
+
+    for event in rng.choices(names, weights, k=events):
+        guild_id, channel_ids, users, role_ids = rng.choice(layout)
+        channel_id: str = rng.choice(channel_ids)
+        user: dict = rng.choice(users[1:])
+        member: dict = make_member(user, role_ids[1:3])
+
+        if event == 'PRESENCE_UPDATE':
+            activities: list[dict] = [{'name': f'game{rng.randrange(50)}', 'type': 0}] if rng.random() < 0.5 else []
+            yield event, {
+                'user': {'id': user['id']},
+                'guild_id': guild_id,
+                'status': rng.choice(('online', 'idle', 'dnd')),
+                'activities': activities,
+                'client_status': {'desktop': 'online'}
+            }
+
+        elif event in ('MESSAGE_CREATE', 'MESSAGE_UPDATE'):
+            if event == 'MESSAGE_UPDATE' and sent_messages:
+                message_id, channel_id, guild_id = rng.choice(sent_messages)
+
+            else:
+                message_id = str(next(snowflakes))
+                sent_messages.append((message_id, channel_id, guild_id))
+
+            yield event, {
+                'id': message_id,
+                'channel_id': channel_id,
+                'guild_id': guild_id,
+                'author': user,
+                'member': {key: value for key, value in member.items() if key != 'user'},
+                'content': ' '.join(rng.choices(('map', 'tile', 'level', 'hole', 'nice', 'jim', 'help'), k=12)),
+                'timestamp': TIMESTAMP,
+                'edited_timestamp': TIMESTAMP if event == 'MESSAGE_UPDATE' else None,
+                'tts': False,
+                'mention_everyone': False,
+                'mentions': [],
+                'mention_roles': [],
+                'attachments': [],
+                'embeds': [],
+                'components': [],
+                'pinned': False,
+                'type': 0,
+                'flags': 0
+            }
+
+        elif event == 'MESSAGE_DELETE' and sent_messages:
+            message_id, channel_id, guild_id = sent_messages.pop(rng.randrange(len(sent_messages)))
+            yield event, {'id': message_id, 'channel_id': channel_id, 'guild_id': guild_id}
+
+        elif event == 'TYPING_START':
+            yield event, {
+                'channel_id': channel_id,
+                'guild_id': guild_id,
+                'user_id': user['id'],
+                'timestamp': 1704067200,
+                'member': member
+            }
+
+        elif event == 'MESSAGE_REACTION_ADD' and sent_messages:
+            message_id, channel_id, guild_id = rng.choice(sent_messages)
+            yield event, {
+                'user_id': user['id'],
+                'channel_id': channel_id,
+                'message_id': message_id,
+                'guild_id': guild_id,
+                'emoji': {'id': None, 'name': rng.choice(('👍', '🎉', '❤️'))},
+                'member': member,
+                'burst': False,
+                'type': 0
+            }
+
+        elif event == 'GUILD_MEMBER_UPDATE':
+            yield event, dict(member, guild_id=guild_id, nick=f'nick{rng.randrange(1000)}')
+
+        elif event == 'VOICE_STATE_UPDATE':
+            yield event, {
+                'guild_id': guild_id,
+                'channel_id': channel_id if rng.random() < 0.5 else None,
+                'user_id': user['id'],
+                'member': member,
+                'session_id': 'session',
+                'deaf': False,
+                'mute': False,
+                'self_deaf': False,
+                'self_mute': rng.random() < 0.5,
+                'self_video': False,
+                'suppress': False,
+                'request_to_speak_timestamp': None
+            }
+
+
+def recorded_payloads(file_path: str):
+    # dispatch frames as written by --record, one JSON object per line
+
+    with open(file_path, 'r') as payload_file:
+        for line in payload_file:
+            frame: dict = json.loads(line)
+            yield frame['t'], frame['d']
+
+
+async def replay(args: argparse.Namespace) -> dict:
+
+    jimbot: Jimbot = Jimbot()
+    intents: Intents = make_intents(Config.INTENTS)
+
+    # the loop has to be set before events can be dispatched to the
+    # handlers, members come from the replayed chunks instead of requests
+    await jimbot._async_setup_hook()
+    state = jimbot._connection
+    state._chunk_guilds = False
+
+    # payloads are built before the baseline is taken,
+    # the growth only counts what the bot keeps of them
+    if args.payloads:
+        payloads: list[tuple[str, dict]] = list(recorded_payloads(args.payloads))
+    else:
+        payloads: list[tuple[str, dict]] = list(synthetic_payloads(args.guilds, args.members, args.events))
+
+    events: collections.Counter = collections.Counter()
+    dropped: int = 0
+    bot_id: str = ''
+    elapsed: float = 0.0
+
+    base_rss: float = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+    for event, data in payloads:
+        if event == 'READY':
+            bot_id = data['user']['id']
+            state.user = ClientUser(state=state, data=data['user'])
+            continue
+
+        if not is_sent(event, data, intents):
+            dropped += 1
+            continue
+
+        data = shape_payload(event, data, intents, bot_id)
+        parser = state.parsers.get(event)
+        if parser is None:
+            continue
+
+        start: float = time.perf_counter()
+
+        # unrequested chunks are ignored by the parser, the members a
+        # startup chunk request would have cached are added directly
+        if event == 'GUILD_MEMBERS_CHUNK':
+            guild = state._get_guild(int(data['guild_id']))
+            if guild is not None and intents.members:
+                for member_data in data.get('members', []):
+                    guild._add_member(Member(data=member_data, guild=guild, state=state))
+
+        else:
+            parser(data)
+
+        # lets the handler tasks of the dispatched events run
+        events[event] += 1
+        if events.total() % 100 == 0:
+            await asyncio.sleep(0)
+
+        elapsed += time.perf_counter() - start
+
+    delivered: int = events.total()
+    result: dict = {
+        'rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        'cache_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024 - base_rss,
+        'guilds': len(jimbot.guilds),
+        'members': sum(len(guild.members) for guild in jimbot.guilds),
+        'messages': len(jimbot.cached_messages),
+        'delivered': delivered,
+        'dropped': dropped,
+        'seconds': elapsed,
+        'microseconds_per_event': elapsed / delivered * 1e6 if delivered else 0.0,
+        'events': dict(events.most_common(8))
+    }
+
+    await jimbot.close()
+    return result
+
+
+async def measure(args: argparse.Namespace) -> dict:
+
+    jimbot: Jimbot = Jimbot()
+    events: collections.Counter = collections.Counter()
+
+    async def on_socket_event_type(event_type: str) -> None:
+        events[event_type] += 1
+
+    jimbot.on_socket_event_type = on_socket_event_type
+
+    record_file = open(args.record, 'w') if args.record else None
+
+    if record_file is not None:
+        jimbot._enable_debug_events = True
+
+        # only dispatches are kept, heartbeats and the like are not replayed
+        async def on_socket_raw_receive(message: str) -> None:
+            frame: dict = json.loads(message)
+            if frame.get('op') == 0:
+                record_file.write(json.dumps({'t': frame['t'], 'd': frame['d']}) + '\n')
+
+        jimbot.on_socket_raw_receive = on_socket_raw_receive
+
+    with open('token', 'r') as token_file:
+        bot_token: str = token_file.read()
+
+    await jimbot.login(bot_token)
+    task: asyncio.Task = asyncio.create_task(jimbot.connect())
+
+    await jimbot.wait_until_ready()
+    events.clear()
+    await asyncio.sleep(args.seconds)
+
+    result: dict = {
+        'rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        'guilds': len(jimbot.guilds),
+        'members': sum(len(guild.members) for guild in jimbot.guilds),
+        'messages': len(jimbot.cached_messages),
+        'events_per_second': sum(events.values()) / args.seconds,
+        'events': dict(events.most_common(8))
+    }
+
+    await jimbot.close()
+    task.cancel()
+
+    if record_file is not None:
+        record_file.close()
+
+    return result
+
+
+def child_arguments(args: argparse.Namespace, profile: str) -> list[str]:
+    # the options a profile process needs, recording only makes sense with
+    # all intents as replays can only strip what was recorded
+
+    if args.replay:
+        payloads: list[str] = ['--payloads', args.payloads] if args.payloads else []
+        return ['--replay', *payloads, '--guilds', str(args.guilds), '--members', str(args.members),
+                '--events', str(args.events)]
+
+    if args.record and profile == 'all':
+        return ['--seconds', str(args.seconds), '--record', args.record]
+
+    return ['--seconds', str(args.seconds)]
+
+
+def run_profile(args: argparse.Namespace, profile: str) -> dict:
+
+    env: dict = dict(os.environ, JIMBOT_INTENTS=profile)
+    command: list[str] = [sys.executable, '-m', 'benchmarks.bench_intents', '--child', *child_arguments(args, profile)]
+
+    output: str = subprocess.run(command, env=env, capture_output=True, text=True, check=True).stdout
+    return json.loads(output.splitlines()[-1])
+
+
+def main() -> None:
+
+    parser = argparse.ArgumentParser(description='intent profile comparison')
+    parser.add_argument('profiles', nargs='*', default=['all', 'lean'])
+    parser.add_argument('--seconds', type=float, default=300)
+    parser.add_argument('--record', help='write the dispatches of the all profile to a file')
+    parser.add_argument('--replay', action='store_true', help='replay payloads offline instead of connecting')
+    parser.add_argument('--payloads', help='file written by --record, synthetic payloads without one')
+    parser.add_argument('--guilds', type=int, default=3)
+    parser.add_argument('--members', type=int, default=5000)
+    parser.add_argument('--events', type=int, default=50000)
+    parser.add_argument('--child', action='store_true', help=argparse.SUPPRESS)
+    args: argparse.Namespace = parser.parse_args()
+
+    if args.child:
+        result: dict = asyncio.run(replay(args) if args.replay else measure(args))
+        print(json.dumps(result))
+        return
+
+    for profile in args.profiles:
+        result: dict = run_profile(args, profile)
+
+        if args.replay:
+            print(
+                f'{profile:>8}: rss {result["rss_mb"]:.1f} MB (+{result["cache_mb"]:.1f} MB kept), '
+                f'{result["members"]} members, {result["messages"]} messages, {result["delivered"]} events '
+                f'in {result["seconds"]:.2f}s, {result["microseconds_per_event"]:.1f} us each, '
+                f'{result["dropped"]} not sent'
+            )
+
+        else:
+            print(
+                f'{profile:>8}: rss {result["rss_mb"]:.1f} MB, {result["members"]} members, '
+                f'{result["messages"]} messages, {result["events_per_second"]:.2f} events/s'
+            )
+
+        print(f'          top events {result["events"]}')
+
+
+if __name__ == '__main__':
+    main()
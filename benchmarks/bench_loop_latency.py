@@ -0,0 +1,101 @@
+# measures event loop lag while concurrent !validate uploads are processed,
+# inline on the loop versus in the validator process pool
+# usage: python -m benchmarks.bench_loop_latency [pool size] [levels]
+
+import concurrent.futures
+import multiprocessing
+import statistics
+import tempfile
+import asyncio
+import json
+import sys
+import os
+
+from benchmarks.synthetic import synthetic_blanks, synthetic_map
+from src.validator import TilesetState, Validator
+from src.cache import ResultCache
+
+
+class FakeAttachment:
+
+    def __init__(self, filename: str, data: bytes) -> None:
+        self.filename: str = filename
+        self.size: int = len(data)
+        self.data: bytes = data
+
+    async def read(self, **kwargs) -> bytes:
+        return self.data
+
+
+async def probe_lag(lags: list[float], stop: asyncio.Event, interval: float = 0.005) -> None:
+
+    loop = asyncio.get_running_loop()
+
+    while not stop.is_set():
+        start: float = loop.time()
+        await asyncio.sleep(interval)
+        lags.append(loop.time() - start - interval)
+
+
+async def run_uploads(validator: Validator, attachment: FakeAttachment, uploads: int) -> dict:
+
+    lags: list[float] = []
+    stop = asyncio.Event()
+    probe = asyncio.create_task(probe_lag(lags, stop))
+
+    loop = asyncio.get_running_loop()
+    start: float = loop.time()
+    await asyncio.gather(*(validator.process_validate(attachment) for _ in range(uploads)))
+    elapsed: float = loop.time() - start
+
+    stop.set()
+    await probe
+    lags.sort()
+
+    return {
+        'wall_s': elapsed,
+        'max_lag_ms': lags[-1] * 1e3 if lags else elapsed * 1e3,
+        'p99_lag_ms': lags[int(len(lags) * 0.99)] * 1e3 if lags else elapsed * 1e3,
+        'median_lag_ms': statistics.median(lags) * 1e3 if lags else elapsed * 1e3,
+    }
+
+
+async def main(pool_size: int = 4, levels: int = 20) -> None:
+
+    map_data: bytes = json.dumps(synthetic_map(levels=levels)).encode()
+    attachment = FakeAttachment('bench.ldtk', map_data)
+    print(f'map size: {len(map_data) / 1e6:.1f} MB')
+
+    validator = Validator()
+    validator.tilesets = TilesetState.from_tables(synthetic_blanks())
+
+    # every upload is identical, results must not come from the cache
+    validator.result_cache = ResultCache(max_size=0)
+    pool = concurrent.futures.ProcessPoolExecutor(
+        max_workers=pool_size,
+        mp_context=multiprocessing.get_context('spawn')
+    )
+
+    # warm up the workers so process start-up is not measured
+    validator.executor = pool
+    await asyncio.gather(*(validator.process_validate(attachment) for _ in range(pool_size)))
+
+    for mode, executor in (('inline', None), (f'pool({pool_size})', pool)):
+        validator.executor = executor
+
+        for uploads in (1, 4, 16):
+            result: dict = await run_uploads(validator, attachment, uploads)
+            print(
+                f'{mode:>8} uploads={uploads:<3}'
+                f' wall={result["wall_s"]:6.2f}s'
+                f' max lag={result["max_lag_ms"]:8.1f}ms'
+                f' p99 lag={result["p99_lag_ms"]:8.1f}ms'
+            )
+
+    pool.shutdown()
+
+
+if __name__ == '__main__':
+    with tempfile.TemporaryDirectory() as work_dir:
+        os.chdir(work_dir)
+        asyncio.run(main(*(int(a) for a in sys.argv[1:])))
@@ -0,0 +1,117 @@
+# end-to-end version bump and polling costs against the local stand-in server
+# usage: python -m benchmarks.bench_update [--bumps N] [--polls N] [--latency S] [--fail-rate R]
+
+import statistics
+import tempfile
+import argparse
+import asyncio
+import time
+import os
+
+import aiohttp
+
+from benchmarks.server import StandInServer
+from src.validator import Validator
+from src.config import Config
+
+
+async def timed(coroutine) -> tuple[float, any]:
+
+    start: float = time.perf_counter()
+    try:
+        result: any = await coroutine
+
+    except Exception as e:
+        result: any = e
+
+    return time.perf_counter() - start, result
+
+
+async def run(args: argparse.Namespace) -> None:
+
+    server = StandInServer(
+        latency=args.latency,
+        fail_rate=args.fail_rate,
+        tileset_size=args.tileset_size
+    )
+
+    Config.BASE_URL = await server.start()
+
+    validator = Validator()
+    await validator.load_cached()
+
+    async with aiohttp.ClientSession() as session:
+        validator.client_session = session
+
+        elapsed, result = await timed(validator.check_update())
+        print(f'initial refresh:   {elapsed * 1e3:9.1f} ms  ({result})')
+
+        bump_timings: list[float] = []
+        for _ in range(args.bumps):
+            server.bump_version()
+            elapsed, result = await timed(validator.check_update())
+            if result is True:
+                bump_timings.append(elapsed)
+
+        if bump_timings:
+            print(
+                f'version bump:      {statistics.median(bump_timings) * 1e3:9.1f} ms median'
+                f'  {max(bump_timings) * 1e3:9.1f} ms max  ({len(bump_timings)}/{args.bumps} ok)'
+            )
+
+        same_timings: list[float] = []
+        for _ in range(args.bumps):
+            server.bump_version(images=False)
+            elapsed, result = await timed(validator.check_update())
+            if result is True:
+                same_timings.append(elapsed)
+
+        if same_timings:
+            print(
+                f'same-image bump:   {statistics.median(same_timings) * 1e3:9.1f} ms median'
+                f'  {max(same_timings) * 1e3:9.1f} ms max  (content hash reused)'
+            )
+
+        poll_timings: list[float] = []
+        poll_failures: int = 0
+        for _ in range(args.polls):
+            elapsed, result = await timed(validator.check_update())
+            if isinstance(result, Exception):
+                poll_failures += 1
+            else:
+                poll_timings.append(elapsed)
+
+        if poll_timings:
+            poll_timings.sort()
+            print(
+                f'idle poll:         {statistics.median(poll_timings) * 1e3:9.1f} ms median'
+                f'  {poll_timings[int(len(poll_timings) * 0.95)] * 1e3:9.1f} ms p95'
+                f'  ({poll_failures}/{args.polls} failed)'
+            )
+
+        elapsed, _ = await timed(validator.process_tilesets())
+        print(f'unchanged refresh: {elapsed * 1e3:9.1f} ms  (conditional requests)')
+
+    await server.stop()
+    await asyncio.sleep(0.1)
+
+    print('requests served:', dict(sorted(server.requests.items())))
+
+
+def main() -> None:
+
+    parser = argparse.ArgumentParser(description='version bump benchmark')
+    parser.add_argument('--bumps', type=int, default=3)
+    parser.add_argument('--polls', type=int, default=50)
+    parser.add_argument('--latency', type=float, default=0.02)
+    parser.add_argument('--fail-rate', type=float, default=0.0)
+    parser.add_argument('--tileset-size', type=int, default=1024)
+    args: argparse.Namespace = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        os.chdir(work_dir)
+        asyncio.run(run(args))
+
+
+if __name__ == '__main__':
+    main()
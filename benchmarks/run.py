@@ -0,0 +1,192 @@
+# offline benchmark suite for parsing, validation, updates and blank extraction
+# usage: python -m benchmarks.run [--levels N] [--layers N] [--tiles N] [--blank-ratio R]
+#        python -m benchmarks.run --compare old.json new.json
+
+import subprocess
+import statistics
+import tracemalloc
+import platform
+import argparse
+import asyncio
+import time
+import json
+import os
+
+import numpy as np
+
+from benchmarks.synthetic import synthetic_blanks, synthetic_map, synthetic_project, synthetic_tileset
+from src.validator import LDtkMap, LDtkStream, Tileset, find_blanks, update_map, validate_map
+
+
+class BytesStream:
+
+    # async reader over in-memory bytes, stands in for an HTTP body
+
+    def __init__(self, data: bytes) -> None:
+        self.view: memoryview = memoryview(data)
+        self.position: int = 0
+
+    async def read(self, size: int = -1) -> bytes:
+        end: int = len(self.view) if size < 0 else self.position + size
+        chunk: bytes = bytes(self.view[self.position:end])
+        self.position += len(chunk)
+        return chunk
+
+
+def build_cases(args: argparse.Namespace) -> dict[str, any]:
+    # every case is a callable without arguments, inputs are prepared up front
+
+    blank_tables: dict[Tileset, np.ndarray] = synthetic_blanks()
+    map_params: dict = {
+        'levels': args.levels,
+        'layers': args.layers,
+        'tiles': args.tiles,
+        'blank_ratio': args.blank_ratio,
+    }
+
+    map_data: bytes = json.dumps(synthetic_map(**map_params), indent=2).encode()
+    parsed_map: dict = json.loads(map_data)
+
+    project, level_files = synthetic_project(**map_params)
+    level_data: list[bytes] = [json.dumps(level).encode() for level in level_files.values()]
+    defs_new: dict = dict(project['defs'], entities=[{'identifier': 'Bench'}])
+
+    tileset_image = synthetic_tileset(args.tileset_size, args.tileset_size)
+
+    def extract_blanks() -> None:
+        find_blanks(tileset_image.copy())
+
+    def stream_validate() -> tuple[int, int] | None:
+        return asyncio.run(LDtkStream(blank_tables).validate(BytesStream(map_data)))
+
+    cases: dict[str, any] = {
+        'parse': lambda: json.loads(map_data),
+        'validate': lambda: LDtkMap(parsed_map, blank_tables).validate_levels(),
+        'validate_bytes': lambda: validate_map(map_data, blank_tables),
+        'validate_levels': lambda: [validate_map(data, blank_tables) for data in level_data],
+        'validate_stream': stream_validate,
+        'update_serialize': lambda: update_map(map_data, defs_new),
+        'blank_extraction': extract_blanks,
+    }
+
+    sizes: dict[str, int] = {
+        'map_bytes': len(map_data),
+        'level_bytes': sum(len(data) for data in level_data),
+        'tiles': args.levels * args.layers * args.tiles,
+    }
+
+    return cases, sizes
+
+
+def measure(case, repeats: int) -> dict:
+
+    timings: list[float] = []
+    for _ in range(repeats):
+        start: float = time.perf_counter()
+        case()
+        timings.append(time.perf_counter() - start)
+
+    # peak memory is measured in a separate run, tracing slows everything down
+    tracemalloc.start()
+    case()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        'min_ms': min(timings) * 1e3,
+        'median_ms': statistics.median(timings) * 1e3,
+        'peak_mb': peak / 1e6,
+    }
+
+
+def git_commit() -> str:
+
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            capture_output=True, text=True, check=True
+        ).stdout.strip()
+
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def run(args: argparse.Namespace) -> None:
+
+    cases, sizes = build_cases(args)
+    selected: list[str] = args.only or list(cases)
+
+    results: dict[str, dict] = {}
+    for name in selected:
+        results[name] = measure(cases[name], args.repeats)
+        print(
+            f'{name:>18}'
+            f'  min {results[name]["min_ms"]:9.2f} ms'
+            f'  median {results[name]["median_ms"]:9.2f} ms'
+            f'  peak {results[name]["peak_mb"]:8.2f} MB'
+        )
+
+    commit: str = git_commit()
+    report: dict = {
+        'commit': commit,
+        'time': time.time(),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'params': {k: v for k, v in vars(args).items() if k not in ('compare', 'output', 'only')},
+        'sizes': sizes,
+        'results': results,
+    }
+
+    output_path: str = args.output or os.path.join('benchmarks', 'results', f'{commit}.json')
+    os.makedirs(os.path.dirname(output_path) or '.', exist_ok=True)
+    with open(output_path, 'w') as output_file:
+        json.dump(report, output_file, indent=2)
+
+    print(f'saved results to {output_path}')
+
+
+def compare(old_path: str, new_path: str) -> None:
+
+    with open(old_path) as old_file, open(new_path) as new_file:
+        old_report, new_report = json.load(old_file), json.load(new_file)
+
+    if old_report['params'] != new_report['params']:
+        print('warning: reports were run with different parameters')
+
+    print(f'{old_report["commit"]} -> {new_report["commit"]}')
+
+    for name, new_result in new_report['results'].items():
+        if (old_result := old_report['results'].get(name)) is None:
+            continue
+
+        ratio: float = new_result['min_ms'] / old_result['min_ms'] if old_result['min_ms'] else 0
+        print(
+            f'{name:>18}'
+            f'  {old_result["min_ms"]:9.2f} -> {new_result["min_ms"]:9.2f} ms ({ratio:5.2f}x)'
+            f'  {old_result["peak_mb"]:8.2f} -> {new_result["peak_mb"]:8.2f} MB'
+        )
+
+
+def main() -> None:
+
+    parser = argparse.ArgumentParser(description='Jimbot benchmark suite')
+    parser.add_argument('--levels', type=int, default=20)
+    parser.add_argument('--layers', type=int, default=6)
+    parser.add_argument('--tiles', type=int, default=1000, help='tiles per layer')
+    parser.add_argument('--blank-ratio', type=float, default=0.05)
+    parser.add_argument('--tileset-size', type=int, default=1024, help='synthetic tileset width and height')
+    parser.add_argument('--repeats', type=int, default=5)
+    parser.add_argument('--only', nargs='+', help='run only the named benchmarks')
+    parser.add_argument('--output', help='results file, defaults to benchmarks/results/<commit>.json')
+    parser.add_argument('--compare', nargs=2, metavar=('OLD', 'NEW'), help='compare two results files')
+
+    args: argparse.Namespace = parser.parse_args()
+
+    if args.compare:
+        compare(*args.compare)
+    else:
+        run(args)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,177 @@
+# local stand-in for the talesofyore.com endpoints used by the validator,
+# point the bot at it with JIMBOT_BASE_URL=http://127.0.0.1:<port>
+# usage: python -m benchmarks.server [--port N] [--version N] [--latency S] [--fail-rate R]
+
+import argparse
+import asyncio
+import hashlib
+import random
+import io
+
+from aiohttp import web
+
+from benchmarks.synthetic import synthetic_tileset
+from src.validator import Tileset
+
+
+class StandInServer:
+
+    def __init__(
+        self,
+        version: int = 1,
+        latency: float = 0.0,
+        fail_rate: float = 0.0,
+        tileset_size: int = 1024,
+        changelog_versions: int | None = None,
+        seed: int = 0
+    ) -> None:
+        # every attribute may be changed while the server is running
+
+        self.version: int = version
+        self.latency: float = latency
+        self.fail_rate: float = fail_rate
+        self.tileset_size: int = tileset_size
+
+        # versions up to this one have a changelog, newer ones are 404
+        self.changelog_versions: int | None = changelog_versions
+
+        self.rng = random.Random(seed)
+        self.tilesets: dict[str, tuple[bytes, str]] = {}
+        self.requests: dict[str, int] = {}
+        self.runner: web.AppRunner | None = None
+        self.url: str | None = None
+
+        self.render_tilesets()
+
+    def render_tilesets(self) -> None:
+        # the PNGs depend on the version, so a bump changes their content
+
+        for index, tileset in enumerate(Tileset):
+            seed: int = self.version * len(Tileset) + index
+            image = synthetic_tileset(self.tileset_size, self.tileset_size, seed=seed)
+
+            bytes_buffer: io.BytesIO = io.BytesIO()
+            image.save(bytes_buffer, format='PNG')
+            image_data: bytes = bytes_buffer.getvalue()
+
+            etag: str = '"' + hashlib.sha256(image_data).hexdigest()[:16] + '"'
+            self.tilesets[tileset.file_name] = (image_data, etag)
+
+    def bump_version(self, images: bool = True) -> None:
+        self.version += 1
+
+        if images:
+            self.render_tilesets()
+            return
+
+        # a redeploy without new images, the content stays but the ETags change
+        self.tilesets = {
+            file_name: (image_data, f'"{self.version}-{etag.strip(chr(34))}"')
+            for file_name, (image_data, etag) in self.tilesets.items()
+        }
+
+    @web.middleware
+    async def simulate_network(self, request: web.Request, handler) -> web.StreamResponse:
+
+        self.requests[request.path] = self.requests.get(request.path, 0) + 1
+
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+        if self.fail_rate and self.rng.random() < self.fail_rate:
+            raise web.HTTPServiceUnavailable()
+
+        return await handler(request)
+
+    async def handle_version(self, request: web.Request) -> web.Response:
+        return web.Response(text=f'{self.version}\n')
+
+    async def handle_changelog(self, request: web.Request) -> web.Response:
+
+        try:
+            version: int = int(request.match_info['version'])
+
+        except ValueError:
+            raise web.HTTPNotFound()
+
+        latest: int = self.version if self.changelog_versions is None else self.changelog_versions
+        if version < 1 or version > latest:
+            raise web.HTTPNotFound()
+
+        return web.json_response({
+            'version': version,
+            'date': 1_700_000_000 + version * 86400,
+            'changes': [f'Change {n} of version {version}' for n in range(1, 6)],
+        })
+
+    async def handle_tileset(self, request: web.Request) -> web.Response:
+
+        if (tileset := self.tilesets.get(request.match_info['name'])) is None:
+            raise web.HTTPNotFound()
+
+        image_data, etag = tileset
+        if request.headers.get('If-None-Match') == etag:
+            return web.Response(status=304, headers={'ETag': etag})
+
+        return web.Response(body=image_data, content_type='image/png', headers={'ETag': etag})
+
+    def make_app(self) -> web.Application:
+
+        app = web.Application(middlewares=[self.simulate_network])
+        app.router.add_get('/play/version', self.handle_version)
+        app.router.add_get('/play/changelog/{version}.json', self.handle_changelog)
+        app.router.add_get('/play/tilesets/{name}', self.handle_tileset)
+
+        return app
+
+    async def start(self, host: str = '127.0.0.1', port: int = 0) -> str:
+
+        self.runner = web.AppRunner(self.make_app())
+        await self.runner.setup()
+
+        site = web.TCPSite(self.runner, host, port)
+        await site.start()
+
+        bound_port: int = site._server.sockets[0].getsockname()[1]
+        self.url = f'http://{host}:{bound_port}'
+        return self.url
+
+    async def stop(self) -> None:
+        if self.runner is not None:
+            await self.runner.cleanup()
+
+
+async def serve(args: argparse.Namespace) -> None:
+
+    server = StandInServer(
+        version=args.version,
+        latency=args.latency,
+        fail_rate=args.fail_rate,
+        tileset_size=args.tileset_size
+    )
+
+    print(f'serving on {await server.start(args.host, args.port)}')
+    print('press enter to release a new version')
+
+    loop = asyncio.get_running_loop()
+    while True:
+        await loop.run_in_executor(None, input)
+        server.bump_version()
+        print(f'released version {server.version}')
+
+
+def main() -> None:
+
+    parser = argparse.ArgumentParser(description='stand-in for the talesofyore.com endpoints')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--version', type=int, default=1)
+    parser.add_argument('--latency', type=float, default=0.0, help='seconds added to every response')
+    parser.add_argument('--fail-rate', type=float, default=0.0, help='share of requests answered with 503')
+    parser.add_argument('--tileset-size', type=int, default=1024)
+
+    asyncio.run(serve(parser.parse_args()))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,159 @@
+# synthetic LDtk data for the benchmarks, deterministic for a given seed
+
+import random
+
+import numpy as np
+
+from PIL import Image
+
+from src.validator import LDtkLevel, Tileset
+
+
+# ids of a 512x512 tileset, every blank_step-th id is a blank tile
+TILE_IDS: int = 4096
+
+
+def synthetic_blanks(blank_step: int = 16) -> dict[Tileset, np.ndarray]:
+    # every n-th tile id of each tileset is considered blank
+
+    blank_table: np.ndarray = np.zeros(TILE_IDS, dtype=bool)
+    blank_table[::blank_step] = True
+
+    return {tileset: blank_table.copy() for tileset in Tileset}
+
+
+def synthetic_tileset(
+    width: int = 512,
+    height: int = 512,
+    blank_step: int = 16,
+    seed: int = 0
+) -> Image:
+    # tiles with an id divisible by blank_step are left fully transparent,
+    # with the default size this matches synthetic_blanks
+
+    rng = random.Random(seed)
+    tiles_x, tiles_y = width // 8, height // 8
+
+    pixels: np.ndarray = np.zeros((height, width, 4), dtype=np.uint8)
+
+    for tile_id in range(tiles_x * tiles_y):
+        if tile_id % blank_step == 0:
+            continue
+
+        # a single visible pixel is enough to make the tile non-blank
+        pixel_x: int = tile_id % tiles_x * 8 + rng.randrange(8)
+        pixel_y: int = tile_id // tiles_x * 8 + rng.randrange(8)
+        pixels[pixel_y, pixel_x] = (rng.randrange(256), 0, 0, rng.randrange(1, 256))
+
+    return Image.fromarray(pixels, 'RGBA')
+
+
+def synthetic_layer(
+    layer_id: str,
+    tiles: int,
+    blank_ratio: float,
+    rng: random.Random,
+    blank_step: int = 16
+) -> dict:
+
+    width: int = max(1, int(tiles ** 0.5))
+    grid_tiles: list[dict] = []
+
+    for index in range(tiles):
+        if rng.random() < blank_ratio:
+            tile_id: int = rng.randrange(0, TILE_IDS, blank_step)
+        else:
+            tile_id: int = rng.randrange(TILE_IDS - 1) | 1
+
+        px: list[int] = [index % width * 8, index // width * 8]
+        src: list[int] = [tile_id % 64 * 8, tile_id // 64 * 8]
+        grid_tiles.append({'px': px, 'src': src, 'f': 0, 't': tile_id, 'd': [index], 'a': 1})
+
+    return {
+        '__identifier': layer_id,
+        '__type': 'Tiles',
+        '__cWid': width,
+        '__cHei': (tiles + width - 1) // width,
+        '__gridSize': 8,
+        'gridTiles': grid_tiles,
+    }
+
+
+def synthetic_level(
+    index: int,
+    layers: int,
+    tiles: int,
+    blank_ratio: float,
+    rng: random.Random
+) -> dict:
+
+    layer_ids: list[str] = list(LDtkLevel.LAYERS)
+    layer_instances: list[dict] = [
+        synthetic_layer(layer_ids[n % len(layer_ids)], tiles, blank_ratio, rng)
+        for n in range(layers)
+    ]
+
+    return {
+        '__header__': {'fileType': 'LDtk Level', 'app': 'LDtk'},
+        'identifier': f'Level_{index}',
+        'iid': f'00000000-0000-0000-0000-{index:012d}',
+        'uid': index,
+        'pxWid': layer_instances[0]['__cWid'] * 8 if layers else 0,
+        'pxHei': layer_instances[0]['__cHei'] * 8 if layers else 0,
+        'layerInstances': layer_instances,
+    }
+
+
+def synthetic_map(
+    levels: int = 10,
+    layers: int = 6,
+    tiles: int = 1000,
+    blank_ratio: float = 0.05,
+    seed: int = 0
+) -> dict:
+    # an LDtk project with every level embedded
+
+    rng = random.Random(seed)
+
+    return {
+        '__header__': {'fileType': 'LDtk Project JSON', 'app': 'LDtk'},
+        'jsonVersion': '1.3.3',
+        'externalLevels': False,
+        'defs': {
+            'layers': [{'identifier': layer_id} for layer_id in LDtkLevel.LAYERS],
+            'entities': [],
+            'tilesets': [{'identifier': tileset.name} for tileset in Tileset],
+            'levelFields': [],
+            'enums': [],
+        },
+        'levels': [
+            synthetic_level(index, layers, tiles, blank_ratio, rng)
+            for index in range(levels)
+        ],
+    }
+
+
+def synthetic_project(
+    levels: int = 10,
+    layers: int = 6,
+    tiles: int = 1000,
+    blank_ratio: float = 0.05,
+    seed: int = 0,
+    project_name: str = 'bench'
+) -> tuple[dict, dict[str, dict]]:
+    # an LDtk project saving its levels to separate .ldtkl files,
+    # returns the project and the level files by relative path
+
+    project: dict = synthetic_map(levels, layers, tiles, blank_ratio, seed)
+    project['externalLevels'] = True
+
+    level_files: dict[str, dict] = {}
+
+    for level in project['levels']:
+        rel_path: str = f'{project_name}/{level["identifier"]}.ldtkl'
+        level_files[rel_path] = dict(level)
+
+        level['layerInstances'] = None
+        level['externalRelPath'] = rel_path
+
+    return project, level_files
@@ -1,27 +1,147 @@
 
+import multiprocessing
 import asyncio
+import time
+import os
 
 from src.validator import Validator
+from src.refresh import RefreshChannel
+from src.metrics import metrics
+from src.config import Config
 from src.jimbot import Jimbot
 from src.logger import log
 
 
-async def main():
+async def main(shard_ids: list[int] | None = None, owner: bool = True, refresh_channel: RefreshChannel | None = None):
 
-    log.info('starting jimbot')
-    jimbot: Jimbot = Jimbot()
+    log.info('starting jimbot' if shard_ids is None else f'starting jimbot with shards {shard_ids}')
+    jimbot: Jimbot = Jimbot(shard_ids, Config.SHARD_COUNT or None)
 
     validator: Validator = Validator()
+    validator.refresh_channel = refresh_channel
     jimbot.validator = validator
 
     with open('token', 'r') as token_file:
         bot_token: str = token_file.read()
 
-    await asyncio.gather(
+    if Config.METRICS_PORT:
+        await metrics.serve(Config.METRICS_HOST, Config.METRICS_PORT)
+
+    tasks: list[asyncio.Task] = [
         asyncio.create_task(jimbot.start(bot_token)),
-        asyncio.create_task(validator.update_task())
-    )
+        asyncio.create_task(validator.update_task() if owner else validator.follow_task())
+    ]
+
+    if owner and refresh_channel is not None:
+        tasks.append(asyncio.create_task(validator.serve_refreshes()))
+
+    await asyncio.gather(*tasks)
+
+
+def process_path(file_path: str, index: int) -> str:
+    # responses.json becomes responses.1.json for the second process
+
+    if not file_path:
+        return file_path
+
+    root, extension = os.path.splitext(file_path)
+    return f'{root}.{index}{extension}'
+
+
+def run_process(index: int, refresh_requests, refresh_replies: dict) -> None:
+
+    # every process keeps its own responses, history and caches, only
+    # profiles are shared as their file names never collide
+    Config.RESPONSE_FILE = process_path(Config.RESPONSE_FILE, index)
+    Config.LEVEL_HISTORY_FILE = process_path(Config.LEVEL_HISTORY_FILE, index)
+    Config.CHANGELOG_FILE = process_path(Config.CHANGELOG_FILE, index)
+    Config.RESULT_CACHE_DIR = process_path(Config.RESULT_CACHE_DIR, index)
+
+    # the archive index lives in memory, each process enforces its
+    # share of the quota on a subdirectory no other process writes to
+    if Config.ARCHIVE_DIR:
+        Config.ARCHIVE_DIR = os.path.join(Config.ARCHIVE_DIR, str(index))
+        Config.ARCHIVE_MAX_SIZE //= Config.SHARD_PROCESSES
+
+    if Config.METRICS_PORT:
+        Config.METRICS_PORT += index
+
+    shard_ids: list[int] = list(range(index, Config.SHARD_COUNT, Config.SHARD_PROCESSES))
+    refresh_channel = RefreshChannel(index, refresh_requests, refresh_replies)
+    asyncio.run(main(shard_ids, owner=index == 0, refresh_channel=refresh_channel))
+
+
+def supervise() -> None:
+
+    if Config.SHARD_COUNT < Config.SHARD_PROCESSES:
+        raise SystemExit('JIMBOT_SHARD_COUNT must be at least JIMBOT_SHARD_PROCESSES')
+
+    if not Config.SNAPSHOT_FILE:
+        raise SystemExit('JIMBOT_SNAPSHOT_FILE is needed to share state between processes')
+
+    context = multiprocessing.get_context('spawn')
+    processes: dict[int, multiprocessing.Process] = {}
+
+    # outlive the processes, a restarted owner keeps serving the same queues
+    refresh_requests = context.Queue()
+    refresh_replies: dict = {index: context.Queue() for index in range(Config.SHARD_PROCESSES)}
+    started_at: dict[int, float] = {}
+    restart_at: dict[int, float] = {}
+    failures: dict[int, int] = {}
+
+    def start(index: int) -> None:
+        processes[index] = context.Process(
+            target=run_process, args=(index, refresh_requests, refresh_replies), name=f'jimbot-{index}'
+        )
+        processes[index].start()
+        started_at[index] = time.monotonic()
+
+    def stop_all() -> None:
+        for process in processes.values():
+            process.terminate()
+            process.join()
+
+    log.info(f'starting {Config.SHARD_PROCESSES} processes for {Config.SHARD_COUNT} shards')
+    for index in range(Config.SHARD_PROCESSES):
+        failures[index] = 0
+        start(index)
+
+    try:
+        # a crashed process is restarted alone, the others keep their shards
+        # connected, a process failing right after every start backs off
+        # exponentially and the deployment stops once it keeps failing
+        while True:
+            time.sleep(1)
+            now: float = time.monotonic()
+
+            for index, process in processes.items():
+                if process.is_alive() or index in restart_at:
+                    continue
+
+                # a process that ran for a while crashed for another reason
+                if now - started_at[index] > Config.RESTART_STABLE:
+                    failures[index] = 0
+
+                failures[index] += 1
+                if failures[index] > Config.RESTART_LIMIT:
+                    log.error(f'process {index} crashed {failures[index]} times in a row, stopping')
+                    stop_all()
+                    raise SystemExit(1)
+
+                delay: float = min(Config.RESTART_MAX_BACKOFF, Config.RESTART_BACKOFF * 2 ** (failures[index] - 1))
+                restart_at[index] = now + delay
+                log.error(f'process {index} exited with {process.exitcode}, restarting in {delay:.0f}s')
+
+            for index, due in list(restart_at.items()):
+                if due <= now:
+                    del restart_at[index]
+                    start(index)
 
+    except KeyboardInterrupt:
+        stop_all()
 
 if __name__ == '__main__':
-    asyncio.run(main())
+    if Config.SHARD_PROCESSES > 1:
+        supervise()
+    else:
+        asyncio.run(main())
@@ -0,0 +1,234 @@
+import hashlib
+import asyncio
+import time
+import gzip
+import zlib
+import re
+import os
+
+import aiofiles
+import aiopath
+
+from collections import OrderedDict
+
+from src.metrics import metrics
+from src.logger import log
+
+
+ARCHIVE_METRIC: str = 'jimbot_archive_seconds'
+metrics.describe(ARCHIVE_METRIC, 'Duration of compressing and storing uploaded maps')
+
+
+class ArchiveStream:
+
+    # compresses a streamed upload into a temporary file,
+    # which is moved into the archive once the digest is known
+
+    def __init__(self, archive, file_name: str) -> None:
+        self.compressor = zlib.compressobj(archive.level, zlib.DEFLATED, 31)
+        self.temp_path: str = archive.temp_path()
+        self.file_name: str = file_name
+        self.archive = archive
+        self.file = None
+        self.size: int = 0
+
+    async def open(self) -> None:
+        self.file = await aiofiles.open(self.temp_path, 'wb')
+
+    async def write(self, chunk: bytes) -> None:
+        compressed: bytes = await asyncio.to_thread(self.compressor.compress, chunk)
+        self.size += len(compressed)
+
+        if compressed:
+            await self.file.write(compressed)
+
+    async def close(self, digest: str) -> None:
+
+        try:
+            with metrics.timer(ARCHIVE_METRIC, step='stream'):
+                tail: bytes = self.compressor.flush()
+                self.size += len(tail)
+
+                await self.file.write(tail)
+                await self.file.close()
+
+                await self.archive.commit(digest, self.file_name, self.temp_path, self.size)
+
+        except Exception as e:
+            log.warn('failed archiving map:', e)
+            await self.abort()
+
+    async def abort(self) -> None:
+
+        if self.file is not None:
+            await self.file.close()
+
+        await aiopath.AsyncPath(self.temp_path).unlink(missing_ok=True)
+
+
+class MapArchive:
+
+    # keeps a gzip copy of every uploaded map, identical uploads are stored
+    # once and the least recently uploaded maps are removed when the archive
+    # exceeds max_size bytes or entries get older than max_age seconds
+
+    FILE_PATTERN = re.compile(r'^([0-9a-f]{64})_.*\.gz$')
+
+    def __init__(self, directory: str, max_size: int, max_age: float, level: int = 6) -> None:
+        self.entries: OrderedDict[str, tuple[str, int, float]] = OrderedDict()
+        self.directory: str | None = directory or None
+        self.tasks: set[asyncio.Task] = set()
+        self.temp_count: int = 0
+        self.max_size: int = max_size
+        self.max_age: float = max_age
+        self.level: int = level
+        self.size: int = 0
+
+        metrics.collect('jimbot_archive_bytes', 'gauge', lambda: self.size)
+        metrics.collect('jimbot_archive_maps', 'gauge', lambda: len(self.entries))
+
+    @property
+    def enabled(self) -> bool:
+        return self.directory is not None
+
+    def file_path(self, digest: str, file_name: str) -> str:
+        safe_name: str = re.sub(r'[^\w.-]', '_', os.path.basename(file_name))[:64]
+        return os.path.join(self.directory, f'{digest}_{safe_name}.gz')
+
+    def temp_path(self) -> str:
+        self.temp_count += 1
+        return os.path.join(self.directory, f'.upload-{os.getpid()}-{self.temp_count}.tmp')
+
+    def spawn(self, coro) -> None:
+        # archiving never delays a response, tasks are kept
+        # referenced until they finish so they are not collected
+
+        task: asyncio.Task = asyncio.create_task(coro)
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+
+    def submit(self, file_name: str, map_data: bytes, digest: str | None = None) -> None:
+
+        if self.enabled:
+            self.spawn(self.store(file_name, map_data, digest))
+
+    async def open_stream(self, file_name: str) -> ArchiveStream | None:
+
+        if not self.enabled:
+            return None
+
+        try:
+            await aiopath.AsyncPath(self.directory).mkdir(parents=True, exist_ok=True)
+            archive_stream = ArchiveStream(self, file_name)
+            await archive_stream.open()
+            return archive_stream
+
+        except Exception as e:
+            log.warn('failed archiving map:', e)
+
+    async def store(self, file_name: str, map_data: bytes, digest: str | None = None) -> None:
+
+        try:
+            with metrics.timer(ARCHIVE_METRIC, step='store'):
+                if digest is None:
+                    map_hash = await asyncio.to_thread(hashlib.sha256, map_data)
+                    digest = map_hash.hexdigest()
+
+                if await self.touch(digest):
+                    return
+
+                compressed: bytes = await asyncio.to_thread(
+                    gzip.compress, map_data, self.level, mtime=0
+                )
+
+                await aiopath.AsyncPath(self.directory).mkdir(parents=True, exist_ok=True)
+
+                temp_path: str = self.temp_path()
+                async with aiofiles.open(temp_path, 'wb') as archive_file:
+                    await archive_file.write(compressed)
+
+                await self.commit(digest, file_name, temp_path, len(compressed))
+
+        except Exception as e:
+            log.warn('failed archiving map:', e)
+
+    async def commit(self, digest: str, file_name: str, temp_path: str, size: int) -> None:
+
+        if await self.touch(digest):
+            await aiopath.AsyncPath(temp_path).unlink(missing_ok=True)
+            return
+
+        file_path: str = self.file_path(digest, file_name)
+        await asyncio.to_thread(os.replace, temp_path, file_path)
+
+        self.entries[digest] = (file_path, size, time.time())
+        self.size += size
+        metrics.increment('jimbot_archive_stored_total')
+
+        await self.enforce()
+
+    async def touch(self, digest: str) -> bool:
+        # identical upload, refresh its age instead of storing it again
+
+        if digest not in self.entries:
+            return False
+
+        file_path, size, _ = self.entries[digest]
+        self.entries[digest] = (file_path, size, time.time())
+        self.entries.move_to_end(digest)
+        metrics.increment('jimbot_archive_duplicates_total')
+
+        try:
+            await asyncio.to_thread(os.utime, file_path)
+
+        except OSError:
+            pass
+
+        return True
+
+    async def enforce(self) -> None:
+
+        expired_before: float = time.time() - self.max_age
+
+        # entries are ordered by their last upload, oldest first
+        while self.entries:
+            digest, (file_path, size, stored_at) = next(iter(self.entries.items()))
+
+            if self.size <= self.max_size and stored_at >= expired_before:
+                break
+
+            del self.entries[digest]
+            self.size -= size
+            await aiopath.AsyncPath(file_path).unlink(missing_ok=True)
+
+    def scan(self) -> list[tuple[str, str, int, float]]:
+
+        found: list[tuple[str, str, int, float]] = []
+
+        for dir_entry in os.scandir(self.directory):
+            if dir_entry.name.endswith('.tmp'):
+                os.remove(dir_entry.path)
+                continue
+
+            if (match := self.FILE_PATTERN.match(dir_entry.name)) is None:
+                continue
+
+            stat: os.stat_result = dir_entry.stat()
+            found.append((match.group(1), dir_entry.path, stat.st_size, stat.st_mtime))
+
+        return sorted(found, key=lambda entry: entry[3])
+
+    async def load(self) -> None:
+
+        if not self.enabled or not await aiopath.AsyncPath(self.directory).exists():
+            return
+
+        try:
+            for digest, file_path, size, stored_at in await asyncio.to_thread(self.scan):
+                self.entries[digest] = (file_path, size, stored_at)
+                self.size += size
+
+            await self.enforce()
+
+        except Exception as e:
+            log.warn('failed loading archive:', e)
@@ -0,0 +1,367 @@
+import hashlib
+import asyncio
+import pickle
+import json
+import time
+import os
+
+import aiofiles
+import aiopath
+
+from collections import OrderedDict
+
+from src.logger import log
+
+
+class ResultCache:
+
+    # results of validations and updates keyed by the content of the upload,
+    # least recently used entries are evicted once max_size bytes are held
+
+    def __init__(self, max_size: int, cache_dir: str | None = None) -> None:
+        self.entries: OrderedDict[str, tuple[any, int]] = OrderedDict()
+        self.cache_dir: str | None = cache_dir or None
+        self.max_size: int = max_size
+        self.size: int = 0
+
+        self.hits: int = 0
+        self.misses: int = 0
+
+    @staticmethod
+    def make_key(kind: str, digest: str, version: int, fingerprint: str) -> str:
+        key_source: str = f'{kind}:{digest}:{version}:{fingerprint}'
+        return hashlib.sha256(key_source.encode()).hexdigest()
+
+    def get(self, key: str) -> any:
+
+        entry: tuple[any, int] | None = self.entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return
+
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return entry[0]
+
+    async def put(self, key: str, value: any, size: int) -> None:
+
+        if size > self.max_size:
+            return
+
+        if key in self.entries:
+            self.entries.move_to_end(key)
+            return
+
+        self.entries[key] = (value, size)
+        self.size += size
+
+        while self.size > self.max_size:
+            evicted_key, (_, evicted_size) = self.entries.popitem(last=False)
+            self.size -= evicted_size
+            await self.remove_file(evicted_key)
+
+        if self.cache_dir is None:
+            return
+
+        try:
+            await aiopath.AsyncPath(self.cache_dir).mkdir(exist_ok=True)
+            async with aiofiles.open(os.path.join(self.cache_dir, key), 'wb') as file:
+                await file.write(pickle.dumps((value, size)))
+
+        except Exception as e:
+            log.warn('failed persisting cached result:', e)
+
+    async def remove_file(self, key: str) -> None:
+
+        if self.cache_dir is None:
+            return
+
+        try:
+            await aiopath.AsyncPath(os.path.join(self.cache_dir, key)).unlink(missing_ok=True)
+
+        except Exception as e:
+            log.warn('failed removing cached result:', e)
+
+    async def load(self) -> None:
+        # restore persisted entries, oldest first so the
+        # most recently written ones are evicted last
+
+        if self.cache_dir is None or not await aiopath.AsyncPath(self.cache_dir).exists():
+            return
+
+        def read_entries() -> list[tuple[str, any, int]]:
+            paths: list[os.DirEntry] = sorted(
+                os.scandir(self.cache_dir), key=lambda entry: entry.stat().st_mtime
+            )
+
+            loaded: list[tuple[str, any, int]] = []
+            for path in paths:
+                with open(path.path, 'rb') as file:
+                    value, size = pickle.load(file)
+                loaded.append((path.name, value, size))
+
+            return loaded
+
+        try:
+            for key, value, size in await asyncio.to_thread(read_entries):
+                self.entries[key] = (value, size)
+                self.size += size
+
+        except Exception as e:
+            log.warn('failed loading cached results:', e)
+
+        while self.size > self.max_size:
+            evicted_key, (_, evicted_size) = self.entries.popitem(last=False)
+            self.size -= evicted_size
+            await self.remove_file(evicted_key)
+
+        log.info(f'loaded {len(self.entries)} cached results')
+
+    async def clear(self) -> None:
+
+        log.info(f'clearing result cache, hits: {self.hits} misses: {self.misses}')
+
+        for key in list(self.entries):
+            await self.remove_file(key)
+
+        self.entries.clear()
+        self.size = 0
+
+
+class ChangelogCache:
+
+    # changelogs of released versions never change and are kept forever,
+    # the latest version and missing changelogs expire after ttl seconds
+
+    def __init__(self, ttl: float, file_path: str | None = None) -> None:
+        self.entries: dict[int, tuple[dict | None, float]] = {}
+        self.file_path: str | None = file_path or None
+        self.ttl: float = ttl
+
+        self.hits: int = 0
+        self.misses: int = 0
+
+    def get(self, version: int, latest_version: int) -> tuple[bool, dict | None]:
+        # returns (True, changelog) when the entry can be used,
+        # changelog is None for versions without a changelog
+
+        entry: tuple[dict | None, float] | None = self.entries.get(version)
+        if entry is None:
+            self.misses += 1
+            return False, None
+
+        changelog, fetched_at = entry
+        is_final: bool = changelog is not None and version < latest_version
+
+        if not is_final and time.time() - fetched_at > self.ttl:
+            self.misses += 1
+            return False, None
+
+        self.hits += 1
+        return True, changelog
+
+    async def put(self, version: int, changelog: dict | None) -> None:
+        self.entries[version] = (changelog, time.time())
+        await self.save()
+
+    async def save(self) -> None:
+
+        if self.file_path is None:
+            return
+
+        serialized: dict = {
+            str(version): {'changelog': changelog, 'fetched_at': fetched_at}
+            for version, (changelog, fetched_at) in self.entries.items()
+        }
+
+        try:
+            async with aiofiles.open(self.file_path, 'w') as file:
+                await file.write(json.dumps(serialized))
+
+        except Exception as e:
+            log.warn('failed saving changelogs:', e)
+
+    async def load(self) -> None:
+
+        if self.file_path is None or not await aiopath.AsyncPath(self.file_path).exists():
+            return
+
+        try:
+            async with aiofiles.open(self.file_path, 'r') as file:
+                serialized: dict = json.loads(await file.read())
+
+            for version, entry in serialized.items():
+                self.entries[int(version)] = (entry['changelog'], entry['fetched_at'])
+
+        except Exception as e:
+            log.warn('failed loading changelogs:', e)
+
+
+class LevelHistory:
+
+    # per-level fingerprints and results of the last upload of every
+    # (author, file name), re-uploads only recount the levels that changed
+
+    def __init__(self, max_size: int, file_path: str | None = None, save_delay: float = 5.0) -> None:
+        self.entries: OrderedDict[str, tuple[str, list]] = OrderedDict()
+        self.file_path: str | None = file_path or None
+        self.save_task: asyncio.Task | None = None
+        self.save_delay: float = save_delay
+        self.max_size: int = max_size
+
+    @staticmethod
+    def make_key(owner_id: int, file_name: str) -> str:
+        return f'{owner_id}/{file_name}'
+
+    def get(self, owner_id: int, file_name: str) -> tuple[str, list] | None:
+        # returns the fingerprint of the blank tables the levels were
+        # counted with and (identifier, digest, errors, warnings) per level
+
+        key: str = self.make_key(owner_id, file_name)
+        if key not in self.entries:
+            return None
+
+        self.entries.move_to_end(key)
+        return self.entries[key]
+
+    async def put(self, owner_id: int, file_name: str, fingerprint: str, levels: list) -> None:
+
+        key: str = self.make_key(owner_id, file_name)
+        self.entries[key] = (fingerprint, levels)
+        self.entries.move_to_end(key)
+
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+
+        self.schedule_save()
+
+    def schedule_save(self) -> None:
+        # uploads arriving within save_delay seconds are written together
+
+        if self.file_path is None or self.save_task is not None:
+            return
+
+        self.save_task = asyncio.create_task(self.delayed_save())
+
+    async def delayed_save(self) -> None:
+        await asyncio.sleep(self.save_delay)
+        self.save_task = None
+        await self.save()
+
+    async def save(self) -> None:
+
+        if self.file_path is None:
+            return
+
+        # entries are replaced and never changed in place, a shallow
+        # copy is safe to serialize on a thread while uploads continue
+        serialized: dict = {
+            key: {'fingerprint': fingerprint, 'levels': levels}
+            for key, (fingerprint, levels) in self.entries.items()
+        }
+
+        try:
+            history_data: str = await asyncio.to_thread(json.dumps, serialized, separators=(',', ':'))
+
+            async with aiofiles.open(self.file_path, 'w') as file:
+                await file.write(history_data)
+
+        except Exception as e:
+            log.warn('failed saving level history:', e)
+
+    async def load(self) -> None:
+
+        if self.file_path is None or not await aiopath.AsyncPath(self.file_path).exists():
+            return
+
+        try:
+            async with aiofiles.open(self.file_path, 'r') as file:
+                serialized: dict = json.loads(await file.read())
+
+            for key, entry in serialized.items():
+                self.entries[key] = (entry['fingerprint'], [tuple(level) for level in entry['levels']])
+
+        except Exception as e:
+            log.warn('failed loading level history:', e)
+
+
+class ResponseStore:
+
+    # maps bot responses to the user allowed to delete them, keeps at most
+    # max_size entries for ttl seconds so the wastebasket survives restarts
+
+    def __init__(self, max_size: int, ttl: float, file_path: str | None = None) -> None:
+        self.entries: OrderedDict[int, tuple[int, float]] = OrderedDict()
+        self.file_path: str | None = file_path or None
+        self.max_size: int = max_size
+        self.ttl: float = ttl
+
+    def get(self, message_id: int) -> int | None:
+
+        entry: tuple[int, float] | None = self.entries.get(message_id)
+        if entry is None:
+            return None
+
+        owner_id, created_at = entry
+        if time.time() - created_at > self.ttl:
+            del self.entries[message_id]
+            return None
+
+        return owner_id
+
+    def prune(self) -> None:
+
+        expired_before: float = time.time() - self.ttl
+
+        # entries are kept in insertion order, oldest first
+        while self.entries:
+            message_id, (_, created_at) = next(iter(self.entries.items()))
+
+            if created_at >= expired_before and len(self.entries) <= self.max_size:
+                break
+
+            del self.entries[message_id]
+
+    async def put(self, message_id: int, owner_id: int) -> None:
+        self.entries[message_id] = (owner_id, time.time())
+        self.prune()
+        await self.save()
+
+    async def remove(self, message_id: int) -> None:
+
+        if self.entries.pop(message_id, None) is not None:
+            await self.save()
+
+    async def save(self) -> None:
+
+        if self.file_path is None:
+            return
+
+        serialized: list = [
+            [message_id, owner_id, int(created_at)]
+            for message_id, (owner_id, created_at) in self.entries.items()
+        ]
+
+        try:
+            async with aiofiles.open(self.file_path, 'w') as file:
+                await file.write(json.dumps(serialized, separators=(',', ':')))
+
+        except Exception as e:
+            log.warn('failed saving responses:', e)
+
+    async def load(self) -> None:
+
+        if self.file_path is None or not await aiopath.AsyncPath(self.file_path).exists():
+            return
+
+        try:
+            async with aiofiles.open(self.file_path, 'r') as file:
+                serialized: list = json.loads(await file.read())
+
+            for message_id, owner_id, created_at in serialized:
+                self.entries[message_id] = (owner_id, created_at)
+
+            self.prune()
+
+        except Exception as e:
+            log.warn('failed loading responses:', e)
@@ -0,0 +1,146 @@
+from src.utils import env_ids, env_int, env_str
+
+
+class Config:
+
+    # worker processes for map validation and updates, 0 runs them inline
+    POOL_SIZE: int = env_int('JIMBOT_POOL_SIZE', 2)
+
+    # validate uploads while they download instead of buffering them
+    STREAM_VALIDATE: bool = env_int('JIMBOT_STREAM_VALIDATE', 1) > 0
+
+    # largest upload accepted by the streaming validator, in bytes
+    STREAM_MAX_SIZE: int = env_int('JIMBOT_STREAM_MAX_SIZE', 100_000_000)
+
+    # total bytes of cached validation and update results
+    RESULT_CACHE_SIZE: int = env_int('JIMBOT_RESULT_CACHE_SIZE', 64_000_000)
+
+    # directory to persist cached results in, empty keeps them in memory only
+    RESULT_CACHE_DIR: str = env_str('JIMBOT_RESULT_CACHE_DIR', '')
+
+    # seconds before the latest or a missing changelog is fetched again
+    CHANGELOG_TTL: int = env_int('JIMBOT_CHANGELOG_TTL', 10 * 60)
+
+    # file to persist fetched changelogs in, empty keeps them in memory only
+    CHANGELOG_FILE: str = env_str('JIMBOT_CHANGELOG_FILE', 'changelogs.json')
+
+    # longest side in pixels of the level previews rendered by !validate --preview
+    PREVIEW_MAX_SIZE: int = env_int('JIMBOT_PREVIEW_MAX_SIZE', 1024)
+
+    # levels rendered per !validate --preview
+    PREVIEW_LIMIT: int = env_int('JIMBOT_PREVIEW_LIMIT', 4)
+
+    # game website serving the version, changelogs and tilesets
+    BASE_URL: str = env_str('JIMBOT_BASE_URL', 'https://talesofyore.com').rstrip('/')
+
+    # user ids allowed to run admin commands besides server administrators
+    ADMINS: set[int] = env_ids('JIMBOT_ADMINS', '503592464934764554')
+
+    # local port serving Prometheus metrics on /metrics, 0 disables it
+    METRICS_PORT: int = env_int('JIMBOT_METRICS_PORT', 0)
+    METRICS_HOST: str = env_str('JIMBOT_METRICS_HOST', '127.0.0.1')
+
+    # validations processed at once, further uploads wait in the queue
+    MAX_VALIDATIONS: int = env_int('JIMBOT_MAX_VALIDATIONS', 4)
+
+    # estimated bytes of memory the running validations may use together
+    VALIDATION_MEMORY: int = env_int('JIMBOT_VALIDATION_MEMORY', 256_000_000)
+
+    # uploads allowed to wait for a free slot
+    MAX_QUEUED: int = env_int('JIMBOT_MAX_QUEUED', 20)
+
+    # concurrent validations per user and per channel
+    VALIDATIONS_PER_USER: int = env_int('JIMBOT_VALIDATIONS_PER_USER', 1)
+    VALIDATIONS_PER_CHANNEL: int = env_int('JIMBOT_VALIDATIONS_PER_CHANNEL', 2)
+
+    # seconds a user has to wait between two uploads
+    VALIDATE_COOLDOWN: int = env_int('JIMBOT_VALIDATE_COOLDOWN', 10)
+
+    # seconds between two uploads in the same channel
+    CHANNEL_COOLDOWN: int = env_int('JIMBOT_CHANNEL_COOLDOWN', 3)
+
+    # gateway intents, 'lean' for what the handlers use, 'all' or a comma separated list
+    INTENTS: str = env_str('JIMBOT_INTENTS', 'lean')
+
+    # member cache flags, 'intents' to derive them from the intents, 'none' or a comma separated list
+    MEMBER_CACHE: str = env_str('JIMBOT_MEMBER_CACHE', 'intents')
+
+    # messages kept in the client message cache, 0 disables it
+    MAX_MESSAGES: int = env_int('JIMBOT_MAX_MESSAGES', 200)
+
+    # bot responses remembered for deletion by their owner and for how many seconds
+    RESPONSE_STORE_SIZE: int = env_int('JIMBOT_RESPONSE_STORE_SIZE', 10_000)
+    RESPONSE_TTL: int = env_int('JIMBOT_RESPONSE_TTL', 604_800)
+
+    # file to persist deletable responses in, empty keeps them in memory only
+    RESPONSE_FILE: str = env_str('JIMBOT_RESPONSE_FILE', 'responses.json')
+
+    # directory uploaded maps are archived in with gzip, empty disables archiving
+    ARCHIVE_DIR: str = env_str('JIMBOT_ARCHIVE_DIR', 'saved')
+
+    # archived maps are removed oldest first past this many bytes or seconds
+    ARCHIVE_MAX_SIZE: int = env_int('JIMBOT_ARCHIVE_MAX_SIZE', 1_000_000_000)
+    ARCHIVE_MAX_AGE: int = env_int('JIMBOT_ARCHIVE_MAX_AGE', 2_592_000)
+
+    # gzip compression level of archived maps
+    ARCHIVE_LEVEL: int = env_int('JIMBOT_ARCHIVE_LEVEL', 6)
+
+    # re-uploads of a file by the same user only recount changed levels
+    INCREMENTAL_VALIDATE: bool = env_int('JIMBOT_INCREMENTAL_VALIDATE', 1) > 0
+
+    # uploads whose level fingerprints are remembered, and the file they persist in
+    LEVEL_HISTORY_SIZE: int = env_int('JIMBOT_LEVEL_HISTORY_SIZE', 500)
+    LEVEL_HISTORY_FILE: str = env_str('JIMBOT_LEVEL_HISTORY_FILE', 'levels.json')
+
+    # binary snapshot of version, blank tiles and defs restored at startup, empty disables it
+    SNAPSHOT_FILE: str = env_str('JIMBOT_SNAPSHOT_FILE', 'snapshot.bin')
+
+    # seconds before a request to the game website is abandoned
+    REQUEST_TIMEOUT: int = env_int('JIMBOT_REQUEST_TIMEOUT', 30)
+
+    # seconds between version checks, and between checks in the release hours
+    POLL_INTERVAL: int = env_int('JIMBOT_POLL_INTERVAL', 12 * 60 * 60)
+    RELEASE_POLL_INTERVAL: int = env_int('JIMBOT_RELEASE_POLL_INTERVAL', 10 * 60)
+
+    # UTC hours releases usually happen in, hours of detected releases are added
+    RELEASE_HOURS: set[int] = env_ids('JIMBOT_RELEASE_HOURS', '')
+
+    # seconds to wait after a failed version check, doubling up to the maximum
+    POLL_BACKOFF: int = env_int('JIMBOT_POLL_BACKOFF', 30)
+    POLL_MAX_BACKOFF: int = env_int('JIMBOT_POLL_MAX_BACKOFF', 60 * 60)
+
+    # connections kept open to the game website and the attachment host
+    HTTP_CONNECTIONS: int = env_int('JIMBOT_HTTP_CONNECTIONS', 16)
+
+    # log output, 'text' for colored lines or 'json' for JSON lines with correlation ids
+    LOG_FORMAT: str = env_str('JIMBOT_LOG_FORMAT', 'text')
+
+    # log debug messages as well
+    LOG_DEBUG: bool = env_int('JIMBOT_LOG_DEBUG', 0) > 0
+
+    # directory !profile and sampled calls write their reports to, and how many are kept
+    PROFILE_DIR: str = env_str('JIMBOT_PROFILE_DIR', 'profiles')
+    PROFILE_KEEP: int = env_int('JIMBOT_PROFILE_KEEP', 50)
+
+    # percentage of !validate and !changelog calls profiled continuously, 0 disables it
+    PROFILE_SAMPLE_RATE: int = env_int('JIMBOT_PROFILE_SAMPLE_RATE', 0)
+
+    # processes the shards are split between, the first owns the version refresh
+    SHARD_PROCESSES: int = env_int('JIMBOT_SHARD_PROCESSES', 1)
+
+    # total gateway shards, 0 uses the count recommended by Discord in a single process
+    SHARD_COUNT: int = env_int('JIMBOT_SHARD_COUNT', 0)
+
+    # seconds between checks of other processes for a new snapshot from the owner
+    SNAPSHOT_POLL_INTERVAL: int = env_int('JIMBOT_SNAPSHOT_POLL_INTERVAL', 5)
+
+    # seconds other processes wait for the owner to run a !refresh they forwarded
+    REFRESH_TIMEOUT: int = env_int('JIMBOT_REFRESH_TIMEOUT', 120)
+
+    # seconds before a crashed shard process is restarted, doubling while it keeps crashing
+    RESTART_BACKOFF: int = env_int('JIMBOT_RESTART_BACKOFF', 5)
+    RESTART_MAX_BACKOFF: int = env_int('JIMBOT_RESTART_MAX_BACKOFF', 300)
+
+    # crashes in a row, each within the stable seconds of its start, before the bot stops
+    RESTART_LIMIT: int = env_int('JIMBOT_RESTART_LIMIT', 5)
+    RESTART_STABLE: int = env_int('JIMBOT_RESTART_STABLE', 600)
@@ -1,34 +1,90 @@
 
 import random
+import io
 
 from urllib import parse
 from datetime import datetime
 
 from discord import (
+    RawReactionActionEvent,
+    RawMessageDeleteEvent,
+    AutoShardedClient,
+    MemberCacheFlags,
+    PartialMessage,
     ActivityType,
     Attachment,
     Activity,
     Message,
     Intents,
     Status,
-    Client,
+    Object,
     Embed,
     Color,
     File
 )
 
-from src.validator import Validator
-from src.utils import handle
-from src.logger import log
+from src.scheduler import ValidationScheduler, QueueFull
+from src.profiler import Profiler
+from src.utils import handle, restrict
+from src.logger import correlate, log
+from src.cache import ResponseStore
+from src.validator import Validator, WorkerCrashed
+from src.metrics import metrics
+from src.config import Config
 
 
-class Jimbot(Client):
+# guild and role data, messages with their content and reactions in guilds
+LEAN_INTENTS: tuple[str, ...] = ('guilds', 'guild_messages', 'message_content', 'guild_reactions')
 
-    def __init__(self) -> None:
-        intents: Intents = Intents.all()
-        super().__init__(intents=intents)
+
+def make_intents(profile: str) -> Intents:
+
+    if profile == 'all':
+        return Intents.all()
+
+    names: list[str] = list(LEAN_INTENTS) if profile == 'lean' else profile.split(',')
+    return Intents(**{name.strip(): True for name in names if name.strip()})
+
+
+def make_member_cache(profile: str, intents: Intents) -> MemberCacheFlags:
+
+    if profile == 'intents':
+        return MemberCacheFlags.from_intents(intents)
+
+    if profile == 'none':
+        return MemberCacheFlags.none()
+
+    return MemberCacheFlags(**{name.strip(): True for name in profile.split(',') if name.strip()})
+
+
+class Jimbot(AutoShardedClient):
+
+    # shard_ids selects the shards this process connects, a sharded
+    # deployment splits them between processes, None connects them all
+
+    def __init__(self, shard_ids: list[int] | None = None, shard_count: int | None = None) -> None:
+        intents: Intents = make_intents(Config.INTENTS)
+
+        super().__init__(
+            shard_ids=shard_ids,
+            shard_count=shard_count,
+            intents=intents,
+            member_cache_flags=make_member_cache(Config.MEMBER_CACHE, intents),
+            max_messages=Config.MAX_MESSAGES or None,
+            chunk_guilds_at_startup=intents.members
+        )
 
         self.validator: Validator | None = None
+
+        self.scheduler: ValidationScheduler = ValidationScheduler(
+            max_jobs=Config.MAX_VALIDATIONS,
+            memory_budget=Config.VALIDATION_MEMORY,
+            max_queued=Config.MAX_QUEUED,
+            per_user=Config.VALIDATIONS_PER_USER,
+            per_channel=Config.VALIDATIONS_PER_CHANNEL,
+            cooldown=Config.VALIDATE_COOLDOWN,
+            channel_cooldown=Config.CHANNEL_COOLDOWN
+        )
         
         self.excluded_channels: set[int] = {
             1022973454233899169,  # in-game trading
@@ -42,7 +98,17 @@ class Jimbot(Client):
             870770948951924756  # tales of yore
         }
 
-        self.message_reactions: dict[int, int] = {}
+        self.responses: ResponseStore = ResponseStore(
+            max_size=Config.RESPONSE_STORE_SIZE,
+            ttl=Config.RESPONSE_TTL,
+            file_path=Config.RESPONSE_FILE
+        )
+        self.profiler: Profiler = Profiler(
+            directory=Config.PROFILE_DIR,
+            sample_rate=Config.PROFILE_SAMPLE_RATE,
+            sampled_commands={'!validate', '!changelog'},
+            keep=Config.PROFILE_KEEP
+        )
         self.message_handlers: dict[str, any] = {}
 
         handlers = filter(
@@ -59,19 +125,34 @@ class Jimbot(Client):
         watching = Activity(name='!help', type=ActivityType.watching)
         await self.change_presence(status=Status.idle, activity=watching)
     
-    async def on_reaction_add(self, reaction, user):
+    async def setup_hook(self):
+        await self.responses.load()
 
-        if user.id == self.user.id:
+    async def on_raw_reaction_add(self, payload: RawReactionActionEvent):
+
+        if payload.user_id == self.user.id:
             return
 
-        if reaction.message.id not in self.message_reactions:
+        owner_id: int | None = self.responses.get(payload.message_id)
+        if owner_id is None:
             return
 
-        if self.message_reactions[reaction.message.id] == user.id:
-            await reaction.message.delete()
-        
-        else:
-            await reaction.remove(user)
+        channel = self.get_partial_messageable(payload.channel_id)
+        response: PartialMessage = channel.get_partial_message(payload.message_id)
+
+        try:
+            if owner_id == payload.user_id:
+                await response.delete()
+                await self.responses.remove(payload.message_id)
+
+            else:
+                await response.remove_reaction(payload.emoji, Object(id=payload.user_id))
+
+        except Exception as e:
+            log.warn('failed handling reaction:', e)
+
+    async def on_raw_message_delete(self, payload: RawMessageDeleteEvent):
+        await self.responses.remove(payload.message_id)
 
     async def on_message(self, message: Message):
 
@@ -92,8 +173,36 @@ class Jimbot(Client):
         if handler is None:
             return
         
+        if getattr(handler, '_is_restricted', False) and not self.is_admin(message.author):
+            return
+
+        # discord.py runs every event in its own task, the id
+        # only tags the records logged while handling this one
+        correlate(command.lstrip('!'))
+
+        if command != '!profile' and (reason := self.profiler.check(command)) is not None:
+            async with self.profiler.profile(command, reason) as report:
+                await self.run_handler(handler, command, message)
+
+            if reason == 'requested':
+                await message.channel.send(f'```\n{report.summary()[:1900]}\n```')
+
+            return
+
+        await self.run_handler(handler, command, message)
+
+    async def run_handler(self, handler, command: str, message: Message):
         async with message.channel.typing():
-            await handler(message)
+            with metrics.timer('jimbot_command_seconds', command=command):
+                await handler(message)
+
+    def is_admin(self, user) -> bool:
+
+        if user.id in Config.ADMINS:
+            return True
+
+        permissions = getattr(user, 'guild_permissions', None)
+        return permissions is not None and permissions.administrator
 
     @handle
     async def _botjim(self, message: Message):
@@ -171,7 +280,7 @@ class Jimbot(Client):
     async def _help(self, message: Message):
 
         commands_preview: str = \
-            '- !validate (use with your map attached)' + \
+            '- !validate [--preview] (use with your map or project and level files attached)' + \
             '\n- !changelog [version]' + \
             '\n- !wiki <query>' + \
             '\n- !mappers' + \
@@ -209,6 +318,92 @@ class Jimbot(Client):
 
         await message.channel.send(url_wiki)
 
+    @handle
+    @restrict
+    async def _stats(self, message: Message):
+
+        validator: Validator = self.validator
+
+        commands: list[str] = metrics.histogram_summary('jimbot_command_seconds', 'command')
+        phases: list[str] = metrics.histogram_summary('jimbot_validation_phase_seconds', 'phase')
+
+        def hit_rate(cache) -> str:
+            lookups: int = cache.hits + cache.misses
+            rate: str = f'{cache.hits / lookups:.0%}' if lookups else 'n/a'
+            return f'{rate} ({cache.hits} hits, {cache.misses} misses)'
+
+        refresh: list[str] = metrics.histogram_summary('jimbot_tileset_refresh_seconds', '')
+
+        embed = Embed(
+            title='Jimbot Stats',
+            description=f'Game version v{validator.cached_version}',
+            color=Color.from_str('#FFFFFF')
+        )
+
+        embed.add_field(name='Commands', value='\n'.join(commands) or 'none yet', inline=False)
+        embed.add_field(name='Validation Phases', value='\n'.join(phases) or 'none yet', inline=False)
+        embed.add_field(name='Result Cache', value=hit_rate(validator.result_cache))
+        embed.add_field(name='Changelog Cache', value=hit_rate(validator.changelogs))
+        embed.add_field(name='Pending Jobs', value=str(validator.pending_jobs))
+        embed.add_field(name='Queued Uploads', value=str(len(self.scheduler.queue)))
+        embed.add_field(name='Tileset Refresh', value='\n'.join(refresh) or 'none yet')
+
+        await message.channel.send(embed=embed)
+
+    @handle
+    @restrict
+    async def _refresh(self, message: Message):
+
+        validator: Validator = self.validator
+        force: bool = message.content == '!refresh --force'
+
+        try:
+            released: bool = await validator.refresh(force)
+
+        except Exception as e:
+            await message.reply(f'Refreshing failed: {e}')
+            return
+
+        if released:
+            await message.reply(f'Updated to v{validator.cached_version}.')
+
+        elif force:
+            await message.reply(f'Checked the tilesets of v{validator.cached_version}.')
+
+        else:
+            await message.reply(f'Already up to date with v{validator.cached_version}.')
+
+    @handle
+    @restrict
+    async def _profile(self, message: Message):
+
+        # !profile [count] [command] profiles the next calls, !profile off stops
+        arguments: list[str] = message.content.split(' ')[1:]
+
+        if arguments[:1] == ['off']:
+            self.profiler.disarm()
+            await message.reply('Profiling stopped.')
+            return
+
+        count: int = int(arguments[0]) if arguments and arguments[0].isdigit() else 1
+        command: str | None = next((argument for argument in arguments if argument.startswith('!')), None)
+
+        if command is not None and command not in self.message_handlers:
+            await message.reply(f'There is no {command} command.')
+            return
+
+        count = min(count, 20)
+        self.profiler.arm(count, command)
+
+        reply: str = f'Profiling the next {count} calls of {command or "any command"}.'
+
+        # validations run in worker processes unless the pool is disabled,
+        # the profile then only covers downloading and waiting on the job
+        if Config.POOL_SIZE > 0 and command in (None, '!validate'):
+            reply += ' Map validation itself runs in worker processes and is not covered.'
+
+        await message.reply(reply)
+
     @handle
     async def _validate(self, message: Message):
 
@@ -216,25 +411,85 @@ class Jimbot(Client):
             await message.reply('To validate your map, upload the file with the command.')
             return
 
-        attachment: Attachment = message.attachments[0]
-        file_name: str = attachment.filename
-
         accepted_types: tuple = ('.ldtk', '.ldtkl', '.json')
-        if True not in {file_name.endswith(t) for t in accepted_types}:
+        attachments: list[Attachment] = [
+            attachment for attachment in message.attachments
+            if attachment.filename.endswith(accepted_types)
+        ]
+
+        if not attachments:
             await message.reply('I don\'t seem to recognize this file type.')
             return
 
-        if attachment.size > 8e6:
+        attachment: Attachment = attachments[0]
+        file_name: str = ', '.join(attachment.filename for attachment in attachments)
+
+        update: bool = message.content == '!validate --update'
+        preview: bool = message.content == '!validate --preview'
+
+        # a project with its level files is validated as a whole
+        project: bool = len(attachments) > 1 and message.content == '!validate'
+        incremental: bool = not project and self.validator.use_incremental(attachment)
+        buffered: bool = update or preview or project or incremental or not self.validator.use_stream(attachment)
+
+        upload_limit: float = self.validator.max_upload_size(buffered=buffered)
+        if any(attachment.size > upload_limit for attachment in attachments):
             await message.reply('Your map is too large, maybe split into levels?')
             return
 
+        cooldown: float = self.scheduler.cooldown_remaining(message.author.id)
+        if cooldown > 0:
+            await message.reply(f'Please wait {cooldown:.0f} seconds before validating another map.')
+            return
+
+        cooldown = self.scheduler.channel_cooldown_remaining(message.channel.id)
+        if cooldown > 0:
+            await message.reply(f'Please wait {cooldown:.0f} seconds, a map was just validated in this channel.')
+            return
+
         log.info(f'attempting to validate {file_name} by {message.author.global_name}')
 
-        if message.content == '!validate --update':
-            await self.respond_update(message, attachment)
-        
-        elif message.content == '!validate':
-            await self.respond_validate(message, attachment)
+        weight: int = sum(
+            self.validator.estimate_memory(attachment.size, buffered=buffered)
+            for attachment in attachments
+        )
+        notices: list[Message] = []
+
+        async def notify_queued(position: int):
+            notices.append(await message.reply(f'Your map is queued at position {position}, hang tight.'))
+
+        try:
+            async with self.scheduler.slot(message.author.id, message.channel.id, weight, notify_queued):
+
+                if update:
+                    await self.respond_update(message, attachment)
+
+                elif preview:
+                    await self.respond_validate(message, attachment, preview=True)
+
+                elif project:
+                    await self.respond_project(message, attachments)
+
+                elif message.content == '!validate':
+                    await self.respond_validate(message, attachment)
+
+        except QueueFull:
+            await message.reply('I\'m validating too many maps right now, please try again in a bit.')
+            return
+
+        except WorkerCrashed as e:
+            log.error('failed validating map:', e)
+            await message.reply('Your map crashed the validator twice, it may be too large to process. Maybe split it into levels?')
+            return
+
+        finally:
+            # the queued notice goes away however the validation ended
+            for notice in notices:
+                try:
+                    await notice.delete()
+
+                except Exception as e:
+                    log.warn('failed deleting queue notice:', e)
 
         await message.delete()
 
@@ -258,7 +513,7 @@ class Jimbot(Client):
             color=Color.from_str('#DD2E44')
         )
 
-        update_result: bytes | bool = await self.validator.process_update(attachment)
+        update_result: io.BytesIO | bool = await self.validator.process_update(attachment)
         channel = message.channel
 
         if update_result is False:
@@ -276,28 +531,150 @@ class Jimbot(Client):
         try:
             updated_map: File = File(update_result, filename=f'updated_{attachment.filename}')
             bot_response: Message = await channel.send(embed=embed_success, file=updated_map)
-            self.message_reactions[bot_response.id] = message.author.id
+            await self.responses.put(bot_response.id, message.author.id)
             await bot_response.add_reaction('🗑️')
     
         except Exception as e:
             await channel.send(embed=embed_error)
             log.error('failed uploading map:', e)
 
-    async def respond_validate(self, message: Message, attachment: Attachment):
+    async def respond_validate(self, message: Message, attachment: Attachment, preview: bool = False):
 
         channel, validator, author = message.channel, self.validator, message.author
+        previews: list[tuple[str, bytes]] = []
+        incremental_result = None
 
-        validation_result: tuple[int, int] | None = await validator.process_validate(attachment)
+        if preview:
+            preview_result = await validator.process_preview(attachment)
+            validation_result, previews = preview_result or (None, [])
+
+        elif validator.use_incremental(attachment):
+            incremental_result = await validator.process_incremental(attachment, author.id)
+            validation_result = incremental_result and (
+                sum(errors for _, _, errors, _ in incremental_result[0]),
+                sum(warns for _, _, _, warns in incremental_result[0])
+            )
+
+        else:
+            validation_result: tuple[int, int] | None = await validator.process_validate(attachment)
 
         if validation_result is None:
             await channel.send('Something went wrong...\nLet me check the logs real quick - Jimbot')
             return
 
         errors, warns = validation_result
+        result_embed: Embed = self.make_result_embed(
+            f'Showing result for `{attachment.filename}` uploaded by <@{author.id}>', errors, warns
+        )
+
+        if incremental_result is not None:
+            self.add_level_deltas(result_embed, *incremental_result)
+
+        log.info('map validated successfully')
+
+        preview_files: list[File] = [
+            File(io.BytesIO(image_data), filename=f'{level_name}.png')
+            for level_name, image_data in previews
+        ]
+
+        await channel.send(embed=result_embed, files=preview_files)
+
+    async def respond_project(self, message: Message, attachments: list[Attachment]):
+
+        channel, validator, author = message.channel, self.validator, message.author
+        project_result = await validator.process_project(attachments)
+
+        if project_result is None:
+            await channel.send('Something went wrong...\nLet me check the logs real quick - Jimbot')
+            return
+
+        level_results, missing = project_result
+        errors: int = sum(level_errors for _, level_errors, _ in level_results)
+        warns: int = sum(level_warns for _, _, level_warns in level_results)
+
+        result_embed: Embed = self.make_result_embed(
+            f'Showing result for {len(attachments)} files with {len(level_results)} levels uploaded by <@{author.id}>',
+            errors,
+            warns
+        )
+
+        # embed fields are limited to 1024 characters
+        with_holes: list[tuple[str, int, int]] = sorted(
+            (level for level in level_results if level[1] or level[2]),
+            key=lambda level: (-level[1], -level[2])
+        )
+
+        level_lines: list[str] = [
+            f'`{identifier}`: {level_errors} errors, {level_warns} warnings'
+            for identifier, level_errors, level_warns in with_holes[:15]
+        ]
+
+        if len(with_holes) > 15:
+            level_lines.append(f'...and {len(with_holes) - 15} more')
+
+        if level_lines:
+            result_embed.add_field(name='Levels', value='\n'.join(level_lines), inline=False)
+
+        if missing:
+            missing_files: str = ', '.join(f'`{file_name}`' for file_name in missing[:10])
+            if len(missing) > 10:
+                missing_files += f' and {len(missing) - 10} more'
+
+            result_embed.add_field(name='Missing level files', value=missing_files, inline=False)
+
+        # levels in files that were not attached were never checked,
+        # the result must not read as a clean pass
+        if missing and not level_results:
+            result_embed.color = Color.from_str('#DD2E44')
+            result_embed.set_field_at(
+                0, name='', value=':no_entry_sign: None of the level files were attached, no levels were checked'
+            )
+
+        elif missing and not errors and not warns:
+            result_embed.color = Color.from_str('#FFCC4D')
+            result_embed.set_field_at(
+                0, name='', value=f':warning: No blank tiles were found, but {len(missing)} level files were not checked'
+            )
+
+        log.info('project validated successfully')
+        await channel.send(embed=result_embed)
+
+    def add_level_deltas(self, result_embed: Embed, levels: list, previous: dict | None, recounted: int):
+
+        if previous is None:
+            return
+
+        delta_lines: list[str] = []
+
+        for identifier, _, errors, warns in levels:
+            if identifier not in previous:
+                delta_lines.append(f'`{identifier}`: new, {errors} errors, {warns} warnings')
+                continue
+
+            previous_errors, previous_warns = previous[identifier]
+            if (previous_errors, previous_warns) != (errors, warns):
+                delta_lines.append(
+                    f'`{identifier}`: errors {previous_errors} → {errors}, warnings {previous_warns} → {warns}'
+                )
+
+        identifiers: set[str] = {identifier for identifier, _, _, _ in levels}
+        delta_lines += [f'`{identifier}`: removed' for identifier in previous if identifier not in identifiers]
+
+        # embed fields are limited to 1024 characters
+        if len(delta_lines) > 10:
+            delta_lines = delta_lines[:10] + [f'...and {len(delta_lines) - 10} more']
+
+        result_embed.add_field(
+            name=f'Since your last upload ({recounted} of {len(levels)} levels recounted)',
+            value='\n'.join(delta_lines) or 'No changes in blank tiles',
+            inline=False
+        )
+
+    def make_result_embed(self, description: str, errors: int, warns: int) -> Embed:
 
         result_embed = Embed(
             title='LDTk Map Validator',
-            description=f'Showing result for `{attachment.filename}` uploaded by <@{author.id}>'
+            description=description
         )
 
         field_ok: str = ':white_check_mark: No blank tiles were found'
@@ -320,7 +697,5 @@ class Jimbot(Client):
             if warns:
                 result_embed.add_field(value=field_warn, name='')
 
-        log.info('map validated successfully')
-
         result_embed.set_footer(text='Validator scans your map for empty tiles on all layers. If a tile is found in a collidable layer, it will count as an error, whereas non-collidable layer will result in a warning.')
-        await channel.send(embed=result_embed)
+        return result_embed
@@ -1,7 +1,66 @@
-
+import logging.handlers
+import contextvars
 import logging
+import atexit
+import queue
+import json
+import uuid
 
 from src.utils import concatenate
+from src.config import Config
+
+
+# id of the command a record was logged for, set once per handled message
+# and inherited by the tasks it creates
+correlation_id: contextvars.ContextVar[str | None] = contextvars.ContextVar('correlation_id', default=None)
+
+
+def correlate(name: str | None = None) -> str:
+    # starts a new correlation id in the current context and returns it
+
+    new_id: str = f'{name}-{uuid.uuid4().hex[:8]}' if name else uuid.uuid4().hex[:8]
+    correlation_id.set(new_id)
+    return new_id
+
+
+class LazyMessage:
+
+    # joins the logged arguments only when a handler asks for the message
+
+    __slots__ = ('args',)
+
+    def __init__(self, args: tuple[any, ...]) -> None:
+        self.args: tuple[any, ...] = args
+
+    def __str__(self) -> str:
+        return concatenate(self.args)
+
+
+class CorrelationFilter(logging.Filter):
+
+    # runs on the event loop before the record is queued,
+    # where the context of the command is still current
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.correlation_id = correlation_id.get()
+        return True
+
+
+class LoopQueueHandler(logging.handlers.QueueHandler):
+
+    # the record is only copied on the event loop, formatting and writing
+    # happen on the listener thread, the queue never leaves the process
+    # so exception info is kept for the formatter
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = logging.makeLogRecord(record.__dict__)
+
+        # arguments may change after the call returns, the message is
+        # resolved now while the formatting is left to the listener
+        record.msg = record.getMessage()
+        record.args = None
+
+        return record
 
 
 class ColorFormat(logging.Formatter):
@@ -13,36 +72,84 @@ class ColorFormat(logging.Formatter):
         logging.ERROR: f'\033[91m{DEFAULT_FORMAT}\033[0m',
     }
 
+    def __init__(self) -> None:
+        super().__init__()
+
+        # one formatter per level, built once instead of for every record
+        self.default = logging.Formatter(self.DEFAULT_FORMAT, '%H:%M:%S')
+        self.formatters: dict[int, logging.Formatter] = {
+            level: logging.Formatter(fmt, '%H:%M:%S') for level, fmt in self.FORMATS.items()
+        }
+
     def format(self, record) -> str:
-        fmt = self.FORMATS.get(record.levelno, self.DEFAULT_FORMAT)
-        formatter = logging.Formatter(fmt, '%H:%M:%S')
+        formatter: logging.Formatter = self.formatters.get(record.levelno, self.default)
         return formatter.format(record)
 
 
+class JsonFormat(logging.Formatter):
+
+    # one JSON object per line for log collectors
+
+    def format(self, record) -> str:
+
+        entry: dict = {
+            'time': round(record.created, 3),
+            'level': record.levelname.lower(),
+            'message': record.getMessage()
+        }
+
+        if getattr(record, 'correlation_id', None) is not None:
+            entry['correlation_id'] = record.correlation_id
+
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+
+        return json.dumps(entry, default=str)
+
+
 class Logger:
 
-    def __init__(self, debug_enabled=False) -> None:
+    def __init__(self, debug_enabled=False, json_lines=False) -> None:
         self.log = logging.getLogger("logger")
         self.debug_enabled = debug_enabled
 
         handler = logging.StreamHandler()
-        handler.setFormatter(ColorFormat())
-        
+        handler.setFormatter(JsonFormat() if json_lines else ColorFormat())
+
+        # records are queued on the event loop and written by a listener
+        # thread, a slow terminal or pipe never blocks command handling
+        self.queue: queue.SimpleQueue = queue.SimpleQueue()
+        self.listener = logging.handlers.QueueListener(self.queue, handler)
+
+        queue_handler = LoopQueueHandler(self.queue)
+        queue_handler.addFilter(CorrelationFilter())
+
         self.level = logging.DEBUG if debug_enabled else logging.INFO
         self.log.setLevel(self.level)
-        self.log.addHandler(handler)
+        self.log.addHandler(queue_handler)
+        self.log.propagate = False
+
+        self.listener.start()
+        atexit.register(self.listener.stop)
+
+    # arguments are only joined when the level is enabled and the
+    # record is emitted, disabled levels cost a single check
 
     def info(self, *args: any) -> None:
-        self.log.info(concatenate(args))
+        if self.log.isEnabledFor(logging.INFO):
+            self.log.info(LazyMessage(args))
 
     def warn(self, *args: any) -> None:
-        self.log.warning(concatenate(args))
+        if self.log.isEnabledFor(logging.WARNING):
+            self.log.warning(LazyMessage(args))
 
     def error(self, *args: any) -> None:
-        self.log.error(concatenate(args))
+        if self.log.isEnabledFor(logging.ERROR):
+            self.log.error(LazyMessage(args))
 
     def debug(self, *args: any) -> None:
-        self.log.debug(concatenate(args))
+        if self.log.isEnabledFor(logging.DEBUG):
+            self.log.debug(LazyMessage(args))
 
 
-log = Logger()
+log = Logger(debug_enabled=Config.LOG_DEBUG, json_lines=Config.LOG_FORMAT == 'json')
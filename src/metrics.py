@@ -0,0 +1,200 @@
+import contextlib
+import time
+
+from aiohttp import web
+
+from src.logger import log
+
+
+class Histogram:
+
+    BUCKETS: tuple = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+    def __init__(self) -> None:
+        self.counts: list[int] = [0] * (len(self.BUCKETS) + 1)
+        self.total: float = 0.0
+        self.count: int = 0
+
+    def observe(self, value: float) -> None:
+
+        for index, bound in enumerate(self.BUCKETS):
+            if value <= bound:
+                break
+        else:
+            index = len(self.BUCKETS)
+
+        self.counts[index] += 1
+        self.total += value
+        self.count += 1
+
+    def quantile(self, q: float) -> float:
+        # upper bound of the bucket holding the quantile
+
+        rank: float = q * self.count
+        seen: int = 0
+
+        for bound, count in zip(self.BUCKETS + (float('inf'),), self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+
+        return float('inf')
+
+
+class Metrics:
+
+    # in-process metrics rendered in the Prometheus text format,
+    # observations made in worker processes are merged by the caller
+
+    def __init__(self) -> None:
+        self.histograms: dict[tuple[str, tuple], Histogram] = {}
+        self.counters: dict[tuple[str, tuple], float] = {}
+        self.gauges: dict[tuple[str, tuple], float] = {}
+        self.collectors: dict[str, tuple[str, any]] = {}
+        self.help: dict[str, str] = {}
+
+        # set in worker processes, observations are returned to the parent
+        self.recording: list[tuple[str, str, tuple, float]] | None = None
+
+    def describe(self, name: str, text: str) -> None:
+        self.help[name] = text
+
+    def observe(self, name: str, value: float, **labels: str) -> None:
+
+        key: tuple[str, tuple] = (name, tuple(sorted(labels.items())))
+        if self.recording is not None:
+            self.recording.append(('histogram', *key, value))
+            return
+
+        if key not in self.histograms:
+            self.histograms[key] = Histogram()
+        self.histograms[key].observe(value)
+
+    def increment(self, name: str, value: float = 1, **labels: str) -> None:
+
+        key: tuple[str, tuple] = (name, tuple(sorted(labels.items())))
+        if self.recording is not None:
+            self.recording.append(('counter', *key, value))
+            return
+
+        self.counters[key] = self.counters.get(key, 0) + value
+
+    def set(self, name: str, value: float, **labels: str) -> None:
+        self.gauges[(name, tuple(sorted(labels.items())))] = value
+
+    def collect(self, name: str, kind: str, func) -> None:
+        # value read from func whenever the metrics are rendered
+        self.collectors[name] = (kind, func)
+
+    @contextlib.contextmanager
+    def timer(self, name: str, **labels: str):
+        start: float = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def merge(self, observations: list[tuple[str, str, tuple, float]]) -> None:
+
+        for kind, name, labels, value in observations:
+            if kind == 'histogram':
+                self.observe(name, value, **dict(labels))
+            else:
+                self.increment(name, value, **dict(labels))
+
+    @staticmethod
+    def format_labels(labels: tuple, extra: str = '') -> str:
+        pairs: list[str] = [f'{k}="{v}"' for k, v in labels]
+        if extra:
+            pairs.append(extra)
+        return '{' + ','.join(pairs) + '}' if pairs else ''
+
+    def render(self) -> str:
+
+        lines: list[str] = []
+        typed: set[str] = set()
+
+        def header(name: str, kind: str) -> None:
+            if name in typed:
+                return
+            typed.add(name)
+            if name in self.help:
+                lines.append(f'# HELP {name} {self.help[name]}')
+            lines.append(f'# TYPE {name} {kind}')
+
+        for (name, labels), value in sorted(self.counters.items()):
+            header(name, 'counter')
+            lines.append(f'{name}{self.format_labels(labels)} {value}')
+
+        for (name, labels), value in sorted(self.gauges.items()):
+            header(name, 'gauge')
+            lines.append(f'{name}{self.format_labels(labels)} {value}')
+
+        for name, (kind, func) in sorted(self.collectors.items()):
+            header(name, kind)
+            lines.append(f'{name} {func()}')
+
+        for (name, labels), histogram in sorted(self.histograms.items()):
+            header(name, 'histogram')
+
+            cumulative: int = 0
+            for bound, count in zip(histogram.BUCKETS + (float('inf'),), histogram.counts):
+                cumulative += count
+                le: str = '+Inf' if bound == float('inf') else str(bound)
+                bucket_labels: str = self.format_labels(labels, 'le="' + le + '"')
+                lines.append(f'{name}_bucket{bucket_labels} {cumulative}')
+
+            lines.append(f'{name}_sum{self.format_labels(labels)} {histogram.total}')
+            lines.append(f'{name}_count{self.format_labels(labels)} {histogram.count}')
+
+        return '\n'.join(lines) + '\n'
+
+    def histogram_summary(self, name: str, label: str) -> list[str]:
+        # one line per label value: count, mean and approximate p95
+
+        lines: list[str] = []
+        for (histogram_name, labels), histogram in sorted(self.histograms.items()):
+            if histogram_name != name or not histogram.count:
+                continue
+
+            label_value: str = dict(labels).get(label, '')
+            mean_ms: float = histogram.total / histogram.count * 1e3
+            p95: float = histogram.quantile(0.95)
+            p95_text: str = f'{p95 * 1e3:.0f} ms' if p95 != float('inf') else f'> {Histogram.BUCKETS[-1]:.0f} s'
+
+            prefix: str = f'`{label_value}` ' if label_value else ''
+            lines.append(f'{prefix}{histogram.count}x, mean {mean_ms:.0f} ms, p95 <= {p95_text}')
+
+        return lines
+
+    async def serve(self, host: str, port: int) -> None:
+
+        async def handle_metrics(request: web.Request) -> web.Response:
+            return web.Response(text=self.render(), content_type='text/plain', charset='utf-8')
+
+        app = web.Application()
+        app.router.add_get('/metrics', handle_metrics)
+
+        runner = web.AppRunner(app)
+        await runner.setup()
+        await web.TCPSite(runner, host, port).start()
+
+        log.info(f'serving metrics on http://{host}:{port}/metrics')
+
+
+def run_recorded(func, *args: any) -> tuple[any, list]:
+    # runs func in a worker process and returns its result
+    # together with the metrics it observed
+
+    metrics.recording = []
+
+    try:
+        result: any = func(*args)
+
+    finally:
+        observations, metrics.recording = metrics.recording, None
+
+    return result, observations
+
+
+metrics: Metrics = Metrics()
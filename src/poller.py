@@ -0,0 +1,67 @@
+import datetime
+import random
+
+
+class VersionPoller:
+
+    # decides how long to wait before the next version check: the regular
+    # interval, a short one during the hours releases usually happen in, and
+    # an exponential backoff with jitter while requests keep failing
+
+    def __init__(
+        self,
+        interval: float,
+        release_interval: float,
+        release_hours: set[int],
+        backoff: float,
+        max_backoff: float
+    ) -> None:
+        self.release_hours: set[int] = set(release_hours)
+        self.release_interval: float = release_interval
+        self.max_backoff: float = max_backoff
+        self.interval: float = interval
+        self.backoff: float = backoff
+        self.failures: int = 0
+
+    @staticmethod
+    def now() -> datetime.datetime:
+        return datetime.datetime.now(datetime.timezone.utc)
+
+    def record_success(self, released: bool) -> None:
+        self.failures = 0
+
+        # releases tend to happen at the same time of day,
+        # the hour of every detected release is watched closely
+        if released:
+            self.release_hours.add(self.now().hour)
+
+    def record_failure(self) -> None:
+        self.failures += 1
+
+    def seconds_until_release_hours(self, now: datetime.datetime) -> float:
+
+        if not self.release_hours:
+            return float('inf')
+
+        start_of_hour: datetime.datetime = now.replace(minute=0, second=0, microsecond=0)
+
+        for hours_ahead in range(1, 25):
+            if (now.hour + hours_ahead) % 24 in self.release_hours:
+                window_start = start_of_hour + datetime.timedelta(hours=hours_ahead)
+                return (window_start - now).total_seconds()
+
+        return float('inf')
+
+    def next_delay(self) -> float:
+
+        if self.failures:
+            # the backoff doubles with every failure, jitter spreads
+            # the retry over the second half of the backoff window
+            delay: float = min(self.max_backoff, self.backoff * 2 ** (self.failures - 1))
+            return random.uniform(delay / 2, delay)
+
+        now: datetime.datetime = self.now()
+        if now.hour in self.release_hours:
+            return self.release_interval * random.uniform(0.9, 1.1)
+
+        return min(self.interval, self.seconds_until_release_hours(now))
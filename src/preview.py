@@ -0,0 +1,236 @@
+import json
+import io
+import os
+
+import numpy as np
+
+from PIL import Image
+
+from src.validator import PHASE_METRIC, LDtkLevel, Tileset
+from src.metrics import metrics
+from src.logger import log
+
+
+class TileAtlas:
+
+    # tiles of the debug tilesets sliced into arrays of shape
+    # (flips, tiles, size, size, 4), cached per output tile size
+
+    TILE_SIZES: tuple = (8, 4, 2, 1)
+
+    def __init__(self, tileset_dir: str = 'tilesets') -> None:
+        self.atlases: dict[tuple[Tileset, int], np.ndarray] = {}
+        self.mtimes: dict[Tileset, float] = {}
+        self.tileset_dir: str = tileset_dir
+
+    def get(self, tileset: Tileset, tile_size: int) -> np.ndarray | None:
+
+        file_path: str = os.path.join(self.tileset_dir, tileset.file_name)
+        if not os.path.exists(file_path):
+            return
+
+        # drop the sliced tiles once a new debug tileset is saved
+        mtime: float = os.path.getmtime(file_path)
+        if self.mtimes.get(tileset) != mtime:
+            self.atlases = {k: v for k, v in self.atlases.items() if k[0] is not tileset}
+            self.mtimes[tileset] = mtime
+
+        if (tileset, tile_size) not in self.atlases:
+            self.atlases[(tileset, tile_size)] = self.slice(file_path, tile_size)
+
+        return self.atlases[(tileset, tile_size)]
+
+    @staticmethod
+    def slice(file_path: str, tile_size: int) -> np.ndarray:
+
+        with Image.open(file_path) as image:
+            pixels: np.ndarray = np.asarray(image.convert('RGBA'))
+
+        tiles_y, tiles_x = pixels.shape[0] // 8, pixels.shape[1] // 8
+        tiles: np.ndarray = pixels[:tiles_y * 8, :tiles_x * 8] \
+            .reshape(tiles_y, 8, tiles_x, 8, 4).swapaxes(1, 2).reshape(-1, 8, 8, 4)
+
+        # box filter down to the requested size
+        step: int = 8 // tile_size
+        tiles = tiles.reshape(-1, tile_size, step, tile_size, step, 4) \
+            .mean(axis=(2, 4)).astype(np.uint8)
+
+        # index 0: as is, 1: flipped x, 2: flipped y, 3: both
+        return np.stack((
+            tiles,
+            tiles[:, :, ::-1],
+            tiles[:, ::-1, :],
+            tiles[:, ::-1, ::-1]
+        ))
+
+
+class LevelPreview:
+
+    COLOR_ERROR: tuple = (221, 46, 68, 255)
+    COLOR_WARNING: tuple = (255, 204, 77, 255)
+
+    # rows of tiles rendered at once, bounds the memory of large levels
+    STRIP_ROWS: int = 64
+
+    def __init__(self, data: dict, blanks: dict, atlas: TileAtlas, max_size: int) -> None:
+        self.blanks: dict[Tileset, np.ndarray] = blanks
+        self.atlas: TileAtlas = atlas
+        self.max_size: int = max_size
+
+        self.identifier: str = data.get('identifier', 'level')
+        self.background: str = data.get('__bgColor') or '#40465B'
+        self.cells_x: int = -(-data.get('pxWid', 0) // 8)
+        self.cells_y: int = -(-data.get('pxHei', 0) // 8)
+
+        # draw order is bottom to top, LDtk lists the top layer first
+        self.layers: list[tuple[Tileset, bool, np.ndarray]] = []
+        for layer in reversed(data.get('layerInstances') or []):
+            layer_id: str = layer.get('__identifier')
+            if layer_id not in LDtkLevel.LAYERS or not layer.get('gridTiles'):
+                continue
+
+            grid_size: int = layer.get('__gridSize') or 8
+            tiles: np.ndarray = np.array(
+                [(*tile['px'], tile.get('t', -1), tile.get('f', 0)) for tile in layer['gridTiles']],
+                dtype=np.int64
+            )
+            tiles[:, :2] //= grid_size
+
+            tileset: Tileset = LDtkLevel.LAYERS[layer_id]
+            self.layers.append((tileset, layer_id in LDtkLevel.COLLIDABLE, tiles))
+
+    def render(self) -> bytes | None:
+
+        if not self.cells_x or not self.cells_y:
+            return
+
+        longest: int = max(self.cells_x, self.cells_y)
+        tile_size: int = next(
+            (s for s in TileAtlas.TILE_SIZES if s * longest <= self.max_size), 1
+        )
+
+        # levels wider than max_size tiles are scaled down strip by strip
+        ratio: float = min(1.0, self.max_size / (longest * tile_size))
+        output_size: tuple[int, int] = (
+            max(1, round(self.cells_x * tile_size * ratio)),
+            max(1, round(self.cells_y * tile_size * ratio))
+        )
+
+        output: Image = Image.new('RGBA', output_size)
+
+        for row_start in range(0, self.cells_y, self.STRIP_ROWS):
+            row_end: int = min(row_start + self.STRIP_ROWS, self.cells_y)
+            strip: Image = self.render_strip(row_start, row_end, tile_size)
+
+            top: int = round(row_start * tile_size * ratio)
+            bottom: int = round(row_end * tile_size * ratio)
+            if bottom <= top:
+                continue
+
+            if ratio < 1.0:
+                strip = strip.resize((output_size[0], bottom - top), Image.BOX)
+
+            output.paste(strip, (0, top))
+
+        bytes_buffer: io.BytesIO = io.BytesIO()
+        output.save(bytes_buffer, format='PNG', optimize=False)
+        return bytes_buffer.getvalue()
+
+    def render_strip(self, row_start: int, row_end: int, tile_size: int) -> Image:
+
+        rows: int = row_end - row_start
+        strip_size: tuple[int, int] = (self.cells_x * tile_size, rows * tile_size)
+        strip: Image = Image.new('RGBA', strip_size, self.background)
+
+        holes: list[tuple[np.ndarray, tuple]] = []
+
+        for tileset, is_collidable, tiles in self.layers:
+            atlas: np.ndarray | None = self.atlas.get(tileset, tile_size)
+            if atlas is None:
+                continue
+
+            cells_x, cells_y, tile_ids, flips = tiles.T
+            visible: np.ndarray = (
+                (cells_y >= row_start) & (cells_y < row_end) &
+                (cells_x >= 0) & (cells_x < self.cells_x) &
+                (tile_ids >= 0) & (tile_ids < atlas.shape[1])
+            )
+
+            cells_x, cells_y = cells_x[visible], cells_y[visible] - row_start
+            tile_ids, flips = tile_ids[visible], flips[visible] & 3
+
+            layer: np.ndarray = np.zeros((rows, self.cells_x, tile_size, tile_size, 4), np.uint8)
+            layer[cells_y, cells_x] = atlas[flips, tile_ids]
+
+            layer_image: Image = Image.fromarray(
+                layer.swapaxes(1, 2).reshape(strip_size[1], strip_size[0], 4), 'RGBA'
+            )
+            strip = Image.alpha_composite(strip, layer_image)
+
+            blank_table: np.ndarray = self.blanks[tileset]
+            is_blank: np.ndarray = np.zeros(tile_ids.size, dtype=bool)
+            in_table: np.ndarray = tile_ids < blank_table.size
+            is_blank[in_table] = blank_table[tile_ids[in_table]]
+
+            color: tuple = self.COLOR_ERROR if is_collidable else self.COLOR_WARNING
+            holes.append((np.stack((cells_x[is_blank], cells_y[is_blank]), axis=1), color))
+
+        # holes are drawn last so other layers never cover them,
+        # errors are drawn over warnings
+        pixels: np.ndarray = np.array(strip)
+        cells: np.ndarray = pixels.reshape(rows, tile_size, self.cells_x, tile_size, 4).swapaxes(1, 2)
+
+        for positions, color in sorted(holes, key=lambda h: h[1] == self.COLOR_ERROR):
+            cells[positions[:, 1], positions[:, 0]] = color
+
+        return Image.fromarray(pixels, 'RGBA')
+
+
+# sliced tiles are kept per process, worker processes reuse them between jobs
+atlas: TileAtlas = TileAtlas()
+
+
+def preview_map(
+    map_data: bytes,
+    blanks: dict,
+    max_size: int,
+    max_previews: int
+) -> tuple[tuple[int, int], list[tuple[str, bytes]]] | None:
+    # returns the validation result and rendered levels with holes
+
+    try:
+        with metrics.timer(PHASE_METRIC, phase='parse'):
+            json_object: dict = json.loads(map_data)
+
+    except (json.JSONDecodeError, UnicodeDecodeError) as e:
+        log.error('failed decoding map:', e)
+        return
+
+    if 'levels' in json_object:
+        levels: list[dict] = json_object['levels']
+    
+    elif 'layerInstances' in json_object:
+        levels: list[dict] = [json_object]
+    
+    else:
+        log.error('failed parsing map')
+        return
+
+    errors, warnings = 0, 0
+    previews: list[tuple[str, bytes]] = []
+
+    for level_data in levels:
+        level_errors, level_warnings = LDtkLevel(level_data, blanks).validate_layers()
+        errors, warnings = errors + level_errors, warnings + level_warnings
+
+        if not (level_errors or level_warnings) or len(previews) >= max_previews:
+            continue
+
+        with metrics.timer(PHASE_METRIC, phase='render'):
+            level_preview = LevelPreview(level_data, blanks, atlas, max_size)
+            image_data: bytes | None = level_preview.render()
+
+        if image_data is not None:
+            previews.append((level_preview.identifier, image_data))
+
+    return (errors, warnings), previews
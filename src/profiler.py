@@ -0,0 +1,188 @@
+import contextlib
+import tracemalloc
+import cProfile
+import asyncio
+import pstats
+import random
+import time
+import uuid
+import io
+import os
+
+import aiopath
+
+from src.metrics import metrics
+from src.logger import correlation_id, log
+
+
+class ProfileReport:
+
+    # outcome of one profiled handler call, files are written once it ends
+
+    def __init__(self, command: str, reason: str, trace_memory: bool) -> None:
+        self.trace_memory: bool = trace_memory
+        self.allocations: list[str] = []
+        self.top_functions: list[str] = []
+        self.file_path: str | None = None
+        self.command: str = command
+        self.reason: str = reason
+        self.peak_memory: int = 0
+        self.seconds: float = 0.0
+
+        # names the report files, calls within one second never collide
+        self.name: str = correlation_id.get() or f'{command.lstrip("!")}-{uuid.uuid4().hex[:8]}'
+
+    def summary(self) -> str:
+
+        lines: list[str] = [
+            f'Profiled {self.command} in {self.seconds:.3f}s',
+            'Includes all event loop activity during that time, not only this command'
+        ]
+
+        if self.trace_memory:
+            lines.append(f'Peak traced memory {self.peak_memory / 1e6:.1f} MB')
+
+        lines.extend(f'- {line}' for line in self.top_functions)
+
+        if self.file_path is not None:
+            lines.append(f'Saved to {self.file_path}')
+
+        return '\n'.join(lines)
+
+
+class Profiler:
+
+    # profiles handler calls with cProfile, the next count calls of a command
+    # or of any command when an admin armed it, also tracing allocations,
+    # and a sample_rate percentage of the sampled commands without tracing
+
+    def __init__(self, directory: str, sample_rate: int, sampled_commands: set[str], keep: int) -> None:
+        self.sampled_commands: set[str] = sampled_commands
+        self.armed: dict[str | None, int] = {}
+        self.directory: str = directory
+        self.sample_rate: int = sample_rate
+        self.active: bool = False
+        self.keep: int = keep
+
+    def arm(self, count: int, command: str | None = None) -> None:
+
+        if count > 0:
+            self.armed[command] = count
+        else:
+            self.armed.pop(command, None)
+
+    def disarm(self) -> None:
+        self.armed.clear()
+
+    def check(self, command: str) -> str | None:
+        # returns why the call is profiled, None leaves it alone
+
+        # only one profiler can be enabled on the thread at a time, a call
+        # overlapping a profiled one runs unprofiled, its work still shows
+        # up in the running report as that covers the whole event loop
+        if self.active:
+            return None
+
+        for key in (command, None):
+            if self.armed.get(key, 0) > 0:
+                self.armed[key] -= 1
+                if not self.armed[key]:
+                    del self.armed[key]
+                return 'requested'
+
+        if command in self.sampled_commands and random.random() * 100 < self.sample_rate:
+            return 'sampled'
+
+        return None
+
+    @contextlib.asynccontextmanager
+    async def profile(self, command: str, reason: str):
+
+        # allocation tracing slows everything down a lot, sampled
+        # calls only collect the cheaper function statistics
+        report = ProfileReport(command, reason, trace_memory=reason == 'requested')
+        started_tracing: bool = report.trace_memory and not tracemalloc.is_tracing()
+
+        if started_tracing:
+            tracemalloc.start(10)
+
+        profile = cProfile.Profile()
+        self.active = True
+        start: float = time.perf_counter()
+        profile.enable()
+
+        try:
+            yield report
+
+        finally:
+            profile.disable()
+            report.seconds = time.perf_counter() - start
+            self.active = False
+
+            snapshot: tracemalloc.Snapshot | None = None
+            if report.trace_memory:
+                _, report.peak_memory = tracemalloc.get_traced_memory()
+                snapshot = tracemalloc.take_snapshot()
+
+            if started_tracing:
+                tracemalloc.stop()
+
+            metrics.increment('jimbot_profiles_total', command=command, reason=reason)
+
+            try:
+                await asyncio.to_thread(self.write, report, profile, snapshot)
+                await self.enforce()
+
+            except Exception as e:
+                log.warn('failed saving profile:', e)
+
+    def write(self, report: ProfileReport, profile: cProfile.Profile, snapshot: tracemalloc.Snapshot | None) -> None:
+
+        stats_text = io.StringIO()
+        stats = pstats.Stats(profile, stream=stats_text)
+
+        functions: list = sorted(stats.stats.items(), key=lambda item: item[1][2], reverse=True)
+        report.top_functions = [
+            f'{os.path.basename(file_name)}:{line} {name} {total:.3f}s own, {calls} calls'
+            for (file_name, line, name), (_, calls, total, _, _) in functions[:5]
+        ]
+
+        stats.sort_stats(pstats.SortKey.CUMULATIVE).print_stats(40)
+
+        if snapshot is not None:
+            snapshot = snapshot.filter_traces((
+                tracemalloc.Filter(False, tracemalloc.__file__),
+                tracemalloc.Filter(False, '<frozen importlib._bootstrap>'),
+            ))
+            report.allocations = [str(statistic) for statistic in snapshot.statistics('lineno')[:25]]
+
+        os.makedirs(self.directory, exist_ok=True)
+
+        base_path: str = os.path.join(self.directory, f'{time.strftime("%Y%m%d-%H%M%S")}_{report.name}_{report.reason}')
+
+        # the .prof file opens in pstats or snakeviz, the
+        # .txt file is readable without any tooling
+        stats.dump_stats(f'{base_path}.prof')
+
+        with open(f'{base_path}.txt', 'w') as report_file:
+            report_file.write(report.summary() + '\n\n')
+            report_file.write(stats_text.getvalue())
+
+            if report.allocations:
+                report_file.write('\nTop allocations\n\n')
+                report_file.write('\n'.join(report.allocations) + '\n')
+
+        report.file_path = f'{base_path}.txt'
+
+    async def enforce(self) -> None:
+        # only the newest keep profiles are kept, each is a .prof and .txt pair
+
+        profiles: list[aiopath.AsyncPath] = [
+            path async for path in aiopath.AsyncPath(self.directory).glob('*.prof')
+        ]
+
+        profiles.sort(key=lambda path: path.name)
+
+        for path in profiles[:max(0, len(profiles) - self.keep)]:
+            await path.unlink(missing_ok=True)
+            await path.with_suffix('.txt').unlink(missing_ok=True)
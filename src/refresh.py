@@ -0,0 +1,49 @@
+import itertools
+import queue
+import time
+
+
+class RefreshChannel:
+
+    # forwards refreshes from the other shard processes to the owner, which
+    # runs them and answers on the queue of the asking process, requests
+    # carry an id so a reply arriving after its request timed out is dropped
+
+    def __init__(self, index: int, requests, replies: dict) -> None:
+        self.request_ids = itertools.count()
+        self.requests = requests
+        self.replies: dict = replies
+        self.index: int = index
+
+    def next_request(self, timeout: float = 1.0) -> tuple[int, int, bool] | None:
+        # returns (process index, request id, force), None when nothing
+        # arrived in time so the waiting thread can notice a shutdown
+
+        try:
+            return self.requests.get(timeout=timeout)
+
+        except queue.Empty:
+            return None
+
+    def answer(self, index: int, request_id: int, released: bool, error: str | None) -> None:
+        self.replies[index].put((request_id, released, error))
+
+    def ask(self, force: bool, timeout: float) -> tuple[bool, str | None]:
+        # blocks until the owner answered, run it in a thread
+
+        request_id: int = next(self.request_ids)
+        self.requests.put((self.index, request_id, force))
+
+        deadline: float = time.monotonic() + timeout
+
+        while (remaining := deadline - time.monotonic()) > 0:
+            try:
+                reply_id, released, error = self.replies[self.index].get(timeout=remaining)
+
+            except queue.Empty:
+                break
+
+            if reply_id == request_id:
+                return released, error
+
+        raise TimeoutError('the owner process did not answer')
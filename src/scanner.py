@@ -0,0 +1,248 @@
+import codecs
+import re
+
+import numpy as np
+
+
+# locates values in raw JSON bytes without parsing them, only strings and
+# brackets are visited so skipping large values stays cheap
+
+WHITESPACE = re.compile(rb'[ \t\n\r]*')
+STRING = re.compile(rb'"(?:[^"\\]|\\.)*"', re.DOTALL)
+SCALAR = re.compile(rb'[^,:\]}\s]+')
+TOKEN = re.compile(rb'"(?:[^"\\]|\\.)*"|[{}\[\]]', re.DOTALL)
+
+
+def skip_whitespace(data: bytes, pos: int) -> int:
+    return WHITESPACE.match(data, pos).end()
+
+
+def skip_bom(data: bytes, pos: int) -> int:
+    # editors may save a UTF-8 byte order mark, json.loads accepts it too
+
+    if pos == 0 and data.startswith(codecs.BOM_UTF8):
+        return len(codecs.BOM_UTF8)
+
+    return pos
+
+
+def expect(data: bytes, pos: int, char: bytes) -> int:
+
+    if data[pos:pos + 1] != char:
+        raise ValueError(f'expected {char.decode()} at byte {pos}')
+
+    return pos + 1
+
+
+def skip_string(data: bytes, pos: int) -> int:
+
+    if (match := STRING.match(data, pos)) is None:
+        raise ValueError(f'unterminated string at byte {pos}')
+
+    return match.end()
+
+
+def skip_value(data: bytes, pos: int) -> int:
+    # returns the position right after the value starting at pos
+
+    char: bytes = data[pos:pos + 1]
+
+    if char == b'"':
+        return skip_string(data, pos)
+
+    if char not in (b'{', b'['):
+        if (match := SCALAR.match(data, pos)) is None:
+            raise ValueError(f'expected a value at byte {pos}')
+
+        return match.end()
+
+    # strings are matched whole so brackets inside them are never counted
+    depth: int = 0
+    for match in TOKEN.finditer(data, pos):
+        byte: int = data[match.start()]
+
+        if byte == 0x22:
+            continue
+
+        if byte == 0x7b or byte == 0x5b:
+            depth += 1
+            continue
+
+        depth -= 1
+        if depth == 0:
+            return match.end()
+
+    raise ValueError('unexpected end of document')
+
+
+def iter_members(data: bytes, pos: int = 0):
+    # yields (raw key, value start, value end) for the object at pos
+
+    pos = expect(data, skip_whitespace(data, skip_bom(data, pos)), b'{')
+    pos = skip_whitespace(data, pos)
+
+    if data[pos:pos + 1] == b'}':
+        return
+
+    while True:
+        key_start: int = pos
+        key_end: int = skip_string(data, key_start)
+
+        pos = expect(data, skip_whitespace(data, key_end), b':')
+        pos = skip_whitespace(data, pos)
+
+        value_end: int = skip_value(data, pos)
+        yield data[key_start + 1:key_end - 1], pos, value_end
+
+        pos = skip_whitespace(data, value_end)
+        if data[pos:pos + 1] == b'}':
+            return
+
+        pos = skip_whitespace(data, expect(data, pos, b','))
+
+
+def member_start(data: bytes, key: bytes, pos: int = 0) -> int | None:
+    # returns where a member value of the object at pos starts, the value
+    # itself is not skipped so large values can be walked by the caller
+
+    pos = expect(data, skip_whitespace(data, skip_bom(data, pos)), b'{')
+    pos = skip_whitespace(data, pos)
+
+    if data[pos:pos + 1] == b'}':
+        return None
+
+    while True:
+        key_start: int = pos
+        key_end: int = skip_string(data, key_start)
+
+        pos = expect(data, skip_whitespace(data, key_end), b':')
+        pos = skip_whitespace(data, pos)
+
+        if data[key_start + 1:key_end - 1] == key:
+            return pos
+
+        pos = skip_whitespace(data, skip_value(data, pos))
+        if data[pos:pos + 1] == b'}':
+            return None
+
+        pos = skip_whitespace(data, expect(data, pos, b','))
+
+
+def find_member(data: bytes, key: bytes, pos: int = 0) -> tuple[int, int] | None:
+    # returns the span of a member value of the object at pos,
+    # scanning stops as soon as the value has been skipped
+
+    if (value_start := member_start(data, key, pos)) is None:
+        return None
+
+    return value_start, skip_value(data, value_start)
+
+
+class BracketIndex:
+
+    # positions of every bracket outside of strings and the depth after it,
+    # built with a few numpy passes over the document instead of a Python
+    # step per token, so locating values in large maps costs far less than
+    # parsing them
+
+    def __init__(self, data: bytes) -> None:
+        self.data: bytes = data
+
+        # brackets differ from each other only in bits 0x20 and 0x02,
+        # quotes and brackets are picked out in one pass in document order
+        array: np.ndarray = np.frombuffer(data, dtype=np.uint8)
+        is_token: np.ndarray = ((((array | 0x20) - 0x7b) & 0xfd) == 0) | (array == 0x22)
+
+        tokens: np.ndarray = np.flatnonzero(is_token)
+        kinds: np.ndarray = array[tokens]
+        is_quote: np.ndarray = kinds == 0x22
+
+        # backslashes only occur inside strings, a quote preceded by an odd
+        # run of them is escaped, these are rare enough to check one by one
+        quote_tokens: np.ndarray = np.flatnonzero(is_quote)
+        quotes: np.ndarray = tokens[quote_tokens]
+
+        for index in np.flatnonzero((quotes > 0) & (array[quotes - 1] == 0x5c)):
+            run_start: int = int(quotes[index]) - 1
+            while run_start >= 0 and data[run_start] == 0x5c:
+                run_start -= 1
+
+            if (quotes[index] - run_start) % 2 == 0:
+                is_quote[quote_tokens[index]] = False
+
+        self.quotes: np.ndarray = tokens[is_quote]
+        if self.quotes.size % 2:
+            raise ValueError('unterminated string')
+
+        # a bracket is outside of strings when an even number of quotes
+        # precede it, escaped quotes are neither quotes nor brackets
+        outside: np.ndarray = (kinds != 0x22) & ((np.cumsum(is_quote, dtype=np.int32) & 1) == 0)
+
+        self.brackets: np.ndarray = tokens[outside]
+        self.opening: np.ndarray = (kinds[outside] & 0x02) != 0
+        self.depths: np.ndarray = np.cumsum(np.where(self.opening, 1, -1), dtype=np.int32)
+
+        if not self.depths.size or self.depths[-1] != 0 or self.depths.min() < 0:
+            raise ValueError('unbalanced brackets')
+
+    def depth_at(self, pos: int) -> int:
+        index: int = int(np.searchsorted(self.brackets, pos))
+        return int(self.depths[index - 1]) if index else 0
+
+    def member_start(self, key: bytes) -> int | None:
+        # returns where a member value of the top-level object starts
+
+        start: int = skip_whitespace(self.data, skip_bom(self.data, 0))
+        if self.data[start:start + 1] != b'{':
+            raise ValueError(f'expected {{ at byte {start}')
+
+        needle: bytes = b'"' + key + b'"'
+        pos: int = self.data.find(needle)
+
+        while pos != -1:
+            index: int = int(np.searchsorted(self.quotes, pos))
+
+            # the needle has to open a string one level inside the top-level
+            # object and be followed by a colon to be one of its keys
+            if index < self.quotes.size and self.quotes[index] == pos and not index % 2 and self.depth_at(pos) == 1:
+                colon: int = skip_whitespace(self.data, pos + len(needle))
+                if self.data[colon:colon + 1] == b':':
+                    return skip_whitespace(self.data, colon + 1)
+
+            pos = self.data.find(needle, pos + 1)
+
+        return None
+
+    def object_items(self, pos: int) -> list[tuple[int, int]]:
+        # returns (value start, value end) for the array of objects at pos
+
+        index: int = int(np.searchsorted(self.brackets, pos))
+        if index >= self.brackets.size or self.brackets[index] != pos or self.data[pos] != 0x5b:
+            raise ValueError(f'expected [ at byte {pos}')
+
+        depth: int = int(self.depths[index])
+        end: int = index + 1 + int(np.argmax(self.depths[index + 1:] == depth - 1))
+
+        inner_brackets: np.ndarray = self.brackets[index + 1:end]
+        inner_depths: np.ndarray = self.depths[index + 1:end]
+        inner_opening: np.ndarray = self.opening[index + 1:end]
+
+        # items open one level deeper than the array and close back to it
+        starts: np.ndarray = inner_brackets[inner_opening & (inner_depths == depth + 1)]
+        ends: np.ndarray = inner_brackets[inner_depths == depth] + 1
+
+        spans: list[tuple[int, int]] = list(zip(starts.tolist(), ends.tolist()))
+
+        if any(self.data[start] != 0x7b for start, _ in spans):
+            raise ValueError('expected an array of objects')
+
+        # only single commas may sit between the objects, anything else,
+        # e.g. a null level, would not be covered by the spans
+        gaps = zip([pos + 1] + ends.tolist(), starts.tolist() + [int(self.brackets[end])])
+        for number, (gap_start, gap_end) in enumerate(gaps):
+            separator: bytes = b',' if 0 < number < len(spans) else b''
+
+            if self.data[gap_start:gap_end].strip(b' \t\n\r') != separator:
+                raise ValueError(f'expected an object at byte {gap_start}')
+
+        return spans
@@ -0,0 +1,128 @@
+import contextlib
+import asyncio
+import time
+
+from src.metrics import metrics
+
+
+class QueueFull(Exception):
+    pass
+
+
+class ValidationJob:
+
+    def __init__(self, user_id: int, channel_id: int, weight: int) -> None:
+        self.started: asyncio.Event = asyncio.Event()
+        self.queued_at: float = time.monotonic()
+        self.channel_id: int = channel_id
+        self.user_id: int = user_id
+        self.weight: int = weight
+
+
+class ValidationScheduler:
+
+    # admits validation jobs under a global concurrency limit and a memory
+    # budget, while a user or channel may only hold a few slots at once
+    # and has to wait its cooldown between two submissions
+
+    def __init__(
+        self,
+        max_jobs: int,
+        memory_budget: int,
+        max_queued: int,
+        per_user: int = 1,
+        per_channel: int = 2,
+        cooldown: float = 0.0,
+        channel_cooldown: float = 0.0
+    ) -> None:
+        self.max_jobs: int = max_jobs
+        self.memory_budget: int = memory_budget
+        self.max_queued: int = max_queued
+        self.per_user: int = per_user
+        self.per_channel: int = per_channel
+        self.cooldown: float = cooldown
+        self.channel_cooldown: float = channel_cooldown
+
+        self.queue: list[ValidationJob] = []
+        self.running: list[ValidationJob] = []
+        self.memory_used: int = 0
+        self.last_submitted: dict[int, float] = {}
+        self.channel_submitted: dict[int, float] = {}
+
+        metrics.collect('jimbot_validation_queue_depth', 'gauge', lambda: len(self.queue))
+        metrics.collect('jimbot_validation_running', 'gauge', lambda: len(self.running))
+        metrics.collect('jimbot_validation_memory_bytes', 'gauge', lambda: self.memory_used)
+
+    def cooldown_remaining(self, user_id: int) -> float:
+        last_submitted: float = self.last_submitted.get(user_id, float('-inf'))
+        return max(0.0, self.cooldown - (time.monotonic() - last_submitted))
+
+    def channel_cooldown_remaining(self, channel_id: int) -> float:
+        last_submitted: float = self.channel_submitted.get(channel_id, float('-inf'))
+        return max(0.0, self.channel_cooldown - (time.monotonic() - last_submitted))
+
+    def count_running(self, attribute: str, value: int) -> int:
+        return sum(1 for job in self.running if getattr(job, attribute) == value)
+
+    def can_start(self, job: ValidationJob) -> bool:
+
+        if len(self.running) >= self.max_jobs:
+            return False
+
+        if self.count_running('user_id', job.user_id) >= self.per_user:
+            return False
+
+        if self.count_running('channel_id', job.channel_id) >= self.per_channel:
+            return False
+
+        # a job larger than the whole budget still runs, but only alone
+        return not self.running or self.memory_used + job.weight <= self.memory_budget
+
+    def dispatch(self) -> None:
+        # jobs start in arrival order, a job blocked by its user or channel
+        # is skipped, a job blocked by the memory budget holds back the rest
+
+        for job in list(self.queue):
+            if len(self.running) >= self.max_jobs:
+                break
+
+            if self.can_start(job):
+                self.queue.remove(job)
+                self.running.append(job)
+                self.memory_used += job.weight
+                job.started.set()
+
+            elif self.running and self.memory_used + job.weight > self.memory_budget:
+                break
+
+    @contextlib.asynccontextmanager
+    async def slot(self, user_id: int, channel_id: int, weight: int, on_queued=None):
+        # on_queued(position) is awaited when the job has to wait
+
+        if len(self.queue) >= self.max_queued:
+            raise QueueFull()
+
+        job = ValidationJob(user_id, channel_id, weight)
+        self.last_submitted[user_id] = time.monotonic()
+        self.channel_submitted[channel_id] = time.monotonic()
+        self.queue.append(job)
+        self.dispatch()
+
+        try:
+            if not job.started.is_set():
+                if on_queued is not None:
+                    await on_queued(self.queue.index(job) + 1)
+                await job.started.wait()
+
+            metrics.observe('jimbot_validation_phase_seconds', time.monotonic() - job.queued_at, phase='queue')
+            yield job
+
+        finally:
+            if job in self.queue:
+                self.queue.remove(job)
+
+            elif job in self.running:
+                self.running.remove(job)
+                self.memory_used -= job.weight
+
+            self.dispatch()
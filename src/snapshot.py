@@ -0,0 +1,115 @@
+import pickle
+import struct
+import mmap
+import json
+import os
+
+import numpy as np
+
+
+# the snapshot holds everything validation needs after a restart in one file:
+# magic, header length, a JSON header and the sections it points to, which
+# are the blank tables packed to one bit per tile and the pickled defs
+
+MAGIC: bytes = b'JIMBOTSS'
+FORMAT: int = 1
+PREAMBLE = struct.Struct('<8sI')
+
+
+class Snapshot:
+
+    def __init__(
+        self,
+        version: int,
+        blank_tables: dict[str, np.ndarray],
+        headers: dict[str, dict],
+        defs: dict
+    ) -> None:
+        self.blank_tables: dict[str, np.ndarray] = blank_tables
+        self.headers: dict[str, dict] = headers
+        self.version: int = version
+        self.defs: dict = defs
+
+
+def write_snapshot(file_path: str, snapshot: Snapshot) -> None:
+    # written to a temporary file and renamed, readers
+    # never observe a partially written snapshot
+
+    sections: list[bytes] = []
+    offset: int = 0
+
+    def add_section(data: bytes) -> dict:
+        nonlocal offset
+        section: dict = {'offset': offset, 'length': len(data)}
+        sections.append(data)
+        offset += len(data)
+        return section
+
+    tilesets: dict[str, dict] = {}
+    for name, blank_table in snapshot.blank_tables.items():
+        tilesets[name] = {
+            'tiles': len(blank_table),
+            'headers': snapshot.headers.get(name, {}),
+            **add_section(np.packbits(blank_table).tobytes())
+        }
+
+    header: dict = {
+        'format': FORMAT,
+        'version': snapshot.version,
+        'tilesets': tilesets,
+        'defs': add_section(pickle.dumps(snapshot.defs, protocol=pickle.HIGHEST_PROTOCOL))
+    }
+
+    header_data: bytes = json.dumps(header).encode()
+    temp_path: str = f'{file_path}.{os.getpid()}.tmp'
+
+    with open(temp_path, 'wb') as snapshot_file:
+        snapshot_file.write(PREAMBLE.pack(MAGIC, len(header_data)))
+        snapshot_file.write(header_data)
+
+        for section in sections:
+            snapshot_file.write(section)
+
+        snapshot_file.flush()
+        os.fsync(snapshot_file.fileno())
+
+    os.replace(temp_path, file_path)
+
+
+def read_snapshot(file_path: str) -> Snapshot:
+    # raises ValueError for files of another format
+
+    with open(file_path, 'rb') as snapshot_file:
+        with mmap.mmap(snapshot_file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+
+            if len(mapped) < PREAMBLE.size:
+                raise ValueError('truncated snapshot')
+
+            magic, header_length = PREAMBLE.unpack_from(mapped)
+            if magic != MAGIC:
+                raise ValueError('not a snapshot file')
+
+            body_start: int = PREAMBLE.size + header_length
+            header: dict = json.loads(mapped[PREAMBLE.size:body_start])
+
+            if header.get('format') != FORMAT:
+                raise ValueError(f'unsupported snapshot format {header.get("format")}')
+
+            def read_section(section: dict) -> memoryview:
+                start: int = body_start + section['offset']
+                return memoryview(mapped)[start:start + section['length']]
+
+            blank_tables: dict[str, np.ndarray] = {}
+            headers: dict[str, dict] = {}
+
+            for name, tileset in header['tilesets'].items():
+                with read_section(tileset) as packed:
+                    bits: np.ndarray = np.unpackbits(np.frombuffer(packed, dtype=np.uint8), count=tileset['tiles'])
+
+                blank_tables[name] = bits.astype(bool)
+                headers[name] = tileset['headers']
+
+            with read_section(header['defs']) as defs_data:
+                defs: dict = pickle.loads(defs_data)
+
+    return Snapshot(header['version'], blank_tables, headers, defs)
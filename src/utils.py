@@ -1,3 +1,5 @@
+import os
+
 
 def concatenate(args: tuple[any, ...]) -> str:
     return ' '.join([str(a).replace('\n', '') for a in args if a != '\n'])
@@ -6,3 +8,25 @@ def concatenate(args: tuple[any, ...]) -> str:
 def handle(func) -> any:
     func._is_handler = True    
     return func
+
+
+def restrict(func) -> any:
+    # handler only runs for bot admins
+    func._is_restricted = True
+    return func
+
+
+def env_int(name: str, default: int) -> int:
+    try:
+        return int(os.environ.get(name, default))
+    
+    except ValueError:
+        return default
+
+
+def env_str(name: str, default: str) -> str:
+    return os.environ.get(name, default)
+
+
+def env_ids(name: str, default: str = '') -> set[int]:
+    return {int(i) for i in os.environ.get(name, default).split(',') if i.strip().isdigit()}
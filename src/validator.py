@@ -1,15 +1,37 @@
 
+import multiprocessing
+import contextlib
+import threading
+import hashlib
+import codecs
+import array
 import asyncio
+import pickle
+import queue
 import json
 import io
+import os
 
 import aiofiles
 import aiopath
 import aiohttp
 
+import numpy as np
+import ijson
+
+from concurrent.futures.process import BrokenProcessPool
+from concurrent.futures import ProcessPoolExecutor
 from PIL import Image
 from enum import Enum
 
+from src.cache import ChangelogCache, LevelHistory, ResultCache
+from src.snapshot import Snapshot, read_snapshot, write_snapshot
+from src.archive import MapArchive
+from src.refresh import RefreshChannel
+from src.poller import VersionPoller
+from src.scanner import BracketIndex, find_member
+from src.metrics import metrics, run_recorded
+from src.config import Config
 from src.logger import log
 
 
@@ -20,108 +42,267 @@ class Tileset(Enum):
     TILESET2 = 'tileset2.png'
 
     def __init__(self, file_name) -> None:
+        self.file_name: str = file_name
 
-        file_url: str = f'https://talesofyore.com/play/tilesets/{file_name}'
+    @property
+    def url(self) -> str:
+        return f'{Config.BASE_URL}/play/tilesets/{self.file_name}'
+
+    async def download(
+        self,
+        session: aiohttp.ClientSession,
+        previous: 'TilesetImage | None' = None,
+        request_timeout: aiohttp.ClientTimeout | None = None
+    ) -> tuple[bytes, str | None, str | None] | None:
+        # returns (PNG bytes, ETag, Last-Modified) of a changed image,
+        # returns None when the image is unchanged, raises when it failed
+
+        request_headers: dict[str, str] = {}
+
+        # only revalidate when there is a processed tileset to fall back on
+        if previous is not None and previous.blank_table.any():
+            if previous.etag:
+                request_headers['If-None-Match'] = previous.etag
+            if previous.last_modified:
+                request_headers['If-Modified-Since'] = previous.last_modified
+
+        async with session.get(url=self.url, headers=request_headers, timeout=request_timeout) as response:
+            if response.status == 304:
+                log.info(f'tileset {self.name} is unchanged')
+                return None
 
-        self.blank_tiles: set[int] = set()
-        self.file_name: str = file_name
-        self.url: str = file_url
-        self.image_object = None
-    
-    async def download(self, session: aiohttp.ClientSession) -> None:
+            response.raise_for_status()
+            image_data: bytes = await response.read()
 
-        bytes_buffer: io.BytesIO = io.BytesIO()
+            return (
+                image_data,
+                response.headers.get('ETag'),
+                response.headers.get('Last-Modified')
+            )
 
-        try:    
-            async with session.get(url=self.url) as response:
-                response.raise_for_status()
 
-                async for chunk in response.content.iter_chunked(4096):
-                    if chunk: bytes_buffer.write(chunk)
+def find_blanks(image: Image) -> tuple[np.ndarray, Image] | None:
+    # returns the blank tile table and a copy of the tileset
+    # with empty tiles highlighted for debugging
 
-        except Exception as e:
-            log.error('failed downloading', self.name, e)
-            return
-        
-        self.image_object = Image.open(bytes_buffer).convert('RGBA')
+    if image.width % 8 or image.height % 8:
+        log.error('Invalid tileset dimensions')
+        return None
 
-    def retrieve_blanks(self) -> None:
-        # modify the tileset to highlight empty tiles
-        # and collect the tile ids for validator
+    tiles_x, tiles_y = image.width // 8, image.height // 8
+    color_purple: tuple[int, ...] = (255, 0, 255, 127)
 
-        image: Image = self.image_object
-        blanks: set[int] = self.blank_tiles
+    # view the pixels as a (rows, cols, 8, 8, 4) grid of tiles,
+    # a tile is blank when all of its pixels are (0, 0, 0, 0)
+    pixels: np.ndarray = np.array(image.convert('RGBA'), dtype=np.uint8)
+    tiles: np.ndarray = pixels.reshape(tiles_y, 8, tiles_x, 8, 4).swapaxes(1, 2)
+    blank_mask: np.ndarray = ~tiles.any(axis=(2, 3, 4))
 
-        if image is None:
-            log.warn('missing image object in', self.name)
-            return
+    tiles[blank_mask] = color_purple
 
-        if image.width % 8 or image.height % 8:
-            log.error('Invalid tileset dimensions of', self.name)
-            return
+    # row-major tile order matches the tile ids used by LDtk
+    return blank_mask.ravel(), Image.fromarray(pixels, 'RGBA')
+
+
+class TilesetImage:
 
-        blank_tile: Image = Image.new('RGBA', (8, 8), (0,) * 4)
-        tiles_x, tiles_y = image.width // 8, image.height // 8
-        color_purple: tuple[int, ...] = (255, 0, 255, 127)
+    # processed state of one tileset image, never modified after creation,
+    # a changed image on the website produces a new TilesetImage
 
-        for tile_id in range(tiles_x * tiles_y):
+    def __init__(
+        self,
+        tileset: Tileset,
+        blank_table: np.ndarray,
+        content_hash: str | None = None,
+        debug_image: Image.Image | None = None,
+        etag: str | None = None,
+        last_modified: str | None = None
+    ) -> None:
 
-            tile_x = tile_id % tiles_x * 8
-            tile_y = tile_id // tiles_x * 8
+        # blank_table[tile_id] is True for fully transparent tiles
+        self.blank_table: np.ndarray = blank_table
+        self.blank_table.flags.writeable = False
 
-            tile_box: tuple = (
-                tile_x,
-                tile_y,
-                tile_x + 8,
-                tile_y + 8
+        self.content_hash: str | None = content_hash
+        self.debug_image: Image.Image | None = debug_image
+        self.tileset: Tileset = tileset
+
+        # validators of the processed image for conditional requests
+        self.etag: str | None = etag
+        self.last_modified: str | None = last_modified
+
+    @property
+    def blank_tiles(self) -> set[int]:
+        return set(np.flatnonzero(self.blank_table).tolist())
+
+    @classmethod
+    def empty(cls, tileset: Tileset) -> 'TilesetImage':
+        return cls(tileset, np.zeros(0, dtype=bool))
+
+    @classmethod
+    def from_png(cls, tileset: Tileset, image_data: bytes, etag: str | None, last_modified: str | None) -> 'TilesetImage | None':
+
+        if (found := find_blanks(Image.open(io.BytesIO(image_data)))) is None:
+            log.error('failed processing', tileset.name)
+            return None
+
+        blank_table, debug_image = found
+        content_hash: str = hashlib.sha256(image_data).hexdigest()
+
+        return cls(tileset, blank_table, content_hash, debug_image, etag, last_modified)
+
+    async def refresh(self, session: aiohttp.ClientSession, request_timeout: aiohttp.ClientTimeout | None = None) -> 'TilesetImage':
+        # returns the image to use from now on, which is this one when the
+        # image is unchanged or could not be processed, download errors are
+        # raised so a version is not marked as processed with stale tables
+
+        if (downloaded := await self.tileset.download(session, self, request_timeout)) is None:
+            return self
+
+        image_data, etag, last_modified = downloaded
+        image_hash = await asyncio.to_thread(hashlib.sha256, image_data)
+
+        # a new version often ships the same image, keep its blank tiles
+        if image_hash.hexdigest() == self.content_hash:
+            log.info(f'tileset {self.tileset.name} content is unchanged')
+            tileset_image = TilesetImage(
+                self.tileset, self.blank_table, self.content_hash, self.debug_image, etag, last_modified
             )
 
-            if blank_tile.tobytes() == image.crop(tile_box).tobytes():
-                image.paste(color_purple, tile_box)
-                blanks.add(tile_id)
+            await tileset_image.save_headers()
+            return tileset_image
+
+        tileset_image: TilesetImage | None = await asyncio.to_thread(
+            TilesetImage.from_png, self.tileset, image_data, etag, last_modified
+        )
+
+        if tileset_image is None:
+            return self
+
+        await tileset_image.save()
+        return tileset_image
 
     async def save(self):
         # save the modified debug tileset
         # and list of its empty tiles to disk
 
-        if not self.image_object or not self.blank_tiles:
-            log.error(f'incomplete tileset object {self.name}')
+        if not self.debug_image or not self.blank_table.any():
+            log.error(f'incomplete tileset object {self.tileset.name}')
             return
 
-        image: Image = self.image_object
         bytes_buffer: io.BytesIO = io.BytesIO()
-        image.save(bytes_buffer, format='PNG')
+        await asyncio.to_thread(self.debug_image.save, bytes_buffer, format='PNG')
         
         try:
             await aiopath.AsyncPath('tilesets').mkdir(exist_ok=True)
-            file_path: str = 'tilesets/' + self.file_name
+            file_path: str = 'tilesets/' + self.tileset.file_name
             async with aiofiles.open(file_path, 'wb') as file:
                 await file.write(bytes_buffer.getbuffer())
         
         except Exception as e:
-            log.error(f'saving {self.file_name} failed:', e)
+            log.error(f'saving {self.tileset.file_name} failed:', e)
 
         try:
             await aiopath.AsyncPath('blanks').mkdir(exist_ok=True)
-            file_path: str = 'blanks/' + self.name
+            file_path: str = 'blanks/' + self.tileset.name
             async with aiofiles.open(file_path, 'w') as file:
-                for tile_id in self.blank_tiles:
-                    await file.write(f'{tile_id}\n')
+                tile_ids: np.ndarray = np.flatnonzero(self.blank_table)
+                await file.write(''.join(f'{tile_id}\n' for tile_id in tile_ids.tolist()))
         
         except Exception as e:
-            log.error(f'saving {self.name} failed:', e)
+            log.error(f'saving {self.tileset.name} failed:', e)
+
+        await self.save_headers()
+
+    def headers(self) -> dict:
+        return {'etag': self.etag, 'last_modified': self.last_modified, 'content_hash': self.content_hash}
+
+    async def save_headers(self) -> None:
+
+        try:
+            await aiopath.AsyncPath('tilesets').mkdir(exist_ok=True)
+            file_path: str = 'tilesets/' + self.tileset.file_name + '.headers'
+            async with aiofiles.open(file_path, 'w') as file:
+                await file.write(json.dumps(self.headers()))
+
+        except Exception as e:
+            log.error(f'saving {self.tileset.name} headers failed:', e)
+
+    @classmethod
+    async def load(cls, tileset: Tileset) -> 'TilesetImage':
+
+        blanks_path: str = 'blanks/' + tileset.name
+        if not await aiopath.AsyncPath(blanks_path).exists():
+            log.warn('no blank tiles file for', tileset.name)
+            return cls.empty(tileset)
+
+        async with aiofiles.open(blanks_path, 'r') as blanks_file:
+            tile_ids = np.array((await blanks_file.read()).split(), dtype=np.int64)
+
+        blank_table: np.ndarray = np.zeros(tile_ids.max(initial=-1) + 1, dtype=bool)
+        blank_table[tile_ids] = True
+
+        headers: dict = {}
+        headers_path: str = 'tilesets/' + tileset.file_name + '.headers'
+        if await aiopath.AsyncPath(headers_path).exists():
+            async with aiofiles.open(headers_path, 'r') as file:
+                headers = json.loads(await file.read())
+
+        return cls(
+            tileset,
+            blank_table,
+            content_hash=headers.get('content_hash'),
+            etag=headers.get('etag'),
+            last_modified=headers.get('last_modified')
+        )
+
+
+class TilesetState:
+
+    # the game version with the processed image of every tileset, built
+    # off to the side on refresh and swapped in with a single assignment,
+    # validations keep the state they started with until they finish
+
+    def __init__(self, version: int = 0, images: dict[Tileset, TilesetImage] | None = None) -> None:
+        images = images or {}
+
+        self.images: dict[Tileset, TilesetImage] = {
+            tileset: images.get(tileset) or TilesetImage.empty(tileset) for tileset in Tileset
+        }
+
+        self.blank_tables: dict[Tileset, np.ndarray] = {
+            tileset: tileset_image.blank_table for tileset, tileset_image in self.images.items()
+        }
+
+        self.version: int = version
+        self.fingerprint: str = self.make_fingerprint()
+
+    @classmethod
+    def from_tables(cls, blank_tables: dict[Tileset, np.ndarray], version: int = 0) -> 'TilesetState':
+        return cls(version, {
+            tileset: TilesetImage(tileset, blank_table) for tileset, blank_table in blank_tables.items()
+        })
+
+    def make_fingerprint(self) -> str:
+
+        blanks_hash = hashlib.sha256()
+        for tileset, blank_table in self.blank_tables.items():
+            blanks_hash.update(tileset.name.encode())
+            blanks_hash.update(np.flatnonzero(blank_table).tobytes())
+
+        return blanks_hash.hexdigest()
 
 
 class LDtkMap:
     
-    def __init__(self, data: dict) -> None:
+    def __init__(self, data: dict, blanks: dict | None = None) -> None:
         self.levels: list[LDtkLevel] = []
         self.warnings: int = 0
         self.errors: int = 0
         self.data = data
 
         for level_data in data.get('levels'):
-            ldtk_level = LDtkLevel(level_data)
+            ldtk_level = LDtkLevel(level_data, blanks)
             self.levels.append(ldtk_level)
 
     def validate_levels(self) -> tuple[int, int]:
@@ -133,6 +314,16 @@ class LDtkMap:
         
         return self.errors, self.warnings
 
+    @staticmethod
+    def is_up_to_date(defs_old: dict) -> bool:
+        # TODO remove hard-coded lengths
+        return (
+            len(defs_old['levelFields']) == 23 and
+            len(defs_old['entities']) == 19 and
+            len(defs_old['tilesets']) == 3 and
+            len(defs_old['layers']) == 12
+        )
+
     def update_definitions(self, defs_new: dict) -> bytes | bool:
         # returns bytes: successfully updated
         # returns True: already up-to-date
@@ -142,17 +333,10 @@ class LDtkMap:
         # avoid fatal error by replacing layers.OverAll.uid from 410 to 167
         # self.cached_defs['layers'][1]['uid'] = 167
 
-        # TODO remove hard-coded lengths
         # TODO keep old enums
 
-        defs_old: dict = self.data['defs']
         try:
-            if (
-                len(defs_old['levelFields']) == 23 and
-                len(defs_old['entities']) == 19 and
-                len(defs_old['tilesets']) == 3 and
-                len(defs_old['layers']) == 12
-            ):
+            if self.is_up_to_date(self.data['defs']):
                 return True
         
         except KeyError as e:
@@ -163,13 +347,12 @@ class LDtkMap:
             self.data['defs'] = defs_new
             json_str: str = json.dumps(self.data)
             json_bytes: bytes = json_str.encode()
-            bytes_buffer = io.BytesIO(json_bytes)
 
         except Exception as e:
             log.error('failed deserialization of updated map:', e)
             return False
 
-        return bytes_buffer
+        return json_bytes
 
 
 class LDtkLevel:
@@ -192,11 +375,20 @@ class LDtkLevel:
         'Walls', 'Walls2', 'Objects', 'Objects2'
     )
 
-    def __init__(self, data: dict) -> None:
-        self.layers = data.get('layerInstances', [])
+    def __init__(self, data: dict, blanks: dict | None = None) -> None:
+        # levels saved to separate files have null layerInstances
+        # in the project and reference their file instead
+        self.external_path: str | None = data.get('externalRelPath')
+        self.identifier: str = data.get('identifier', 'Level')
+        self.layers = data.get('layerInstances') or []
         self.warnings: int = 0
         self.errors: int = 0
 
+        # blank tile tables per tileset from the TilesetState the
+        # validation started with, without them no tile counts as blank
+        self.blanks: dict[Tileset, np.ndarray] = blanks or TilesetState().blank_tables
+        self.blank_sets: dict[Tileset, set[int]] = {}
+
     def validate_layers(self) -> tuple[int, int]:
 
         for layer in self.layers:
@@ -215,156 +407,1003 @@ class LDtkLevel:
 
     def count_holes(self, layer: dict, layer_id: str) -> int:
 
-        tileset: Tileset = self.LAYERS.get(layer_id)
+        blank_tiles: set[int] = self.blank_ids(self.LAYERS[layer_id])
         tiles_counted: int = 0
 
+        # missing or null tile ids are never in the set
         for tile in layer.get('gridTiles', []):
-            if tile.get('t') in tileset.blank_tiles:
+            if tile.get('t') in blank_tiles:
                 tiles_counted += 1
-        
+
         return tiles_counted
 
+    def blank_ids(self, tileset: Tileset) -> set[int]:
+        # the lookup tables are turned into id sets once per level
 
-class Validator:
+        if (blank_tiles := self.blank_sets.get(tileset)) is None:
+            blank_tiles = self.blank_sets[tileset] = set(np.flatnonzero(self.blanks[tileset]).tolist())
 
-    def __init__(self) -> None:
-        self.client_session: aiohttp.ClientSession | None = None
-        self.update_interval: int = 12 * 60 * 60
-        self.cached_version: int = 0
-        self.cached_defs: dict = {}
+        return blank_tiles
 
-    async def process_validate(self, attachment) -> tuple[int, int] | None:
-        # only LDtk version matters due to JSON schema
-        # tileset version is irrelevant as tile positions
-        # are not changed, but new tiles are added
+
+def count_blanks(tile_ids: np.ndarray, blank_table: np.ndarray) -> int:
+    # ids outside of the table are never blank, they
+    # belong to tiles added after the table was built
+
+    in_range: np.ndarray = (tile_ids >= 0) & (tile_ids < blank_table.size)
+    return int(np.count_nonzero(blank_table[tile_ids[in_range]]))
+
+
+class ChunkReader:
+
+    # blocking file object over chunks handed in from the event loop, the
+    # queue is bounded so a slow parser holds the download back instead
+    # of buffering the whole upload
+
+    def __init__(self, max_chunks: int = 8) -> None:
+        self.chunks: queue.Queue = queue.Queue(maxsize=max_chunks)
+        self.closed = threading.Event()
+        self.buffer: bytes = b''
+        self.finished: bool = False
+        self.started: bool = False
+
+    def put(self, item: bytes | BaseException) -> None:
+        # called from a worker thread while the queue is full,
+        # gives up once the parser stopped reading
+
+        while not self.closed.is_set():
+            try:
+                self.chunks.put(item, timeout=0.1)
+                return
+
+            except queue.Full:
+                continue
+
+    async def feed(self, item: bytes | BaseException) -> None:
 
         try:
-            await attachment.save(
-                bytes_buffer := io.BytesIO()
-                # seek_begin=True, use_cached=True
-            )
-        
-        except Exception as e:
-            log.error('failed downloading map:', e)
-            return
+            self.chunks.put_nowait(item)
+
+        except queue.Full:
+            await asyncio.to_thread(self.put, item)
 
-        # create project here
-        # class Project?
+    def read(self, size: int = -1) -> bytes:
+
+        # a byte order mark is dropped like the buffered paths accept it,
+        # chunks are joined until the start can be told apart from it
+        while not self.finished and (not self.buffer or not self.started and len(self.buffer) < len(codecs.BOM_UTF8)):
+            try:
+                item: bytes | BaseException = self.chunks.get(timeout=0.1)
+
+            except queue.Empty:
+                if self.closed.is_set():
+                    raise ValueError('map stream was closed')
+                continue
+
+            if isinstance(item, BaseException):
+                raise item
+
+            if not item:
+                self.finished = True
+
+            self.buffer += item
+
+            if not self.started and (self.finished or len(self.buffer) >= len(codecs.BOM_UTF8)):
+                self.buffer = self.buffer.removeprefix(codecs.BOM_UTF8)
+                self.started = True
+
+        chunk, self.buffer = (self.buffer, b'') if size < 0 else (self.buffer[:size], self.buffer[size:])
+        return chunk
+
+
+class LDtkStream:
+
+    # layer objects in project files and in separate level files
+    LAYER_PREFIXES: tuple = (
+        'levels.item.layerInstances.item',
+        'layerInstances.item'
+    )
+
+    def __init__(self, blanks: dict | None = None) -> None:
+        self.warnings: int = 0
+        self.errors: int = 0
+
+        self.blanks: dict[Tileset, np.ndarray] = blanks or TilesetState().blank_tables
+
+        self.prefixes: dict[str, str] = {}
+        for prefix in self.LAYER_PREFIXES:
+            self.prefixes[prefix + '.__identifier'] = 'identifier'
+            self.prefixes[prefix + '.gridTiles.item.t'] = 'tile'
+            self.prefixes[prefix] = 'layer'
+
+        self.is_ldtk: bool = False
+        self.layer_id: str | None = None
+        self.layer_tiles: array.array = array.array('q')
+
+    async def validate(self, stream) -> tuple[int, int] | None:
+        # stream is any object with an async read(size) method, holes are
+        # counted while the document is being parsed on a worker thread,
+        # the event loop only moves chunks into the bounded queue
+
+        reader = ChunkReader()
+        parsing: asyncio.Task = asyncio.create_task(asyncio.to_thread(self.parse, reader))
 
         try:
-            await aiopath.AsyncPath('saved').mkdir(exist_ok=True)
-                
-            file_path: str = f'./saved/{attachment.filename}'
-            async with aiofiles.open(file_path, 'wb') as map_file:
-                await map_file.write(bytes_buffer.getvalue())
-        
+            while not parsing.done():
+                chunk: bytes = await stream.read(65536)
+                await reader.feed(chunk)
+
+                if not chunk:
+                    break
+
         except Exception as e:
-            log.warn('failed saving map:', e)
+            # the parser raises the error of the download as well
+            await reader.feed(e)
+
+        except BaseException:
+            reader.closed.set()
+
+            # the thread stops at its next read, its task is retrieved
+            # here so a parse error raised meanwhile is never left unhandled
+            parsing.cancel()
+            parsing.add_done_callback(lambda task: task.cancelled() or task.exception())
+            raise
+
+        return await parsing
+
+    def parse(self, reader: ChunkReader) -> tuple[int, int] | None:
 
         try:
-            decoded_str: str = bytes_buffer.getvalue().decode()
-            json_object: dict = json.loads(decoded_str)
+            return self.parse_events(reader)
 
-        except (json.JSONDecodeError, UnicodeDecodeError) as e:
+        finally:
+            # a parser stopping early releases the loop waiting to feed it
+            reader.closed.set()
+
+    def parse_events(self, reader: ChunkReader) -> tuple[int, int] | None:
+
+        events = ijson.parse(reader, buf_size=65536)
+
+        try:
+            for prefix, event, value in events:
+
+                if prefix == '' and event not in ('start_map', 'map_key', 'end_map'):
+                    log.error('failed parsing map: not a JSON object')
+                    return
+
+                if prefix == '' and value in ('levels', 'layerInstances'):
+                    self.is_ldtk = True
+
+                elif prefix == '__header__.app' and value != 'LDtk':
+                    log.error('failed parsing map: not an LDtk file')
+                    return
+
+                elif (kind := self.prefixes.get(prefix)) is not None:
+                    self.handle_event(kind, event, value)
+
+        except (ijson.JSONError, UnicodeDecodeError) as e:
             log.error('failed decoding map:', e)
             return
 
+        if not self.is_ldtk:
+            log.error('failed parsing map')
+            return
+
+        return self.errors, self.warnings
+
+    def handle_event(self, kind: str, event: str, value: any) -> None:
+        # tile ids are collected per layer and counted
+        # in one lookup once the layer object is closed
+
+        if kind == 'tile':
+            self.layer_tiles.append(value)
+
+        elif kind == 'identifier':
+            self.layer_id = value
+
+        elif kind == 'layer' and event == 'start_map':
+            self.layer_id = None
+            self.layer_tiles = array.array('q')
+
+        elif kind == 'layer' and event == 'end_map':
+            if (tileset := LDtkLevel.LAYERS.get(self.layer_id)) is None:
+                return
+
+            tile_ids: np.ndarray = np.frombuffer(self.layer_tiles, dtype=np.int64)
+            blank_tiles: int = count_blanks(tile_ids, self.blanks[tileset])
+
+            if self.layer_id in LDtkLevel.COLLIDABLE:
+                self.errors += blank_tiles
+            else:
+                self.warnings += blank_tiles
+
+
+class MapStream:
+
+    # passes an HTTP body through to the parser while
+    # archiving it and enforcing the size limit
+
+    def __init__(self, content: aiohttp.StreamReader, archive_stream, size_limit: float) -> None:
+        self.content: aiohttp.StreamReader = content
+        self.archive_stream = archive_stream
+        self.size_limit: float = size_limit
+        self.digest = hashlib.sha256()
+        self.finished: bool = False
+        self.size: int = 0
+
+    async def read(self, size: int = -1) -> bytes:
+        chunk: bytes = await self.content.read(size)
+        self.size += len(chunk)
+
+        if not chunk:
+            self.finished = True
+
+        if self.size > self.size_limit:
+            raise ValueError(f'map exceeds {self.size_limit:.0f} bytes')
+
+        if self.archive_stream is not None and chunk:
+            await self.archive_stream.write(chunk)
+
+        self.digest.update(chunk)
+
+        return chunk
+
+
+# the functions below are the CPU-bound parts of validation,
+# they receive plain data so they can run in a worker process
+
+PHASE_METRIC: str = 'jimbot_validation_phase_seconds'
+metrics.describe(PHASE_METRIC, 'Duration of the steps of map validation and updates')
+
+def validate_map(map_data: bytes, blanks: dict) -> tuple[int, int] | None:
+
+    # json.loads decodes UTF-8 bytes itself, without an intermediate str
+    try:
+        with metrics.timer(PHASE_METRIC, phase='parse'):
+            json_object: dict = json.loads(map_data)
+
+    except (json.JSONDecodeError, UnicodeDecodeError) as e:
+        log.error('failed decoding map:', e)
+        return
+
+    with metrics.timer(PHASE_METRIC, phase='count'):
         if 'levels' in json_object:
-            ldtk_map = LDtkMap(json_object)
+            ldtk_map = LDtkMap(json_object, blanks)
             return ldtk_map.validate_levels()
         
         elif 'layerInstances' in json_object:
-            ldtk_level = LDtkLevel(json_object)
+            ldtk_level = LDtkLevel(json_object, blanks)
             return ldtk_level.validate_layers()
 
+    log.error('failed parsing map')
+
+
+def validate_level_file(map_data: bytes, blanks: dict) -> list[tuple[str, str | None, int, int]] | None:
+    # returns (identifier, external path, errors, warnings) for every level,
+    # levels stored in other files are returned with their path and no counts
+
+    try:
+        with metrics.timer(PHASE_METRIC, phase='parse'):
+            json_object: dict = json.loads(map_data)
+
+    except (json.JSONDecodeError, UnicodeDecodeError) as e:
+        log.error('failed decoding map:', e)
+        return
+
+    if not isinstance(json_object, dict):
+        log.error('failed parsing map')
+        return
+
+    with metrics.timer(PHASE_METRIC, phase='count'):
+        if 'levels' in json_object:
+            levels: list[LDtkLevel] = LDtkMap(json_object, blanks).levels
+
+        elif 'layerInstances' in json_object:
+            levels: list[LDtkLevel] = [LDtkLevel(json_object, blanks)]
+
         else:
             log.error('failed parsing map')
+            return
+
+        return [
+            (level.identifier, level.external_path, *level.validate_layers())
+            for level in levels
+        ]
+
+
+def validate_level_spans(map_data: bytes, blanks: dict, known: dict) -> list[tuple[str, str, int, int]] | None:
+    # returns (identifier, digest, errors, warnings) for every level, levels
+    # are hashed in their raw bytes and only those missing from known, which
+    # maps digests to (identifier, errors, warnings), are parsed and counted
+
+    try:
+        with metrics.timer(PHASE_METRIC, phase='scan'):
+            bracket_index = BracketIndex(map_data)
+
+            if (levels_start := bracket_index.member_start(b'levels')) is not None:
+                level_spans: list[tuple[int, int]] = bracket_index.object_items(levels_start)
+
+            elif bracket_index.member_start(b'layerInstances') is not None:
+                level_spans: list[tuple[int, int]] = [(0, len(map_data))]
+
+            else:
+                log.error('failed parsing map')
+                return
+
+    except ValueError as e:
+        log.warn('failed scanning map, parsing it whole:', e)
+        return validate_parsed_levels(map_data, blanks)
+
+    map_view = memoryview(map_data)
+    level_results: list[tuple[str, str, int, int]] = []
+
+    for level_start, level_end in level_spans:
+        digest: str = hashlib.sha256(map_view[level_start:level_end]).hexdigest()
+
+        if digest in known:
+            identifier, errors, warnings = known[digest]
+            level_results.append((identifier, digest, errors, warnings))
+            continue
 
-    async def process_update(self, attachment) -> bytes | bool:
-        # returns bytes: successfully updated
-        # returns True: already up-to-date
-        # return False: failed to update
-        
         try:
-            await attachment.save(
-                bytes_buffer := io.BytesIO()
+            with metrics.timer(PHASE_METRIC, phase='parse'):
+                level_data: dict = json.loads(map_data[level_start:level_end])
+
+        except (json.JSONDecodeError, UnicodeDecodeError) as e:
+            log.error('failed decoding level:', e)
+            return
+
+        with metrics.timer(PHASE_METRIC, phase='count'):
+            ldtk_level = LDtkLevel(level_data, blanks)
+            level_results.append((ldtk_level.identifier, digest, *ldtk_level.validate_layers()))
+
+    return level_results
+
+
+def validate_parsed_levels(map_data: bytes, blanks: dict) -> list[tuple[str, str, int, int]] | None:
+    # fallback for documents the scanner can not walk, levels are hashed
+    # in their re-serialized form so later uploads still match them
+
+    try:
+        with metrics.timer(PHASE_METRIC, phase='parse'):
+            json_object: dict = json.loads(map_data)
+
+    except (json.JSONDecodeError, UnicodeDecodeError) as e:
+        log.error('failed decoding map:', e)
+        return
+
+    if not isinstance(json_object, dict):
+        log.error('failed parsing map')
+        return
+
+    if 'levels' in json_object:
+        levels: list[dict] = json_object['levels'] or []
+
+    elif 'layerInstances' in json_object:
+        levels: list[dict] = [json_object]
+
+    else:
+        log.error('failed parsing map')
+        return
+
+    level_results: list[tuple[str, str, int, int]] = []
+
+    with metrics.timer(PHASE_METRIC, phase='count'):
+        for level_data in levels:
+            digest: str = hashlib.sha256(json.dumps(level_data, separators=(',', ':')).encode()).hexdigest()
+            ldtk_level = LDtkLevel(level_data, blanks)
+            level_results.append((ldtk_level.identifier, digest, *ldtk_level.validate_layers()))
+
+    return level_results
+
+
+def update_map(map_data: bytes, defs_new: dict) -> bytes | bool:
+    # returns bytes: successfully updated
+    # returns True: already up-to-date
+    # return False: failed to update
+
+    # only the top-level defs value is parsed and replaced,
+    # the rest of the upload is copied over byte for byte
+    try:
+        with metrics.timer(PHASE_METRIC, phase='scan'):
+            defs_span: tuple[int, int] | None = find_member(map_data, b'defs')
+
+    except ValueError as e:
+        log.warn('failed scanning map, parsing it whole:', e)
+        return reserialize_map(map_data, defs_new)
+
+    if defs_span is None:
+        return False
+
+    defs_start, defs_end = defs_span
+
+    try:
+        with metrics.timer(PHASE_METRIC, phase='parse'):
+            defs_old: dict = json.loads(map_data[defs_start:defs_end])
+
+        if LDtkMap.is_up_to_date(defs_old):
+            return True
+
+    except (json.JSONDecodeError, UnicodeDecodeError, KeyError, TypeError) as e:
+        log.error('failed parsing defs:', e)
+        return False
+
+    with metrics.timer(PHASE_METRIC, phase='serialize'):
+        map_view = memoryview(map_data)
+
+        return b''.join((
+            map_view[:defs_start],
+            json.dumps(defs_new).encode(),
+            map_view[defs_end:]
+        ))
+
+
+def reserialize_map(map_data: bytes, defs_new: dict) -> bytes | bool:
+
+    try:
+        with metrics.timer(PHASE_METRIC, phase='parse'):
+            json_object: dict = json.loads(map_data)
+
+    except (json.JSONDecodeError, UnicodeDecodeError) as e:
+        log.error('failed parsing map:', e)
+        return False
+    
+    if 'defs' not in json_object:
+        return False
+    
+    with metrics.timer(PHASE_METRIC, phase='serialize'):
+        ldtk_map = LDtkMap(json_object)
+        return ldtk_map.update_definitions(defs_new=defs_new)
+
+
+class WorkerCrashed(Exception):
+    # a job killed its worker twice, e.g. by running out of memory
+    pass
+
+
+class Validator:
+
+    def __init__(self) -> None:
+        self.client_session: aiohttp.ClientSession | None = None
+        self.request_timeout = aiohttp.ClientTimeout(total=Config.REQUEST_TIMEOUT)
+        self.refresh_request: asyncio.Task | None = None
+
+        # in a sharded deployment only the owner refreshes, the other
+        # processes follow the snapshot it writes after every refresh
+        self.owner: bool = True
+        self.snapshot_signature: tuple | None = None
+        self.refresh_channel: RefreshChannel | None = None
+
+        self.poller = VersionPoller(
+            interval=Config.POLL_INTERVAL,
+            release_interval=Config.RELEASE_POLL_INTERVAL,
+            release_hours=Config.RELEASE_HOURS,
+            backoff=Config.POLL_BACKOFF,
+            max_backoff=Config.POLL_MAX_BACKOFF
+        )
+        self.tilesets: TilesetState = TilesetState()
+        self.defs_digest: str = ''
+        self.cached_defs = {}
+
+        self.executor: ProcessPoolExecutor | None = self.make_executor()
+
+        self.result_cache = ResultCache(
+            max_size=Config.RESULT_CACHE_SIZE,
+            cache_dir=Config.RESULT_CACHE_DIR
+        )
+
+        self.changelogs = ChangelogCache(
+            ttl=Config.CHANGELOG_TTL,
+            file_path=Config.CHANGELOG_FILE
+        )
+        self.changelog_requests: dict[int, asyncio.Task] = {}
+
+        self.level_history = LevelHistory(
+            max_size=Config.LEVEL_HISTORY_SIZE,
+            file_path=Config.LEVEL_HISTORY_FILE
+        )
+
+        self.archive = MapArchive(
+            directory=Config.ARCHIVE_DIR,
+            max_size=Config.ARCHIVE_MAX_SIZE,
+            max_age=Config.ARCHIVE_MAX_AGE,
+            level=Config.ARCHIVE_LEVEL
+        )
+
+        self.pending_jobs: int = 0
+        metrics.collect('jimbot_worker_jobs_pending', 'gauge', lambda: self.pending_jobs)
+        metrics.collect('jimbot_result_cache_hits_total', 'counter', lambda: self.result_cache.hits)
+        metrics.collect('jimbot_result_cache_misses_total', 'counter', lambda: self.result_cache.misses)
+        metrics.collect('jimbot_changelog_cache_hits_total', 'counter', lambda: self.changelogs.hits)
+        metrics.collect('jimbot_changelog_cache_misses_total', 'counter', lambda: self.changelogs.misses)
+        metrics.collect('jimbot_game_version', 'gauge', lambda: self.cached_version)
+
+    async def process_validate(self, attachment) -> tuple[int, int] | None:
+        # only LDtk version matters due to JSON schema
+        # tileset version is irrelevant as tile positions
+        # are not changed, but new tiles are added
+
+        # the digest of a streamed upload is only known once it has been
+        # parsed, uploads small enough to buffer are looked up in the cache
+        if self.use_stream(attachment):
+            return await self.stream_validate(attachment)
+
+        # refreshes swap in a new state, this validation keeps its own
+        tilesets: TilesetState = self.tilesets
+
+        if (map_data := await self.download_map(attachment)) is None:
+            return
+
+        metrics.increment('jimbot_validation_bytes_total', len(map_data), kind='validate')
+        digest: str = await self.map_digest(map_data)
+        self.archive.submit(attachment.filename, map_data, digest)
+
+        return await self.run_cached(
+            'validate', digest, tilesets, validate_map, map_data, tilesets.blank_tables
+        )
+
+    async def process_preview(self, attachment) -> tuple[tuple[int, int], list] | None:
+        # returns the validation result and (level name, PNG bytes)
+        # for every level with blank tiles, up to the preview limit
+
+        from src.preview import preview_map
+
+        tilesets: TilesetState = self.tilesets
+
+        if (map_data := await self.download_map(attachment)) is None:
+            return
+
+        metrics.increment('jimbot_validation_bytes_total', len(map_data), kind='preview')
+        digest: str = await self.map_digest(map_data)
+        self.archive.submit(attachment.filename, map_data, digest)
+
+        return await self.run_cached(
+            f'preview:{Config.PREVIEW_MAX_SIZE}:{Config.PREVIEW_LIMIT}',
+            digest,
+            tilesets,
+            preview_map,
+            map_data,
+            tilesets.blank_tables,
+            Config.PREVIEW_MAX_SIZE,
+            Config.PREVIEW_LIMIT
+        )
+
+    def use_stream(self, attachment) -> bool:
+        return (
+            Config.STREAM_VALIDATE and self.client_session is not None
+            and attachment.size > self.max_upload_size(buffered=True)
+        )
+
+    def use_incremental(self, attachment) -> bool:
+        return Config.INCREMENTAL_VALIDATE and attachment.size <= self.max_upload_size(buffered=True)
+
+    async def process_incremental(self, attachment, owner_id: int) -> tuple[list, dict | None, int] | None:
+        # returns (identifier, digest, errors, warnings) per level, the
+        # (errors, warnings) per level of the previous upload of this file
+        # by the same user and how many levels had to be recounted
+
+        tilesets: TilesetState = self.tilesets
+
+        if (map_data := await self.download_map(attachment)) is None:
+            return
+
+        metrics.increment('jimbot_validation_bytes_total', len(map_data), kind='incremental')
+        digest: str = await self.map_digest(map_data)
+        self.archive.submit(attachment.filename, map_data, digest)
+
+        # results are only reused when the blank tiles are the same
+        fingerprint: str = self.make_cache_key('levels', '', tilesets)
+        previous: tuple[str, list] | None = self.level_history.get(owner_id, attachment.filename)
+
+        known: dict[str, tuple[str, int, int]] = {}
+        previous_levels: dict[str, tuple[int, int]] | None = None
+
+        if previous is not None:
+            previous_fingerprint, levels = previous
+            previous_levels = {identifier: (errors, warnings) for identifier, _, errors, warnings in levels}
+
+            if previous_fingerprint == fingerprint:
+                known = {digest: (identifier, errors, warnings) for identifier, digest, errors, warnings in levels}
+
+        # hashing the level spans costs more than it saves on a first upload,
+        # the levels are counted in one parse and hashed from the next upload
+        # on, bench_incremental shows where each approach wins
+        if previous is None:
+            level_files: list | None = await self.run_cached(
+                'level_file', digest, tilesets, validate_level_file, map_data, tilesets.blank_tables
             )
-        
+
+            level_results: list | None = level_files and [
+                (identifier, None, errors, warnings) for identifier, _, errors, warnings in level_files
+            ]
+
+        # levels of an identical upload are taken from the cache whole,
+        # the known levels only speed up counting and never change results
+        else:
+            level_results: list | None = await self.run_cached(
+                'levels', digest, tilesets, validate_level_spans, map_data, tilesets.blank_tables, known
+            )
+
+        if level_results is None:
+            return
+
+        await self.level_history.put(owner_id, attachment.filename, fingerprint, level_results)
+
+        recounted: int = sum(1 for _, digest, _, _ in level_results if digest not in known)
+        metrics.increment('jimbot_levels_recounted_total', recounted)
+        metrics.increment('jimbot_levels_reused_total', len(level_results) - recounted)
+
+        return level_results, previous_levels, recounted
+
+    async def process_project(self, attachments: list) -> tuple[list[tuple[str, int, int]], list[str]] | None:
+        # validates a project together with its level files, returns
+        # (level name, errors, warnings) per level and the referenced
+        # level files that were not attached
+
+        tilesets: TilesetState = self.tilesets
+
+        downloads: list[bytes | None] = await asyncio.gather(*(
+            self.download_map(attachment) for attachment in attachments
+        ))
+
+        if None in downloads:
+            return
+
+        digests: list[str] = await asyncio.gather(*(self.map_digest(map_data) for map_data in downloads))
+
+        for attachment, map_data, digest in zip(attachments, downloads, digests):
+            metrics.increment('jimbot_validation_bytes_total', len(map_data), kind='project')
+            self.archive.submit(attachment.filename, map_data, digest)
+
+        file_results: list[list | None] = await asyncio.gather(*(
+            self.run_cached('level_file', digest, tilesets, validate_level_file, map_data, tilesets.blank_tables)
+            for map_data, digest in zip(downloads, digests)
+        ))
+
+        if None in file_results:
+            return
+
+        level_files: dict[str, list] = {
+            attachment.filename: levels
+            for attachment, levels in zip(attachments, file_results)
+        }
+
+        referenced: set[str] = {
+            self.external_file_name(external_path)
+            for levels in level_files.values()
+            for _, external_path, _, _ in levels if external_path is not None
+        }
+
+        level_results: list[tuple[str, int, int]] = []
+        missing: list[str] = []
+
+        # referenced level files are reported in project order,
+        # level files without a project are reported on their own
+        for file_name, levels in level_files.items():
+            if file_name in referenced:
+                continue
+
+            for identifier, external_path, errors, warnings in levels:
+                if external_path is None:
+                    level_results.append((identifier, errors, warnings))
+                    continue
+
+                level_file: str = self.external_file_name(external_path)
+                if level_file not in level_files:
+                    missing.append(level_file)
+                    continue
+
+                level_results.extend(
+                    (level_identifier, level_errors, level_warnings)
+                    for level_identifier, _, level_errors, level_warnings in level_files[level_file]
+                )
+
+        return level_results, missing
+
+    @staticmethod
+    def external_file_name(external_path: str) -> str:
+        # externalRelPath is relative to the project and may include
+        # folders, attached level files are matched by their name alone
+        return external_path.replace('\\', '/').rsplit('/', 1)[-1]
+
+    async def download_map(self, attachment) -> bytes | None:
+        # Attachment.read returns the body as is, saving into a BytesIO
+        # and calling getvalue would copy the whole map twice more
+
+        try:
+            with metrics.timer(PHASE_METRIC, phase='download'):
+                return await attachment.read()
+
         except Exception as e:
             log.error('failed downloading map:', e)
-            return False
+
+    async def stream_validate(self, attachment) -> tuple[int, int] | None:
+        # validates while the attachment downloads, memory stays
+        # roughly constant instead of growing with the map size
+
+        tilesets: TilesetState = self.tilesets
+        archive_stream = await self.archive.open_stream(attachment.filename)
 
         try:
-            decoded_str: str = bytes_buffer.getvalue().decode()
-            json_object: dict = json.loads(decoded_str)
+            with metrics.timer(PHASE_METRIC, phase='stream'):
+                async with self.client_session.get(url=attachment.url) as response:
+                    response.raise_for_status()
 
-        except (json.JSONDecodeError, UnicodeDecodeError) as e:
-            log.error('failed parsing map:', e)
-            return False
-        
-        if 'defs' not in json_object:
+                    map_stream = MapStream(response.content, archive_stream, Config.STREAM_MAX_SIZE)
+                    ldtk_stream = LDtkStream(tilesets.blank_tables)
+                    validation_result = await ldtk_stream.validate(map_stream)
+
+        except Exception as e:
+            log.error('failed streaming map:', e)
+
+            if archive_stream is not None:
+                self.archive.spawn(archive_stream.abort())
+            return
+
+        # a rejected or partly read upload would be archived as a prefix
+        # under the digest of that prefix, only complete maps are kept
+        if archive_stream is not None:
+            if validation_result is not None and map_stream.finished:
+                self.archive.spawn(archive_stream.close(map_stream.digest.hexdigest()))
+            else:
+                self.archive.spawn(archive_stream.abort())
+
+        metrics.increment('jimbot_validation_bytes_total', map_stream.size, kind='stream')
+
+        # the digest is only known once the stream has been read,
+        # so streamed uploads fill the cache for the buffered paths
+        if validation_result is not None:
+            cache_key: str = self.make_cache_key('validate', map_stream.digest.hexdigest(), tilesets)
+            await self.result_cache.put(cache_key, validation_result, size=64)
+
+        return validation_result
+
+    def max_upload_size(self, buffered: bool = False) -> float:
+        # updates and previews hold the whole document and
+        # are limited to what fits comfortably in memory
+
+        if Config.STREAM_VALIDATE and not buffered:
+            return Config.STREAM_MAX_SIZE
+
+        return 8e6
+
+    def estimate_memory(self, size: int, buffered: bool = False) -> int:
+        # a parsed document takes roughly ten times its size in Python
+        # objects, streaming keeps about one read buffer per upload
+
+        if Config.STREAM_VALIDATE and not buffered:
+            return min(size, 1_000_000)
+
+        return size * 12
+
+    async def process_update(self, attachment) -> io.BytesIO | bool:
+        # returns BytesIO: successfully updated
+        # returns True: already up-to-date
+        # return False: failed to update
+
+        tilesets: TilesetState = self.tilesets
+        defs, defs_digest = self.cached_defs, self.defs_digest
+
+        if (map_data := await self.download_map(attachment)) is None:
             return False
-        
-        ldtk_map = LDtkMap(json_object)
-        return ldtk_map.update_definitions(defs_new=self.cached_defs)
 
-    async def fetch_changelog(self, version: int) -> dict | None:
+        metrics.increment('jimbot_validation_bytes_total', len(map_data), kind='update')
+        digest: str = await self.map_digest(map_data)
+        self.archive.submit(attachment.filename, map_data, digest)
+
+        # the defs are spliced into the result, persisted entries
+        # must not outlive a change of the defs file
+        cache_key: str = self.make_cache_key(f'update:{defs_digest}', digest, tilesets)
+        if (update_result := self.result_cache.get(cache_key)) is None:
+
+            update_result: bytes | bool | None = await self.run_job(
+                update_map, map_data, defs
+            )
+
+            if type(update_result) is bytes:
+                await self.result_cache.put(cache_key, update_result, size=len(update_result))
+            elif update_result is True:
+                await self.result_cache.put(cache_key, update_result, size=64)
+
+        else:
+            log.info('using cached update result')
+
+        if type(update_result) is bytes:
+            return io.BytesIO(update_result)
+
+        return bool(update_result)
+
+    async def run_cached(self, kind: str, digest: str, tilesets: TilesetState, func, *args: any) -> any:
+        # results are keyed by the upload content and the blank tables,
+        # failed jobs return None and are never cached
+
+        cache_key: str = self.make_cache_key(kind, digest, tilesets)
+        if (result := self.result_cache.get(cache_key)) is not None:
+            log.info(f'using cached {kind.split(":")[0]} result')
+            return result
+
+        if (result := await self.run_job(func, *args)) is not None:
+            size: int = await asyncio.to_thread(lambda: len(pickle.dumps(result)))
+            await self.result_cache.put(cache_key, result, size=size)
+
+        return result
+
+    @staticmethod
+    def make_executor() -> ProcessPoolExecutor | None:
+
+        if Config.POOL_SIZE <= 0:
+            return None
+
+        return ProcessPoolExecutor(
+            max_workers=Config.POOL_SIZE,
+            mp_context=multiprocessing.get_context('spawn')
+        )
+
+    def replace_executor(self, broken: ProcessPoolExecutor) -> None:
+        # jobs failing together on one broken pool replace it only once
+
+        if self.executor is not broken:
+            return
+
+        log.error('process pool broke, starting new workers')
+        metrics.increment('jimbot_worker_pool_restarts_total')
+
+        broken.shutdown(wait=False, cancel_futures=True)
+        self.executor = self.make_executor()
+
+    async def run_job(self, func, *args: any) -> any:
+        # run CPU-bound work in the process pool when enabled,
+        # the event loop stays responsive while maps are processed,
+        # raises WorkerCrashed when the job breaks a fresh pool again
+
+        # without a pool the job runs inline, a failure
+        # is logged and returned the same way as in a worker
+        if self.executor is None:
+            try:
+                return func(*args)
+
+            except Exception as e:
+                log.error(f'failed running {func.__name__}:', e)
+                return
+
+        loop = asyncio.get_running_loop()
+        self.pending_jobs += 1
+
+        try:
+            for attempt in range(2):
+                executor: ProcessPoolExecutor = self.executor
+
+                try:
+                    result, observations = await loop.run_in_executor(
+                        executor, run_recorded, func, *args
+                    )
+                    break
 
-        changelog_url: str = f'https://talesofyore.com/play/changelog/{version}.json'
+                except BrokenProcessPool:
+                    # a dead worker breaks the whole pool for good,
+                    # the job is retried once on new workers
+                    self.replace_executor(executor)
+
+                    if attempt:
+                        raise WorkerCrashed(f'worker died running {func.__name__}')
+
+                except Exception as e:
+                    log.error(f'worker failed running {func.__name__}:', e)
+                    return
+
+        finally:
+            self.pending_jobs -= 1
+
+        metrics.merge(observations)
+        return result
+
+    @property
+    def cached_version(self) -> int:
+        return self.tilesets.version
+
+    @property
+    def cached_defs(self) -> dict:
+        return self.defs
+
+    @cached_defs.setter
+    def cached_defs(self, defs: dict) -> None:
+        # defs are only ever replaced whole, the digest is taken once here
+        self.defs: dict = defs
+        self.defs_digest = hashlib.sha256(json.dumps(defs, sort_keys=True).encode()).hexdigest()
+
+    def make_cache_key(self, kind: str, digest: str, tilesets: TilesetState) -> str:
+        return ResultCache.make_key(kind, digest, tilesets.version, tilesets.fingerprint)
+
+    async def map_digest(self, map_data: bytes) -> str:
+        # hashing large uploads releases the GIL, keep it off the loop
+        map_hash = await asyncio.to_thread(hashlib.sha256, map_data)
+        return map_hash.hexdigest()
+
+    async def fetch_changelog(self, version: int, refresh: bool = False) -> dict | None:
+
+        if not refresh:
+            is_cached, changelog = self.changelogs.get(version, self.cached_version)
+            if is_cached:
+                return changelog
+
+        # concurrent requests for the same version share one download
+        if (request := self.changelog_requests.get(version)) is None:
+            request = asyncio.create_task(self.refresh_changelog(version))
+            request.add_done_callback(lambda _: self.changelog_requests.pop(version, None))
+            self.changelog_requests[version] = request
+
+        return await asyncio.shield(request)
+
+    async def refresh_changelog(self, version: int) -> dict | None:
+
+        is_cacheable, changelog = await self.download_changelog(version)
+        if is_cacheable:
+            await self.changelogs.put(version, changelog)
+
+        return changelog
+
+    async def download_changelog(self, version: int) -> tuple[bool, dict | None]:
+        # returns (True, changelog): cacheable response, None when missing
+        # returns (False, None): request failed and should be retried
+
+        changelog_url: str = f'{Config.BASE_URL}/play/changelog/{version}.json'
 
         bytes_buffer: bytearray = bytearray()
 
         try:
-            async with self.client_session.get(url=changelog_url) as response:
+            async with self.client_session.get(url=changelog_url, timeout=self.request_timeout) as response:
 
                 if response.status == 404:
-                    return
+                    return True, None
 
                 elif not response.ok:
                     log.error('failed request. Status:', response.status)
-                    return
+                    return False, None
 
                 async for chunk in response.content.iter_chunked(4096):
                     if chunk: bytes_buffer.extend(chunk)
 
         except Exception as e:
             log.error('failed fetching changelog v', version, e)
-            return
+            return False, None
         
         try:
-            decoded_str: str = bytes_buffer.decode()
-            json_object: dict = json.loads(decoded_str)
+            json_object: dict = json.loads(bytes_buffer)
 
         except (json.JSONDecodeError, UnicodeDecodeError):
             log.error('failed parsing json')
-            return
+            return False, None
         
         if type(json_object) is dict:
-            return json_object
+            return True, json_object
+
+        return True, None
 
     async def fetch_version(self) -> int:
         
-        url_version: str = 'https://talesofyore.com/play/version'
+        url_version: str = f'{Config.BASE_URL}/play/version'
 
-        async with self.client_session.get(url=url_version) as response:
+        async with self.client_session.get(url=url_version, timeout=self.request_timeout) as response:
             response.raise_for_status()
 
             response_text = await response.text()
 
-            try:
-                current_version: int = int(response_text.strip())
-            
-            except ValueError:
-                log.error(f'invalid version "{response_text}"')
-            
-        return current_version
+        try:
+            return int(response_text.strip())
+
+        except ValueError:
+            raise ValueError(f'invalid version "{response_text.strip()[:32]}"')
 
-    async def process_tilesets(self) -> None:
+    async def process_tilesets(self, version: int | None = None) -> TilesetState:
+        # builds the next state without touching the current one,
+        # unchanged tilesets carry their processed image over
 
-        for tileset in Tileset:
-            await tileset.download(session=self.client_session)
-            tileset.retrieve_blanks()
-            await tileset.save()
+        current: TilesetState = self.tilesets
+        images: list[TilesetImage] = await asyncio.gather(*(
+            current.images[tileset].refresh(self.client_session, self.request_timeout) for tileset in Tileset
+        ))
+
+        return TilesetState(current.version if version is None else version, dict(zip(Tileset, images)))
 
     async def save_version(self) -> None:
         try:
@@ -374,48 +1413,122 @@ class Validator:
         except Exception as e:
             log.error('failed saving version file:', e)
 
+    def make_snapshot(self) -> Snapshot:
+        return Snapshot(
+            version=self.tilesets.version,
+            blank_tables={tileset.name: image.blank_table for tileset, image in self.tilesets.images.items()},
+            headers={tileset.name: image.headers() for tileset, image in self.tilesets.images.items()},
+            defs=self.cached_defs
+        )
+
+    async def save_snapshot(self) -> None:
+        try:
+            await asyncio.to_thread(write_snapshot, Config.SNAPSHOT_FILE, self.make_snapshot())
+
+        except Exception as e:
+            log.error('failed saving snapshot:', e)
+
+    async def load_snapshot(self) -> bool:
+        # returns True when the state was restored from the snapshot
+
+        snapshot_path = aiopath.AsyncPath(Config.SNAPSHOT_FILE)
+        if not Config.SNAPSHOT_FILE or not await snapshot_path.exists():
+            return False
+
+        # a defs file edited after the snapshot was written takes precedence
+        defs_path = aiopath.AsyncPath('defs')
+        if await defs_path.exists() and (await defs_path.stat()).st_mtime > (await snapshot_path.stat()).st_mtime:
+            log.info('defs file is newer than the snapshot')
+            return False
+
+        try:
+            snapshot: Snapshot = await asyncio.to_thread(read_snapshot, Config.SNAPSHOT_FILE)
+
+        except Exception as e:
+            log.warn('failed loading snapshot:', e)
+            return False
+
+        self.apply_snapshot(snapshot)
+        return True
+
+    def apply_snapshot(self, snapshot: Snapshot) -> None:
+
+        images: dict[Tileset, TilesetImage] = {
+            tileset: TilesetImage(
+                tileset,
+                snapshot.blank_tables[tileset.name],
+                content_hash=snapshot.headers[tileset.name].get('content_hash'),
+                etag=snapshot.headers[tileset.name].get('etag'),
+                last_modified=snapshot.headers[tileset.name].get('last_modified')
+            )
+            for tileset in Tileset if tileset.name in snapshot.blank_tables
+        }
+
+        self.tilesets = TilesetState(snapshot.version, images)
+        self.cached_defs = snapshot.defs
+
     async def load_cached(self) -> None:
+        # tileset images are not loaded, validation only needs the blank
+        # tables and the preview slices the debug images when it renders
+
+        with metrics.timer('jimbot_startup_load_seconds'):
+            if await self.load_snapshot():
+                log.info('restored state from snapshot')
+                return
+
+            await self.load_files()
+
+        if Config.SNAPSHOT_FILE:
+            await self.save_snapshot()
+
+    async def load_files(self) -> None:
 
         # TODO move this down once version dependent
         defs_path: str = 'defs'
         if await aiopath.AsyncPath(defs_path).exists():
-            async with aiofiles.open(defs_path, 'r') as defs_file:
-                defs_content: str = await defs_file.read()
-                self.cached_defs = json.loads(defs_content)
+            async with aiofiles.open(defs_path, 'rb') as defs_file:
+                self.cached_defs = json.loads(await defs_file.read())
         else:
             log.warn(f'file "{defs_path}" was not found')
 
         if not await aiopath.AsyncPath('version').exists():
             return
-        
-        for tileset in Tileset:
-
-            tileset_path: str = 'tilesets/' + tileset.file_name
-            if await aiopath.AsyncPath(tileset_path).exists():
 
-                async with aiofiles.open(tileset_path, 'rb') as tileset_file:
-                    image_data: bytes = await tileset_file.read()
-                
-                tileset.image_object = Image.open(io.BytesIO(image_data))
+        images: list[TilesetImage] = [await TilesetImage.load(tileset) for tileset in Tileset]
 
-            else:
-                log.warn('no tileset file for', tileset.name)
-                continue
-            
-            blanks_path: str = 'blanks/' + tileset.name
-            if not await aiopath.AsyncPath(blanks_path).exists():
-                log.warn('no blank tiles file for', tileset.name)
-                continue
-
-            async with aiofiles.open(blanks_path, 'r') as blanks_file:
-                tileset.blank_tiles = {
-                    int(n) for n in await blanks_file.readlines() if n
-                }
-        
         async with aiofiles.open('version', 'r') as version_file:
             version_content: str = await version_file.read()
-            self.cached_version = int(version_content)
+
+        self.tilesets = TilesetState(int(version_content), dict(zip(Tileset, images)))
         
+    async def load_caches(self) -> None:
+        await self.result_cache.load()
+        await self.changelogs.load()
+        await self.archive.load()
+        await self.level_history.load()
+
+    @contextlib.asynccontextmanager
+    async def open_session(self):
+
+        # one pool of kept-alive connections serves the website and the
+        # attachment downloads, reads time out instead of hanging forever
+        connector = aiohttp.TCPConnector(
+            limit=Config.HTTP_CONNECTIONS,
+            ttl_dns_cache=300,
+            keepalive_timeout=60,
+            enable_cleanup_closed=True
+        )
+
+        session_timeout = aiohttp.ClientTimeout(
+            total=None,
+            sock_connect=Config.REQUEST_TIMEOUT,
+            sock_read=Config.REQUEST_TIMEOUT
+        )
+
+        async with aiohttp.ClientSession(connector=connector, timeout=session_timeout) as session:
+            self.client_session = session
+            yield session
+
     async def update_task(self):
         try:
             await self.load_cached()
@@ -423,16 +1536,146 @@ class Validator:
         except Exception as e:
             log.error('failed loading cached files:', e)
 
-        async with aiohttp.ClientSession() as session:
-            self.client_session = session
+        await self.load_caches()
+
+        async with self.open_session():
+            while True:
+                try:
+                    self.poller.record_success(await self.refresh())
+
+                except Exception as e:
+                    self.poller.record_failure()
+                    log.error(f'failed checking for updates ({self.poller.failures} in a row):', e)
+
+                await asyncio.sleep(self.poller.next_delay())
+
+    async def refresh(self, force: bool = False) -> bool:
+        # returns True when a new version was released and processed,
+        # a refresh requested while another runs waits for that one,
+        # other processes forward it to the owner
+
+        if not self.owner:
+            if self.refresh_channel is None:
+                raise RuntimeError('refreshes run in the owner process')
+
+        elif self.client_session is None:
+            raise RuntimeError('no client session yet')
+
+        if (request := self.refresh_request) is None:
+            request = asyncio.create_task(self.check_update(force) if self.owner else self.forward_refresh(force))
+            request.add_done_callback(lambda _: setattr(self, 'refresh_request', None))
+            self.refresh_request = request
+
+        return await asyncio.shield(request)
+
+    async def check_update(self, force: bool = False) -> bool:
+        # returns True when a new version was released and processed,
+        # force checks the tilesets even when the version is unchanged
+
+        latest_version: int = await self.fetch_version()
+        released: bool = latest_version > self.cached_version
+
+        if not released and not force:
+            return False
+
+        if released:
+            log.info('new version released')
+
+            # prefetch the changelog while the tilesets are processed,
+            # the request is tracked in changelog_requests until done
+            asyncio.create_task(self.fetch_changelog(latest_version, refresh=True))
+
+        with metrics.timer('jimbot_tileset_refresh_seconds'):
+            tilesets: TilesetState = await self.process_tilesets(max(latest_version, self.cached_version))
+
+        if not released and tilesets.fingerprint == self.tilesets.fingerprint:
+            return False
+
+        # version and blank tables change together in one step,
+        # validations that already started keep the previous state
+        self.tilesets = tilesets
+
+        await self.save_version()
+        await self.save_snapshot()
+        await self.result_cache.clear()
+
+        return released
+
+    async def forward_refresh(self, force: bool) -> bool:
+        # the owner writes a new snapshot before it answers,
+        # it is applied right away instead of at the next poll
+
+        released, error = await asyncio.to_thread(self.refresh_channel.ask, force, Config.REFRESH_TIMEOUT)
+        if error is not None:
+            raise RuntimeError(error)
+
+        await self.follow_snapshot()
+        return released
+
+    async def serve_refreshes(self):
+        # runs next to update_task in the owner, refreshes asked for
+        # by the other processes are coalesced with its own
+
+        while True:
+            if (request := await asyncio.to_thread(self.refresh_channel.next_request)) is None:
+                continue
+
+            index, request_id, force = request
+
+            try:
+                released, error = await self.refresh(force), None
+
+            except Exception as e:
+                released, error = False, str(e)
+
+            self.refresh_channel.answer(index, request_id, released, error)
+
+    def read_signature(self) -> tuple | None:
+        # snapshots are replaced by a rename, a new inode or
+        # modification time means the owner published a new one
+
+        try:
+            stat: os.stat_result = os.stat(Config.SNAPSHOT_FILE)
+            return stat.st_ino, stat.st_mtime_ns, stat.st_size
+
+        except FileNotFoundError:
+            return None
+
+    async def follow_snapshot(self) -> bool:
+        # returns True when a newer snapshot was applied
+
+        if (signature := self.read_signature()) is None or signature == self.snapshot_signature:
+            return False
+
+        snapshot: Snapshot = await asyncio.to_thread(read_snapshot, Config.SNAPSHOT_FILE)
+        self.snapshot_signature = signature
+
+        if snapshot.version < self.cached_version:
+            return False
+
+        previous: str = self.tilesets.fingerprint
+        self.apply_snapshot(snapshot)
+
+        # results are keyed by the tileset fingerprint, clearing only frees them
+        if self.tilesets.fingerprint != previous:
+            log.info(f'following snapshot of v{snapshot.version}')
+            await self.result_cache.clear()
+
+        return True
+
+    async def follow_task(self):
+        # runs instead of update_task in processes that do not own the
+        # refresh, the state is read from the snapshot the owner writes
+
+        self.owner = False
+        await self.load_caches()
 
+        async with self.open_session():
             while True:
-                latest_version: int = await self.fetch_version()
+                try:
+                    await self.follow_snapshot()
 
-                if latest_version > self.cached_version:
-                    self.cached_version = latest_version
-                    log.info('new version released')
-                    await self.process_tilesets()
-                    await self.save_version()
+                except Exception as e:
+                    log.warn('failed following snapshot:', e)
 
-                await asyncio.sleep(self.update_interval)
+                await asyncio.sleep(Config.SNAPSHOT_POLL_INTERVAL)